@@ -0,0 +1 @@
+# Silnik crawlera Audytorka - używany przez aplikację Streamlit (crawler.py) i CLI (python -m audytorek)
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from .storage import data_path
+
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+# Co ile zapisów sprawdzamy limity rozmiaru i wieku
+EVICT_EVERY = 100
+
+
+class AICache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS ai_cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ai_cache_accessed ON ai_cache (accessed_at)')
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model, prompt_version, payload):
+        # Klucz obejmuje model, wersję szablonu promptu i pełną treść wejściową
+        raw = json.dumps([model, prompt_version, payload], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value, created_at FROM ai_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self.conn.execute('UPDATE ai_cache SET accessed_at = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO ai_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value.encode('utf-8')), now, now)
+            )
+            self.writes += 1
+            if self.writes % EVICT_EVERY == 0:
+                self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        self.conn.execute('DELETE FROM ai_cache WHERE created_at < ?', (now - self.max_age,))
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM ai_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Usuwamy najdawniej używane wpisy, aż cache zmieści się w limicie
+        to_free = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in self.conn.execute('SELECT key, size FROM ai_cache ORDER BY accessed_at'):
+            if freed >= to_free:
+                break
+            stale_keys.append((key,))
+            freed += size
+        self.conn.executemany('DELETE FROM ai_cache WHERE key = ?', stale_keys)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM ai_cache')
+            self.conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_cache').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ai_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AICache(data_path('ai_cache.sqlite'))
+        return _cache
@@ -0,0 +1,260 @@
+import asyncio
+import heapq
+import queue
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+
+import aiohttp
+
+from .fetching import BodyReader, check_page_headers
+from .metrics import METRICS_KEY, add_stage, new_page_metrics
+from .page_cache import get_page_cache
+from .scheduler import RETRYABLE_STATUSES, RetryableFetchError, parse_retry_after
+
+
+# Domyślne limity trybu asyncio - setki zapytań w locie, ale z ograniczeniem na jeden host
+DEFAULT_CONCURRENCY = 200
+DEFAULT_PER_HOST_LIMIT = 8
+DEFAULT_TIMEOUT = 10
+# Co ile sekund czekające workery i wątek podający adresy sprawdzają, czy crawl nie został przerwany
+POLL_INTERVAL = 0.5
+
+_DONE = object()
+
+
+def _build_trace_config():
+    # Czasy DNS i nawiązania połączenia z sygnałów aiohttp - słownik pomiarów strony
+    # przekazujemy do zapytania jako trace_request_ctx
+    async def on_dns_start(session, ctx, params):
+        ctx.dns_started = time.perf_counter()
+
+    async def on_dns_end(session, ctx, params):
+        ctx.dns = time.perf_counter() - ctx.dns_started
+        add_stage(ctx.trace_request_ctx, 'dns', ctx.dns)
+
+    async def on_connect_start(session, ctx, params):
+        ctx.dns = 0.0
+        ctx.connect_started = time.perf_counter()
+
+    async def on_connect_end(session, ctx, params):
+        # Tworzenie połączenia w aiohttp obejmuje rozwiązywanie nazwy, więc odejmujemy czas DNS
+        add_stage(ctx.trace_request_ctx, 'connect', time.perf_counter() - ctx.connect_started - ctx.dns)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_end)
+    trace_config.on_connection_create_start.append(on_connect_start)
+    trace_config.on_connection_create_end.append(on_connect_end)
+    return trace_config
+
+
+async def _timed_get(session, url, headers, metrics, head_only, skip_statuses=()):
+    # Zwraca (status, nagłówki, treść, czy treść kompletna) - treść czytana strumieniowo jak w download_url;
+    # przy statusach ze skip_statuses (np. do ponowienia) treści w ogóle nie czytamy
+    started = time.perf_counter()
+    async with session.get(url, headers=headers, trace_request_ctx=metrics) as response:
+        headers_at = time.perf_counter()
+        reader = BodyReader(head_only)
+        if response.status not in skip_statuses:
+            check_page_headers(response.headers)
+            async for chunk in response.content.iter_chunked(reader.chunk_size):
+                if reader.feed(chunk):
+                    break
+        content = reader.content
+        # Czas do pierwszego bajtu liczymy bez DNS i połączenia, które mierzą sygnały aiohttp
+        setup = metrics.get('dns', 0.0) + metrics.get('connect', 0.0)
+        add_stage(metrics, 'ttfb', headers_at - started - setup)
+        add_stage(metrics, 'download', time.perf_counter() - headers_at)
+        metrics.update(status=response.status, bytes=len(content), redirects=len(response.history))
+        return response.status, response.headers, content, reader.complete
+
+
+async def _download(session, url, scheduler, page_store, metrics, head_only):
+    loop = asyncio.get_running_loop()
+    headers = None
+    if page_store:
+        headers = await loop.run_in_executor(None, page_store.conditional_headers, url)
+
+    if scheduler is None:
+        status, response_headers, content, complete = await _timed_get(session, url, headers, metrics, head_only)
+    else:
+        status, response_headers, content, complete = await _scheduled_download(
+            session, url, scheduler, headers, metrics, head_only
+        )
+
+    if page_store:
+        # Zapis do magazynu (kompresja, SQLite) nie powinien blokować pętli zdarzeń
+        content = await loop.run_in_executor(
+            None, page_store.resolve_body, url, status, response_headers, content, complete
+        )
+    get_page_cache().remember(url, status, content, complete)
+    return content
+
+
+async def _scheduled_download(session, url, scheduler, headers, metrics, head_only):
+    waiting_since = time.perf_counter()
+    await scheduler.acquire_async(url)
+    add_stage(metrics, 'wait', time.perf_counter() - waiting_since)
+    started = time.monotonic()
+    status = None
+    retry_after = None
+    timed_out = False
+    try:
+        status, response_headers, content, complete = await _timed_get(
+            session, url, headers, metrics, head_only, RETRYABLE_STATUSES
+        )
+        retry_after = parse_retry_after(response_headers.get('Retry-After'))
+        if status in RETRYABLE_STATUSES:
+            raise RetryableFetchError(f'HTTP {status}', retry_after)
+        return status, response_headers, content, complete
+    except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+        timed_out = True
+        raise RetryableFetchError(str(e) or type(e).__name__) from e
+    finally:
+        scheduler.release(url, time.monotonic() - started, status=status,
+                          retry_after=retry_after, timed_out=timed_out)
+
+
+async def _fetch_and_process(session, url, process_page, scheduler, page_store, head_only):
+    loop = asyncio.get_running_loop()
+    metrics = new_page_metrics()
+    try:
+        content = await _download(session, url, scheduler, page_store, metrics, head_only)
+        # Parsowanie (i ewentualne wywołania AI) są blokujące, więc trafiają do puli wątków pętli
+        result = await loop.run_in_executor(None, partial(process_page, url, content, metrics=metrics))
+    except RetryableFetchError:
+        raise
+    except Exception as e:
+        result = {'URL': url, 'Error': str(e) or type(e).__name__}
+    result[METRICS_KEY] = metrics
+    return result
+
+
+async def _crawl(urls, process_page, put_result, stop_event, concurrency, per_host_limit, timeout,
+                 scheduler, page_store, head_only):
+    loop = asyncio.get_running_loop()
+    # Iterator adresów może blokować (sitemapy pobierane w tle, odczyt checkpointu, kolejka crawla na dysku),
+    # więc czyta go osobny wątek - pętla zdarzeń dostaje gotowe adresy przez ograniczoną kolejkę
+    url_queue = asyncio.Queue(maxsize=concurrency)
+    feed_errors = []
+    state = {'exhausted': False}
+    # Kopiec (czas gotowości, URL) z zapytaniami odłożonymi do ponowienia
+    retry_heap = []
+    attempts = {}
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host_limit, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    def queue_url(item):
+        future = asyncio.run_coroutine_threadsafe(url_queue.put(item), loop)
+        while not stop_event.is_set():
+            try:
+                future.result(timeout=POLL_INTERVAL)
+                return True
+            except FutureTimeoutError:
+                continue
+        future.cancel()
+        return False
+
+    def feed_urls():
+        try:
+            for url in urls:
+                if not queue_url(url):
+                    return
+        except Exception as e:
+            feed_errors.append(e)
+        queue_url(_DONE)
+
+    async def next_url():
+        if retry_heap and retry_heap[0][0] <= time.monotonic():
+            return heapq.heappop(retry_heap)[1]
+        wait = POLL_INTERVAL
+        if retry_heap:
+            wait = min(max(retry_heap[0][0] - time.monotonic(), 0.01), wait)
+        if state['exhausted']:
+            await asyncio.sleep(wait)
+            return None
+        try:
+            url = await asyncio.wait_for(url_queue.get(), wait)
+        except asyncio.TimeoutError:
+            return None
+        if url is _DONE:
+            # Znacznik końca zostaje w kolejce dla pozostałych workerów
+            state['exhausted'] = True
+            url_queue.put_nowait(_DONE)
+            if feed_errors:
+                # Błąd odczytu adresów (np. sitemapy) przerywa crawl - zgłasza go tylko pierwszy worker
+                raise feed_errors.pop()
+            return None
+        return url
+
+    threading.Thread(target=feed_urls, name='audytorek-async-urls', daemon=True).start()
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                     trace_configs=[_build_trace_config()]) as session:
+        async def worker():
+            # Każdy worker pobiera kolejny URL dopiero po oddaniu wyniku, więc w pamięci
+            # jest co najwyżej `concurrency` stron naraz, niezależnie od długości listy
+            while not stop_event.is_set():
+                url = await next_url()
+                if url is None:
+                    if state['exhausted'] and not retry_heap:
+                        return
+                    continue
+
+                try:
+                    result = await _fetch_and_process(session, url, process_page, scheduler, page_store, head_only)
+                except RetryableFetchError as e:
+                    attempt = attempts.get(url, 0) + 1
+                    attempts[url] = attempt
+                    if attempt <= scheduler.max_retries:
+                        ready_at = time.monotonic() + scheduler.retry_delay(attempt, e.retry_after)
+                        heapq.heappush(retry_heap, (ready_at, url))
+                        continue
+                    result = {'URL': url, 'Error': str(e)}
+                result.setdefault(METRICS_KEY, new_page_metrics())['retries'] = attempts.pop(url, 0)
+                await loop.run_in_executor(None, put_result, result)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def iter_crawl_async(urls, process_page, concurrency=DEFAULT_CONCURRENCY,
+                     per_host_limit=DEFAULT_PER_HOST_LIMIT, timeout=DEFAULT_TIMEOUT, scheduler=None,
+                     page_store=None, head_only=False):
+    # Pętla asyncio działa w osobnym wątku, a wyniki spływają przez ograniczoną kolejkę,
+    # dzięki czemu wątek skryptu Streamlit może na bieżąco aktualizować pasek postępu
+    results = queue.Queue(maxsize=concurrency)
+    stop_event = threading.Event()
+    errors = []
+
+    def put_result(item):
+        while not stop_event.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def run():
+        try:
+            asyncio.run(_crawl(urls, process_page, put_result, stop_event, concurrency,
+                               per_host_limit, timeout, scheduler, page_store, head_only))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put_result(_DONE)
+
+    thread = threading.Thread(target=run, name='audytorek-async-crawl', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        stop_event.set()
+        thread.join()
+
+    if errors:
+        raise errors[0]
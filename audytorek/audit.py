@@ -0,0 +1,883 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+import heapq
+import json
+import re
+import time
+
+from pydantic import BaseModel, Field, ValidationError
+
+from .ai_cache import get_ai_cache
+from .async_engine import DEFAULT_PER_HOST_LIMIT, iter_crawl_async
+from .checkpoints import PAYLOAD_KEY, RUN_COMPLETED, get_checkpoint_store, iter_checkpointed
+from .config import get_secret
+from .dedupe import DUPLICATE_COLUMN, NearDuplicateIndex
+from .export import ResultExporter, export_results
+from .fetching import DEFAULT_POOL_SIZE, get_session, http_get, read_body, scheduled_get
+from .frontier import iter_link_crawl
+from .jobs import CrawlJob
+from .link_check import LINK_CHECK_COLUMNS, LINK_CHECK_ELEMENT, LINK_REPORT_COLUMNS, LinkChecker
+from .link_graph import LINK_GRAPH_COLUMNS, LINK_GRAPH_ELEMENT, LinkGraph
+from .llm import (
+    DEFAULT_LLM_PARALLELISM, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE,
+    LLMRateLimiter, acquire_llm_quota, estimate_tokens, get_openai, run_llm_tasks
+)
+from .metrics import METRICS_KEY, StageTimer, add_stage, new_page_metrics
+from .page_cache import get_page_cache
+from .page_store import get_page_store
+from .parsing import CANONICAL_KEY, FINGERPRINT_KEY, HEADINGS_PAYLOAD_FIELDS, LINKS_KEY, build_page_result
+from .pipeline import iter_crawl_pipelined
+from .scheduler import PoliteScheduler, RetryableFetchError
+from .sitemap import iter_sitemap_urls
+from .structured_data import (
+    RECOMMENDATIONS_COLUMN, STRUCTURED_DATA_COLUMNS, STRUCTURED_DATA_ELEMENT, failure_signature
+)
+
+
+# Tryby crawlowania (etykiety używane także w zakładce Audyt SEO)
+CRAWL_MODE_THREADS = 'Wątki'
+CRAWL_MODE_ASYNC = 'Asyncio'
+CRAWL_MODE_PIPELINE = 'Potok (pobieranie w wątkach, parsowanie w procesach)'
+
+# Tryby optymalizacji nagłówków
+HEADINGS_MODE_LIVE = 'Na żywo'
+HEADINGS_MODE_BATCH_API = 'OpenAI Batch API (offline)'
+
+# Elementy strony, które można pobrać w audycie
+AUDIT_ELEMENTS = [
+    'H1', 'Wszystkie nagłówki', 'Meta title', 'Meta description', 'Canonical', DUPLICATE_COLUMN, LINK_GRAPH_ELEMENT,
+    LINK_CHECK_ELEMENT, STRUCTURED_DATA_ELEMENT
+]
+# Elementy wybrane domyślnie - pozostałe trzeba włączyć świadomie: sprawdzanie linków wysyła zapytania do
+# serwisów zewnętrznych, a grupowanie duplikatów kopiuje wyniki AI między stronami o zbliżonej treści
+DEFAULT_AUDIT_ELEMENTS = ['H1', 'Wszystkie nagłówki', 'Meta title', 'Meta description', 'Canonical']
+# Elementy z sekcji head - gdy audyt obejmuje tylko je, pobieranie strony kończy się po </head>
+HEAD_ELEMENTS = {'Meta title', 'Meta description', 'Canonical'}
+
+
+class MetaTags(BaseModel):
+    title: str = Field(..., max_length=60)
+    description: str = Field(..., max_length=160)
+
+
+def cached_chat_completion(prompt_version, model, messages, **kwargs):
+    # Odpowiedzi modelu trafiają do trwałego cache - identyczny prompt (ten sam model, wersja
+    # szablonu i treść wejściowa) nie jest wysyłany ponownie przy kolejnym audycie
+    cache = get_ai_cache()
+    key = cache.make_key(model, prompt_version, {'messages': messages, **kwargs})
+    content = cache.get(key)
+    if content is None:
+        acquire_llm_quota(estimate_tokens(sum(len(message['content']) for message in messages)))
+        completion = get_openai().chat.completions.create(model=model, messages=messages, **kwargs)
+        content = completion.choices[0].message.content
+        if content is not None:
+            cache.set(key, content)
+    return content
+
+
+def generate_meta_tags(content, context):
+    try:
+        # Tworzenie promptu
+        prompt = f"Treść: {content}\n"
+        if context:
+            prompt += f"Kontekst: {context}\n"
+        prompt += "\nWygeneruj meta title (maksymalnie 60 znaków) i meta description (maksymalnie 160 znaków) w formacie JSON. Użyj kluczy 'title' i 'description'."
+
+        response_content = cached_chat_completion(
+            'meta_tags/1',
+            model="gpt-4o-mini",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Jesteś ekspertem SEO. Twoim zadaniem jest generowanie zoptymalizowanych meta tagów na podstawie podanej treści i kontekstu.",
+                },
+                {"role": "user", "content": prompt},
+            ],
+            response_format={"type": "json_object"},
+        )
+
+        # Próba parsowania jako MetaTags
+        try:
+            meta_tags = MetaTags.model_validate_json(response_content)
+            return meta_tags.title, meta_tags.description
+        except ValidationError:
+            # Jeśli nie udało się sparsować jako MetaTags, próbujemy elastycznego podejścia
+            data = json.loads(response_content)
+
+            title = data.get("title") or data.get("meta_title") or ""
+            description = data.get("description") or data.get("meta_description") or ""
+
+            # Upewniamy się, że długość jest odpowiednia
+            title = title[:60]
+            description = description[:160]
+
+            return title, description
+
+    except Exception as e:
+        return (
+            f"Błąd generowania meta tagów: {str(e)}",
+            f"Błąd generowania meta tagów: {str(e)}",
+        )
+
+
+
+def download_url(url, scheduler=None, page_store=None, metrics=None, head_only=False):
+    # Z magazynem stron wysyłamy zapytanie warunkowe (If-None-Match/If-Modified-Since),
+    # a przy 304 używamy zapisanej treści zamiast pobierać stronę ponownie
+    headers = page_store.conditional_headers(url) if page_store else None
+    started = time.perf_counter()
+    # Treść czytamy strumieniowo: typ i rozmiar sprawdzamy przed pobraniem, a przy samych
+    # elementach z sekcji head kończymy czytanie krótko po </head>
+    if scheduler:
+        response = scheduled_get(url, scheduler, headers=headers, metrics=metrics, stream=True)
+    else:
+        response = http_get(url, headers=headers, stream=True)
+    headers_at = time.perf_counter()
+    try:
+        content, complete = read_body(response, head_only, retryable=scheduler is not None)
+    finally:
+        response.close()
+    if metrics is not None:
+        # requests nie rozbija czasu na DNS i połączenie - wchodzą w czas do odebrania nagłówków
+        add_stage(metrics, 'ttfb', headers_at - started - metrics.get('wait', 0.0))
+        add_stage(metrics, 'download', time.perf_counter() - headers_at)
+        metrics.update(status=response.status_code, bytes=len(content), redirects=len(response.history))
+    if page_store:
+        content = page_store.resolve_body(url, response.status_code, response.headers, content, complete)
+    get_page_cache().remember(url, response.status_code, content, complete)
+    return content
+
+
+def is_head_only(elements, generate_new_meta, optimize_headings, collect_links=False):
+    # Audyt samych elementów z sekcji head nie potrzebuje reszty strony (meta tagi AI i nagłówki potrzebują treści)
+    return set(elements) <= HEAD_ELEMENTS and not (generate_new_meta or optimize_headings or collect_links)
+
+
+def fetch_url(url, elements, generate_new_meta, context, optimize_headings, scheduler=None, page_store=None,
+              collect_links=False, duplicates=None):
+    metrics = new_page_metrics()
+    try:
+        head_only = is_head_only(elements, generate_new_meta, optimize_headings, collect_links)
+        content = download_url(url, scheduler, page_store, metrics, head_only)
+        result = extract_page_data(url, content, elements, generate_new_meta, context, optimize_headings, page_store,
+                                   collect_links, metrics, duplicates)
+    except RetryableFetchError:
+        # Błędy przejściowe (429/503/timeout) obsługuje pętla crawlera, odkładając URL do ponowienia
+        raise
+    except Exception as e:
+        result = {'URL': url, 'Error': str(e)}
+    result[METRICS_KEY] = metrics
+    return result
+
+
+def crawl_with_threads(urls, fetch_options, max_workers, scheduler=None, page_store=None):
+    # Pula połączeń musi pomieścić wszystkie wątki, inaczej nadmiarowe połączenia nie będą ponownie używane
+    get_session(pool_size=max_workers)
+    retry_heap = []  # (czas gotowości, URL) dla zapytań odłożonych do ponowienia
+    attempts = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        submit = partial(executor.submit, fetch_url, scheduler=scheduler, page_store=page_store, **fetch_options)
+        # URL-e pobieramy z iteratora stopniowo, więc lista (lub sitemapa) nie musi być w całości w pamięci
+        url_iter = iter(urls)
+        max_pending = max_workers * 2
+        pending = {}
+        while True:
+            now = time.monotonic()
+            while retry_heap and retry_heap[0][0] <= now:
+                _, url = heapq.heappop(retry_heap)
+                pending[submit(url)] = url
+            while len(pending) < max_pending:
+                url = next(url_iter, None)
+                if url is None:
+                    break
+                pending[submit(url)] = url
+            if not pending and not retry_heap:
+                break
+
+            timeout = retry_heap[0][0] - now if retry_heap else None
+            if not pending:
+                time.sleep(timeout)
+                continue
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    result = future.result()
+                except RetryableFetchError as e:
+                    attempt = attempts.get(url, 0) + 1
+                    attempts[url] = attempt
+                    if attempt <= scheduler.max_retries:
+                        heapq.heappush(retry_heap, (time.monotonic() + scheduler.retry_delay(attempt, e.retry_after), url))
+                        continue
+                    result = {'URL': url, 'Error': str(e)}
+                result.setdefault(METRICS_KEY, new_page_metrics())['retries'] = attempts.pop(url, 0)
+                yield result
+
+
+def create_scheduler(crawl_settings):
+    # Adaptacyjne tempo na host; limit współbieżności hosta jak w wybranym silniku crawlowania
+    if not crawl_settings['polite_crawl']:
+        return None
+    if crawl_settings['crawl_mode'] == CRAWL_MODE_ASYNC:
+        return PoliteScheduler(max_concurrency=crawl_settings['per_host_limit'])
+    return PoliteScheduler(max_concurrency=crawl_settings['max_workers'])
+
+
+def iter_crawl_results(urls, fetch_options, crawl_settings):
+    # Wybór silnika crawlowania - każdy zwraca wiersze wyników w kolejności ich ukończenia.
+    # Harmonogram z crawl_settings['scheduler'] jest współdzielony z innymi etapami audytu.
+    crawl_mode = crawl_settings['crawl_mode']
+    max_workers = crawl_settings['max_workers']
+    per_host_limit = crawl_settings['per_host_limit']
+
+    page_store = get_page_store() if crawl_settings.get('page_store') else None
+    if 'scheduler' in crawl_settings:
+        scheduler = crawl_settings['scheduler']
+    else:
+        scheduler = create_scheduler(crawl_settings)
+
+    head_only = is_head_only(fetch_options['elements'], fetch_options['generate_new_meta'],
+                             fetch_options['optimize_headings'], fetch_options.get('collect_links', False))
+    if crawl_mode == CRAWL_MODE_ASYNC:
+        return iter_crawl_async(
+            urls,
+            partial(extract_page_data, page_store=page_store, **fetch_options),
+            concurrency=max_workers,
+            per_host_limit=per_host_limit,
+            scheduler=scheduler,
+            page_store=page_store,
+            head_only=head_only
+        )
+    if crawl_mode == CRAWL_MODE_PIPELINE:
+        get_session(pool_size=max_workers)
+        parse_options = {
+            'elements': fetch_options['elements'],
+            'optimize_headings': fetch_options['optimize_headings'],
+            'collect_links': fetch_options.get('collect_links', False),
+        }
+        return iter_crawl_pipelined(
+            urls,
+            partial(download_url, scheduler=scheduler, page_store=page_store, head_only=head_only),
+            partial(build_page_result, **parse_options),
+            finalize=partial(add_generated_meta, elements=fetch_options['elements'],
+                             generate_new_meta=fetch_options['generate_new_meta'],
+                             context=fetch_options['context'],
+                             duplicates=fetch_options.get('duplicates')),
+            io_workers=max_workers,
+            parse_workers=crawl_settings.get('parse_workers'),
+            queue_size=crawl_settings.get('queue_size'),
+            scheduler=scheduler,
+            # Wyniki parsowania niezmienionych stron bierzemy z magazynu stron, jak w pozostałych trybach
+            load_parsed=partial(page_store.load_extraction, **parse_options) if page_store else None,
+            save_parsed=partial(page_store.save_extraction, **parse_options) if page_store else None
+        )
+    return crawl_with_threads(urls, fetch_options, max_workers, scheduler, page_store)
+
+
+def extract_page_data(url, html, elements, generate_new_meta, context, optimize_headings, page_store=None,
+                      collect_links=False, metrics=None, duplicates=None):
+    # Wspólna część wszystkich trybów crawlowania - z pobranej treści strony budujemy wiersz wyniku
+    with StageTimer(metrics, 'parse'):
+        if page_store:
+            parsed_page = page_store.parse(url, html, elements, optimize_headings, collect_links)
+        else:
+            parsed_page = build_page_result(url, html, elements, optimize_headings, collect_links)
+    return add_generated_meta(parsed_page, elements, generate_new_meta, context, metrics, duplicates)
+
+
+def add_generated_meta(parsed_page, elements, generate_new_meta, context, metrics=None, duplicates=None):
+    # Etap AI wykonywany już po parsowaniu - w trybie potokowym poza procesami parsującymi
+    result, meta_content = parsed_page
+
+    # Przypisanie do grupy zbliżonych duplikatów - odcisk treści nie jest potrzebny dalej w wierszu
+    fingerprint = result.pop(FINGERPRINT_KEY, None)
+    leader = duplicates.assign(result['URL'], fingerprint) if duplicates else None
+    if leader:
+        result[DUPLICATE_COLUMN] = leader
+
+    # Generowanie nowych meta tagów
+    if generate_new_meta and get_secret('openai_api_key') and ('Meta title' in elements or 'Meta description' in elements):
+        with StageTimer(metrics, 'ai'):
+            if duplicates:
+                # Jedno wywołanie modelu na grupę duplikatów - pozostałe strony dostają ten sam wynik
+                new_meta_title, new_meta_description = duplicates.shared(
+                    leader or result['URL'], 'meta', partial(generate_meta_tags, meta_content, context)
+                )
+            else:
+                new_meta_title, new_meta_description = generate_meta_tags(meta_content, context)
+        result['Nowy Meta title'] = new_meta_title
+        result['Nowy Meta description'] = new_meta_description
+
+    return result
+
+
+    
+HEADINGS_SYSTEM_PROMPT = "Jesteś ekspertem SEO i copywriterem specjalizującym się w optymalizacji struktury nagłówków."
+OPTIMIZED_HEADINGS_COLUMN = 'Zoptymalizowana struktura nagłówków'
+
+
+def build_headings_prompt(content, existing_headings):
+    return f"""Jesteś ekspertem SEO i copywriterem. Twoim zadaniem jest przeanalizowanie poniższej treści strony oraz istniejącej struktury nagłówków, a następnie zaproponowanie zoptymalizowanej struktury nagłówków (H1-H6), która poprawi SEO i rozszerzy pokrycie semantyczne tematu.
+
+**UWAGA:** Zwróć **tylko** listę nagłówków w podanym formacie. **Nie dodawaj żadnych dodatkowych tekstów, wyjaśnień ani komentarzy** poza listą nagłówków.
+
+Treść strony:
+{content}
+
+Istniejąca struktura nagłówków:
+{json.dumps(existing_headings, ensure_ascii=False, indent=2)}
+
+Na podstawie powyższej treści i istniejących nagłówków, zaproponuj zoptymalizowaną wersję tych nagłówków, uwzględniając najlepsze praktyki SEO. Nie dodawaj nowych nagłówków. **Zwróć tylko listę nagłówków w formacie:**
+
+[
+    {{"level": "H1", "text": "Twój tytuł H1"}},
+    {{"level": "H2", "text": "Nagłówek H2"}},
+    {{"level": "H3", "text": "Nagłówek H3"}},
+    ...
+]
+
+**Nie dodawaj żadnych dodatkowych komentarzy ani tekstu.**
+
+Twoja propozycja:
+"""
+
+
+def format_headings(headings_list):
+    formatted_headings = ''
+    for heading in headings_list:
+        level = heading.get('level', '')
+        text = heading.get('text', '')
+        formatted_headings += f"{level}: {text}\n"
+    return formatted_headings.strip()
+
+
+def parse_optimized_headings(ai_response):
+    # Próba parsowania odpowiedzi AI jako JSON
+    try:
+        return format_headings(json.loads(ai_response))
+    except json.JSONDecodeError:
+        # Jeśli parsowanie się nie powiedzie, spróbuj wyciągnąć nagłówki za pomocą wyrażeń regularnych
+        pattern = r'{"level":\s*"(?P<level>H[1-6])",\s*"text":\s*"(?P<text>.*?)"}'
+        matches = re.findall(pattern, ai_response)
+        if matches:
+            formatted_headings = ''
+            for level, text in matches:
+                formatted_headings += f"{level}: {text}\n"
+            return formatted_headings.strip()
+        else:
+            return "Błąd: Nie udało się wyciągnąć nagłówków z odpowiedzi AI."
+
+
+def generate_optimized_headings(content, existing_headings):
+    prompt = build_headings_prompt(content, existing_headings)
+    try:
+        response = cached_chat_completion(
+            'optimized_headings/1',
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": HEADINGS_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+        )
+        ai_response = response.strip()
+        return parse_optimized_headings(ai_response)
+    except Exception as e:
+        return f"Błąd podczas generowania zoptymalizowanej struktury nagłówków: {str(e)}"
+
+
+def generate_optimized_headings_batch(pages):
+    # Kilka stron w jednym zapytaniu; model zwraca JSON z nagłówkami przypisanymi do identyfikatora strony
+    if len(pages) == 1:
+        return [generate_optimized_headings(pages[0]['content_for_optimization'], pages[0]['existing_headings'])]
+
+    pages_json = json.dumps([
+        {'id': str(idx), 'content': page['content_for_optimization'], 'existing_headings': page['existing_headings']}
+        for idx, page in enumerate(pages)
+    ], ensure_ascii=False)
+    prompt = f"""Jesteś ekspertem SEO i copywriterem. Dla każdej z poniższych stron przeanalizuj treść oraz istniejącą strukturę nagłówków i zaproponuj zoptymalizowaną wersję tych nagłówków (H1-H6), która poprawi SEO i rozszerzy pokrycie semantyczne tematu. Nie dodawaj nowych nagłówków.
+
+Strony (JSON):
+{pages_json}
+
+Zwróć wyłącznie obiekt JSON w formacie:
+{{"pages": [{{"id": "0", "headings": [{{"level": "H1", "text": "Twój tytuł H1"}}, {{"level": "H2", "text": "Nagłówek H2"}}]}}]}}
+Obiekt musi zawierać wpis dla każdego identyfikatora strony."""
+
+    try:
+        response = cached_chat_completion(
+            'optimized_headings_batch/1',
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": HEADINGS_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+        )
+        data = json.loads(response)
+        headings_by_id = {str(item.get('id')): item.get('headings', []) for item in data.get('pages', [])}
+    except Exception as e:
+        return [f"Błąd podczas generowania zoptymalizowanej struktury nagłówków: {str(e)}"] * len(pages)
+
+    outputs = []
+    for idx, page in enumerate(pages):
+        if str(idx) in headings_by_id:
+            outputs.append(format_headings(headings_by_id[str(idx)]))
+        else:
+            # Model pominął stronę - dopytujemy o nią osobno
+            outputs.append(generate_optimized_headings(page['content_for_optimization'], page['existing_headings']))
+    return outputs
+
+
+def has_headings_payload(result):
+    return PAYLOAD_KEY in result or all(field in result for field in HEADINGS_PAYLOAD_FIELDS)
+
+
+def load_headings_payload(result, load_payload=None):
+    # Treść i nagłówki strony - z wiersza albo, gdy zostały przeniesione na dysk, z checkpointu
+    if PAYLOAD_KEY in result:
+        return load_payload(result['URL']) if load_payload else None
+    return {field: result[field] for field in HEADINGS_PAYLOAD_FIELDS}
+
+
+def drop_headings_payload(result):
+    for field in HEADINGS_PAYLOAD_FIELDS + (PAYLOAD_KEY,):
+        result.pop(field, None)
+
+
+def split_duplicates(pages):
+    # Strony wiodące (do wysłania do modelu) i zbliżone duplikaty, których strona wiodąca jest wśród `pages`
+    leaders = {page['URL'] for page in pages if not page.get(DUPLICATE_COLUMN)}
+    duplicates = [page for page in pages if page.get(DUPLICATE_COLUMN) in leaders]
+    unique = [page for page in pages if page.get(DUPLICATE_COLUMN) not in leaders]
+    return unique, duplicates
+
+
+def copy_from_leaders(results, column):
+    # Zbliżone duplikaty dostają wynik AI swojej strony wiodącej
+    by_url = {result['URL']: result for result in results if not result.get(DUPLICATE_COLUMN)}
+    for result in results:
+        leader = by_url.get(result.get(DUPLICATE_COLUMN))
+        if leader is not None and column in leader:
+            result[column] = leader[column]
+
+
+def optimize_headings_for_results(results, parallelism=DEFAULT_LLM_PARALLELISM, pages_per_request=1,
+                                  limiter=None, on_progress=None, load_payload=None):
+    pages = []
+    for result in results:
+        if has_headings_payload(result):
+            pages.append(result)
+        else:
+            result[OPTIMIZED_HEADINGS_COLUMN] = 'Brak danych do optymalizacji'
+    # Zbliżonych duplikatów nie wysyłamy do modelu - dostaną wynik strony wiodącej
+    pages, duplicates = split_duplicates(pages)
+    for page in duplicates:
+        drop_headings_payload(page)
+
+    chunks = [pages[i:i + pages_per_request] for i in range(0, len(pages), pages_per_request)]
+    tasks = list(enumerate(chunks))
+
+    def optimize_chunk(chunk):
+        # Treść stron wczytujemy dopiero tuż przed zapytaniem - w pamięci jest naraz najwyżej `parallelism` paczek
+        payloads = [load_headings_payload(page, load_payload) for page in chunk]
+        outputs = iter(generate_optimized_headings_batch([payload for payload in payloads if payload]))
+        return [next(outputs) if payload else 'Brak danych do optymalizacji' for payload in payloads]
+
+    done = len(results) - len(pages)
+    for idx, outputs in run_llm_tasks(tasks, optimize_chunk, parallelism, limiter):
+        for page, optimized_headings in zip(chunks[idx], outputs):
+            page[OPTIMIZED_HEADINGS_COLUMN] = optimized_headings
+            # Usuwamy niepotrzebne dane
+            drop_headings_payload(page)
+        done += len(chunks[idx])
+        if on_progress:
+            on_progress(done, len(results))
+    copy_from_leaders(results, OPTIMIZED_HEADINGS_COLUMN)
+
+
+def submit_headings_batch_job(results, load_payload=None):
+    # Zlecenie optymalizacji nagłówków całego audytu jako zadania offline w OpenAI Batch API
+    lines = []
+    _, duplicates = split_duplicates([result for result in results if has_headings_payload(result)])
+    skipped = {id(result) for result in duplicates}
+    for result in results:
+        payload = None
+        if has_headings_payload(result) and id(result) not in skipped:
+            payload = load_headings_payload(result, load_payload)
+        drop_headings_payload(result)
+        if id(result) in skipped:
+            # Wynik strony wiodącej zostanie skopiowany po zakończeniu zadania wsadowego
+            result[OPTIMIZED_HEADINGS_COLUMN] = 'Oczekuje na wynik zadania wsadowego'
+            continue
+        if payload is None:
+            result[OPTIMIZED_HEADINGS_COLUMN] = 'Brak danych do optymalizacji'
+            continue
+        lines.append(json.dumps({
+            # Adres strony, a nie pozycja w wynikach - wczytany z checkpointu audyt może mieć inną kolejność wierszy
+            'custom_id': result['URL'],
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': {
+                'model': 'gpt-4o-mini',
+                'messages': [
+                    {'role': 'system', 'content': HEADINGS_SYSTEM_PROMPT},
+                    {'role': 'user', 'content': build_headings_prompt(payload['content_for_optimization'], payload['existing_headings'])},
+                ],
+            },
+        }, ensure_ascii=False))
+        result[OPTIMIZED_HEADINGS_COLUMN] = 'Oczekuje na wynik zadania wsadowego'
+
+    if not lines:
+        return None
+    batch_file = get_openai().files.create(file=('headings_batch.jsonl', '\n'.join(lines).encode('utf-8')), purpose='batch')
+    batch = get_openai().batches.create(
+        input_file_id=batch_file.id,
+        endpoint='/v1/chat/completions',
+        completion_window='24h',
+    )
+    return batch.id
+
+
+def apply_headings_batch_results(batch_id, run_id):
+    # Zwraca status zadania; po zakończeniu uzupełnia kolumnę z nagłówkami w wierszach z checkpointu audytu,
+    # zapisuje je z powrotem i zapomina identyfikator zadania. Wiersze wczytujemy dopiero wtedy,
+    # więc sprawdzanie statusu nie wymaga trzymania wyników w pamięci.
+    batch = get_openai().batches.retrieve(batch_id)
+    if batch.status != 'completed':
+        return batch.status
+
+    checkpoints = get_checkpoint_store()
+    if batch.output_file_id:
+        output = get_openai().files.content(batch.output_file_id).text
+        results = list(checkpoints.iter_results(run_id))
+        by_url = {result['URL']: result for result in results}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            result = by_url.get(item['custom_id'])
+            if result is None:
+                continue
+            response = item.get('response') or {}
+            if response.get('status_code') == 200:
+                ai_response = response['body']['choices'][0]['message']['content'].strip()
+                result[OPTIMIZED_HEADINGS_COLUMN] = parse_optimized_headings(ai_response)
+            else:
+                error = item.get('error') or response.get('body', {}).get('error')
+                result[OPTIMIZED_HEADINGS_COLUMN] = f"Błąd podczas generowania zoptymalizowanej struktury nagłówków: {error}"
+        copy_from_leaders(results, OPTIMIZED_HEADINGS_COLUMN)
+        checkpoints.save_results(run_id, results)
+    checkpoints.update_settings(run_id, headings_batch_id=None)
+    return batch.status
+
+
+STRUCTURED_DATA_SYSTEM_PROMPT = "Jesteś ekspertem SEO specjalizującym się w danych strukturalnych i optymalizacji stron internetowych."
+
+
+def generate_structured_data_recommendation(types, errors, warnings):
+    # Prompt zawiera tylko zestaw problemów (bez adresu strony) - ten sam zestaw w kolejnym audycie trafia do cache AI
+    prompt = f"""Jesteś specjalistą SEO z doświadczeniem w danych strukturalnych. Lokalna walidacja danych strukturalnych (schema.org) wykazała na grupie stron serwisu poniższe problemy. Zaproponuj zwięzłe poprawki: jakie właściwości dodać lub jak poprawić istniejące, z przykładowym fragmentem JSON-LD.
+
+Wykryte typy danych strukturalnych:
+{types or "Brak"}
+
+Błędy:
+{errors or "Brak błędów"}
+
+Ostrzeżenia (brakujące zalecane właściwości):
+{warnings or "Brak ostrzeżeń"}
+
+Twoje rekomendacje:"""
+    try:
+        response = cached_chat_completion(
+            'structured_data_bulk/1',
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": STRUCTURED_DATA_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+        )
+        return response.strip()
+    except Exception as e:
+        return f"Błąd podczas generowania rekomendacji: {str(e)}"
+
+
+def recommend_structured_data_fixes(results, parallelism=DEFAULT_LLM_PARALLELISM, limiter=None, on_progress=None):
+    # Jedno wywołanie modelu na unikalny zestaw problemów - strony z tego samego szablonu dzielą rekomendację
+    groups = {}
+    for result in results:
+        signature = failure_signature(result) if 'Error' not in result else None
+        if signature is None:
+            result[RECOMMENDATIONS_COLUMN] = ''
+        else:
+            groups.setdefault(signature, []).append(result)
+
+    tasks = [(signature, signature) for signature in groups]
+    done = 0
+    for signature, recommendation in run_llm_tasks(
+        tasks, lambda signature: generate_structured_data_recommendation(*signature), parallelism, limiter
+    ):
+        for result in groups[signature]:
+            result[RECOMMENDATIONS_COLUMN] = recommendation
+        done += 1
+        if on_progress:
+            on_progress(done, len(tasks))
+
+
+def count_urls(urls, counter):
+    # Zlicza URL-e w miarę ich odczytywania - przy sitemapie całkowita liczba nie jest znana z góry
+    for url in urls:
+        counter['discovered'] += 1
+        yield url
+
+
+# Ustawienia audytu zapisywane w checkpoincie - wystarczają do wznowienia przerwanego crawla
+CHECKPOINT_SETTINGS_KEYS = (
+    'urls', 'sitemap_url', 'link_crawl', 'elements_to_fetch', 'crawl_mode', 'max_workers', 'per_host_limit',
+    'polite_crawl', 'use_page_store', 'parse_workers', 'queue_size', 'generate_new_meta', 'optimize_headings',
+    'headings_settings', 'context', 'structured_data_ai',
+)
+
+
+def describe_audit_source(urls, sitemap_url, link_crawl):
+    if sitemap_url:
+        return f'Sitemapa {sitemap_url}'
+    label = 'Crawl od' if link_crawl else 'Lista'
+    first = urls[0] if urls else ''
+    return f'{label} {first}' + (f' (+{len(urls) - 1})' if len(urls) > 1 else '')
+
+
+def get_result_columns(elements, generate_new_meta, optimize_headings, structured_data_ai=False):
+    # Przygotowanie listy kolumn do wyświetlenia i eksportu; analiza linkowania i dane strukturalne dają kilka kolumn
+    columns = ['URL']
+    for element in elements:
+        if element == LINK_GRAPH_ELEMENT:
+            columns.extend(LINK_GRAPH_COLUMNS)
+        elif element == LINK_CHECK_ELEMENT:
+            columns.extend(LINK_CHECK_COLUMNS)
+        elif element == STRUCTURED_DATA_ELEMENT:
+            columns.extend(STRUCTURED_DATA_COLUMNS)
+            if structured_data_ai:
+                columns.append(RECOMMENDATIONS_COLUMN)
+        else:
+            columns.append(element)
+
+    # Dodanie nowych meta tagów, jeśli były generowane
+    if generate_new_meta:
+        if 'Meta title' in elements:
+            columns.append('Nowy Meta title')
+        if 'Meta description' in elements:
+            columns.append('Nowy Meta description')
+
+    # Dodanie zoptymalizowanych nagłówków, jeśli były generowane
+    if optimize_headings:
+        columns.append(OPTIMIZED_HEADINGS_COLUMN)
+    return columns
+
+
+def run_audit(job, settings, export=True):
+    # Cały audyt (crawl, eksport, etapy AI) bez wywołań Streamlit - w wątku zadania w tle albo z CLI.
+    # Bez eksportu (export=False) wyniki zostają tylko w job.results.
+    fetch_options = {
+        'elements': settings['elements_to_fetch'],
+        'generate_new_meta': settings['generate_new_meta'],
+        'context': settings['context'],
+        'optimize_headings': settings['optimize_headings']  # Przekazujemy wartość optimize_headings
+    }
+
+    crawl_settings = {
+        'crawl_mode': settings.get('crawl_mode', CRAWL_MODE_THREADS),
+        'max_workers': settings.get('max_workers', DEFAULT_POOL_SIZE),
+        'per_host_limit': settings.get('per_host_limit', DEFAULT_PER_HOST_LIMIT),
+        'polite_crawl': settings.get('polite_crawl', True),
+        'page_store': settings.get('use_page_store', True),
+        'parse_workers': settings.get('parse_workers'),
+        'queue_size': settings.get('queue_size'),
+    }
+    # Jeden harmonogram na cały audyt - wszystkie poziomy crawla po linkach i sprawdzanie linków
+    # korzystają ze wspólnego budżetu każdego hosta
+    crawl_settings['scheduler'] = create_scheduler(crawl_settings)
+    # Grupy zbliżonych duplikatów całego audytu (także kolejnych poziomów crawla po linkach) - tylko gdy
+    # wykrywanie duplikatów jest wybrane; wtedy wyniki AI są współdzielone w grupie
+    if DUPLICATE_COLUMN in settings['elements_to_fetch']:
+        fetch_options['duplicates'] = NearDuplicateIndex()
+    url_counter = {'discovered': 0}
+    checkpoints = get_checkpoint_store()
+    run_id = settings['run_id']
+    link_crawl = settings.get('link_crawl')
+    # Graf linków wewnętrznych - odnośniki każdej strony zapisujemy jako krawędzie, zanim wiersz trafi dalej
+    link_graph = None
+    if LINK_GRAPH_ELEMENT in settings['elements_to_fetch']:
+        link_graph = LinkGraph(settings['urls'] if link_crawl else ())
+        fetch_options['collect_links'] = True
+    # Odnośniki i adresy canonical sprawdzamy w tle już w trakcie crawla - każdy unikalny adres raz
+    link_checker = None
+    if LINK_CHECK_ELEMENT in settings['elements_to_fetch']:
+        link_checker = LinkChecker(scheduler=crawl_settings['scheduler'])
+        fetch_options['collect_links'] = True
+
+    def record_links(results):
+        for result in results:
+            if 'Error' not in result:
+                if link_graph is not None:
+                    link_graph.add_page(result['URL'], result.get(LINKS_KEY) or ())
+                if link_checker is not None:
+                    link_checker.add_page(result['URL'], result.get(LINKS_KEY) or (), result.get(CANONICAL_KEY))
+            yield result
+
+    def crawl_remaining(urls):
+        # Strony zapisane w checkpoincie (np. przed odświeżeniem przeglądarki) nie są pobierane ponownie
+        return record_links(iter_checkpointed(
+            count_urls(urls, url_counter),
+            lambda remaining: iter_crawl_results(remaining, fetch_options, crawl_settings),
+            checkpoints, run_id
+        ))
+
+    if link_crawl:
+        # Crawl po linkach - kolejne poziomy głębokości trafiają do wybranego silnika crawlowania
+        fetch_options['collect_links'] = True
+        result_iter = iter_link_crawl(
+            settings['urls'],
+            crawl_remaining,
+            max_depth=link_crawl['max_depth'],
+            max_pages=link_crawl['max_pages'],
+            same_domain=link_crawl['same_domain']
+        )
+    elif settings.get('sitemap_url'):
+        result_iter = crawl_remaining(iter_sitemap_urls(settings['sitemap_url'], on_error=job.add_error))
+    else:
+        result_iter = crawl_remaining(settings['urls'])
+
+    # Rekomendacje AI dla danych strukturalnych powstają po crawlu, gdy znane są już wszystkie zestawy problemów
+    structured_data_ai = STRUCTURED_DATA_ELEMENT in settings['elements_to_fetch'] and settings.get('structured_data_ai')
+    result_columns = get_result_columns(
+        settings['elements_to_fetch'], settings['generate_new_meta'], settings['optimize_headings'],
+        structured_data_ai
+    )
+    # Bez optymalizacji nagłówków, analizy linkowania i rekomendacji AI wiersz jest kompletny od razu, więc
+    # zapisujemy go do eksportu w chwili ukończenia URL-a; w przeciwnym razie eksport powstaje po etapach końcowych
+    final_stages = (settings['optimize_headings'] or link_graph is not None or link_checker is not None
+                    or structured_data_ai)
+    complete_rows = not final_stages
+    exporter = ResultExporter(result_columns) if complete_rows and export else None
+    # Wiersze zapisane od razu do eksportu (i checkpointu) nie muszą zostawać w pamięci zadania
+    job.keep_results = exporter is None
+
+    # Wyniki trafiają do zadania na bieżąco, w miarę kończenia kolejnych URL-i
+    job.set_progress(0, 0, 'Crawlowanie')
+    try:
+        for result in result_iter:
+            # Odnośniki strony są już w grafie linków (albo w kolejce crawla) - wiersz ich nie potrzebuje
+            result.pop(LINKS_KEY, None)
+            result.pop(CANONICAL_KEY, None)
+            job.add_result(result)
+            if exporter:
+                exporter.write(result)
+            job.set_progress(job.result_count, url_counter['discovered'])
+            if job.cancelled:
+                break
+    except BaseException:
+        if link_checker is not None:
+            link_checker.close()
+        raise
+    finally:
+        result_iter.close()
+        if exporter:
+            job.outputs['export_paths'] = exporter.close()
+    if job.cancelled or not job.result_count:
+        if link_checker is not None:
+            link_checker.close()
+        return
+
+    results = job.results
+    if link_graph is not None:
+        job.phase = 'Analiza linkowania wewnętrznego'
+        link_graph.apply(results)
+    if link_checker is not None:
+        job.set_progress(0, 0, 'Sprawdzanie linków')
+        if not link_checker.wait(job.set_progress, lambda: job.cancelled):
+            return
+        link_checker.apply(results)
+        job.link_checker = link_checker
+        if export:
+            job.outputs['link_report_paths'] = export_results(link_checker.iter_report(), LINK_REPORT_COLUMNS)
+
+    if structured_data_ai:
+        job.set_progress(0, 0, 'Rekomendacje AI dla danych strukturalnych')
+        recommend_structured_data_fixes(results, limiter=LLMRateLimiter(), on_progress=job.set_progress)
+
+    # Jeśli optymalizacja nagłówków jest włączona
+    load_payload = partial(checkpoints.load_payload, run_id)
+    headings_settings = settings.get('headings_settings') or {}
+    if settings['optimize_headings'] and headings_settings.get('mode') == HEADINGS_MODE_BATCH_API:
+        job.phase = 'Zlecanie zadania wsadowego w OpenAI Batch API'
+        job.outputs['headings_batch_id'] = submit_headings_batch_job(results, load_payload)
+        # Identyfikator zadania trafia do checkpointu - wyniki można odebrać także po odświeżeniu
+        # przeglądarki lub wczytaniu zapisanego audytu (treść stron zostanie zaraz usunięta)
+        checkpoints.update_settings(run_id, headings_batch_id=job.outputs['headings_batch_id'])
+    elif settings['optimize_headings']:
+        job.set_progress(0, len(results), 'Optymalizacja nagłówków')
+        optimize_headings_for_results(
+            results,
+            parallelism=int(headings_settings.get('parallelism', DEFAULT_LLM_PARALLELISM)),
+            pages_per_request=int(headings_settings.get('pages_per_request', 1)),
+            limiter=LLMRateLimiter(
+                headings_settings.get('requests_per_minute', DEFAULT_REQUESTS_PER_MINUTE),
+                headings_settings.get('tokens_per_minute', DEFAULT_TOKENS_PER_MINUTE)
+            ),
+            on_progress=job.set_progress,
+            load_payload=load_payload
+        )
+
+    if export and not job.outputs.get('export_paths'):
+        job.outputs['export_paths'] = export_results(results, result_columns)
+
+    if final_stages:
+        # Zapisujemy wiersze uzupełnione o etapy końcowe - treść stron na dysku nie jest już potrzebna
+        checkpoints.save_results(run_id, results)
+        checkpoints.delete_payloads(run_id)
+    checkpoints.set_status(run_id, RUN_COMPLETED)
+
+
+def build_settings(urls=None, sitemap_url='', link_crawl=None, elements=None, crawl_mode=CRAWL_MODE_THREADS,
+                   max_workers=DEFAULT_POOL_SIZE, per_host_limit=DEFAULT_PER_HOST_LIMIT, polite_crawl=True,
+                   use_page_store=True, parse_workers=None, queue_size=None, generate_new_meta=False,
+                   optimize_headings=False, headings_settings=None, context='', structured_data_ai=False):
+    # Ustawienia audytu w tym samym formacie, w jakim zapisuje je formularz w zakładce Audyt SEO
+    return {
+        'urls': list(urls or []),
+        'sitemap_url': sitemap_url,
+        'link_crawl': link_crawl,
+        'elements_to_fetch': list(DEFAULT_AUDIT_ELEMENTS if elements is None else elements),
+        'crawl_mode': crawl_mode,
+        'max_workers': max_workers,
+        'per_host_limit': per_host_limit,
+        'polite_crawl': polite_crawl,
+        'use_page_store': use_page_store,
+        'parse_workers': parse_workers,
+        'queue_size': queue_size,
+        'generate_new_meta': generate_new_meta,
+        'optimize_headings': optimize_headings,
+        'headings_settings': headings_settings or {'mode': HEADINGS_MODE_LIVE},
+        'context': context,
+        'structured_data_ai': structured_data_ai,
+    }
+
+
+def start_audit(settings, run_id=None, label=None):
+    # Przygotowuje zadanie audytu poza Streamlit; run_id wskazuje checkpoint do wznowienia
+    label = label or describe_audit_source(settings['urls'], settings['sitemap_url'], settings['link_crawl'])
+    if run_id is None:
+        run_id = get_checkpoint_store().create_run(label, settings)
+    return CrawlJob(label, dict(settings, run_id=run_id))
+
+
+def audit(settings, run_id=None, export=False):
+    # Synchroniczny audyt dla skryptów i crona - zwraca zakończone zadanie z wynikami w job.results
+    job = start_audit(settings, run_id)
+    job.started_at = time.time()
+    run_audit(job, job.settings, export=export)
+    job.finished_at = time.time()
+    return job
@@ -0,0 +1,227 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+
+from .parsing import CANONICAL_KEY, HEADINGS_PAYLOAD_FIELDS, LINKS_KEY
+from .storage import data_path
+
+
+RUN_RUNNING = 'running'
+RUN_COMPLETED = 'completed'
+# Wyniki zapisujemy paczkami - po awarii tracimy najwyżej tyle ostatnich stron
+COMMIT_EVERY = 50
+COMMIT_INTERVAL = 2.0
+# Starsze audyty są usuwane, żeby baza checkpointów nie rosła bez końca
+MAX_RUNS = 20
+# Znacznik wiersza, którego treść do optymalizacji nagłówków leży w tabeli payloads (wartość: długość treści)
+PAYLOAD_KEY = '_payload_chars'
+
+
+class CheckpointStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS runs ('
+            'run_id TEXT PRIMARY KEY, label TEXT NOT NULL, settings TEXT NOT NULL, status TEXT NOT NULL, '
+            'created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'run_id TEXT NOT NULL, url TEXT NOT NULL, result TEXT NOT NULL, '
+            'PRIMARY KEY (run_id, url))'
+        )
+        # Duże pola potrzebne tylko etapowi AI (skompresowany JSON) - wiersze w pamięci zostają małe
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS payloads ('
+            'run_id TEXT NOT NULL, url TEXT NOT NULL, data BLOB NOT NULL, '
+            'PRIMARY KEY (run_id, url))'
+        )
+        self.conn.commit()
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+    def create_run(self, label, settings):
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO runs (run_id, label, settings, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (run_id, label, json.dumps(settings, ensure_ascii=False), RUN_RUNNING, now, now)
+            )
+            self._prune()
+            self.conn.commit()
+        return run_id
+
+    def _prune(self):
+        stale = self.conn.execute(
+            'SELECT run_id FROM runs ORDER BY created_at DESC LIMIT -1 OFFSET ?', (MAX_RUNS,)
+        ).fetchall()
+        self.conn.executemany('DELETE FROM results WHERE run_id = ?', stale)
+        self.conn.executemany('DELETE FROM payloads WHERE run_id = ?', stale)
+        self.conn.executemany('DELETE FROM runs WHERE run_id = ?', stale)
+
+    def list_runs(self):
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT r.run_id, r.label, r.status, r.created_at, '
+                '(SELECT COUNT(*) FROM results WHERE results.run_id = r.run_id) '
+                'FROM runs r ORDER BY r.created_at DESC'
+            ).fetchall()
+        return [
+            {'run_id': run_id, 'label': label, 'status': status, 'created_at': created_at, 'done': done}
+            for run_id, label, status, created_at, done in rows
+        ]
+
+    def load_settings(self, run_id):
+        with self.lock:
+            row = self.conn.execute('SELECT settings FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_settings(self, run_id, **changes):
+        # Dopisanie do ustawień audytu stanu etapów końcowych (np. identyfikatora zadania wsadowego)
+        with self.lock:
+            row = self.conn.execute('SELECT settings FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+            if row is None:
+                return
+            settings = dict(json.loads(row[0]), **changes)
+            self.conn.execute(
+                'UPDATE runs SET settings = ?, updated_at = ? WHERE run_id = ?',
+                (json.dumps(settings, ensure_ascii=False), time.time(), run_id)
+            )
+            self._commit(time.monotonic())
+
+    def get_result(self, run_id, url):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT result FROM results WHERE run_id = ? AND url = ?', (run_id, url)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_result(self, run_id, result):
+        # Błędy nie są zapisywane - po wznowieniu takie URL-e zostaną pobrane ponownie
+        if 'Error' in result:
+            return
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO results (run_id, url, result) VALUES (?, ?, ?)',
+                (run_id, result['URL'], json.dumps(result, ensure_ascii=False))
+            )
+            self.uncommitted += 1
+            now = time.monotonic()
+            if self.uncommitted >= COMMIT_EVERY or now - self.last_commit >= COMMIT_INTERVAL:
+                self._commit(now)
+
+    def spill_payload(self, run_id, result):
+        # Treść strony i nagłówki dla optymalizacji nagłówków przenosimy z wiersza do bazy;
+        # w wierszu zostaje tylko znacznik z długością treści (do szacowania tokenów)
+        if not all(field in result for field in HEADINGS_PAYLOAD_FIELDS):
+            return
+        payload = {field: result.pop(field) for field in HEADINGS_PAYLOAD_FIELDS}
+        result[PAYLOAD_KEY] = len(payload['content_for_optimization'])
+        data = zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        with self.lock:
+            # Zatwierdzany razem z wierszem wyniku w save_result
+            self.conn.execute(
+                'INSERT OR REPLACE INTO payloads (run_id, url, data) VALUES (?, ?, ?)', (run_id, result['URL'], data)
+            )
+
+    def load_payload(self, run_id, url):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT data FROM payloads WHERE run_id = ? AND url = ?', (run_id, url)
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def delete_payloads(self, run_id):
+        with self.lock:
+            self.conn.execute('DELETE FROM payloads WHERE run_id = ?', (run_id,))
+            self._commit(time.monotonic())
+
+    def save_results(self, run_id, results):
+        # Nadpisanie wierszy po etapach AI wykonywanych po crawlu (np. optymalizacji nagłówków)
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO results (run_id, url, result) VALUES (?, ?, ?)',
+                ((run_id, result['URL'], json.dumps(result, ensure_ascii=False))
+                 for result in results if 'Error' not in result)
+            )
+            self._commit(time.monotonic())
+
+    def _commit(self, now):
+        self.conn.commit()
+        self.uncommitted = 0
+        self.last_commit = now
+
+    def flush(self):
+        with self.lock:
+            self._commit(time.monotonic())
+
+    def iter_results(self, run_id):
+        with self.lock:
+            rows = self.conn.execute('SELECT result FROM results WHERE run_id = ?', (run_id,)).fetchall()
+        for (raw,) in rows:
+            result = json.loads(raw)
+            result.pop(LINKS_KEY, None)
+            result.pop(CANONICAL_KEY, None)
+            yield result
+
+    def set_status(self, run_id, status):
+        with self.lock:
+            self.conn.execute(
+                'UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?', (status, time.time(), run_id)
+            )
+            self._commit(time.monotonic())
+
+    def delete_run(self, run_id):
+        with self.lock:
+            self.conn.execute('DELETE FROM results WHERE run_id = ?', (run_id,))
+            self.conn.execute('DELETE FROM payloads WHERE run_id = ?', (run_id,))
+            self.conn.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+            self._commit(time.monotonic())
+
+
+def iter_checkpointed(urls, crawl, store, run_id):
+    # Adresy ukończone we wcześniejszym przebiegu nie trafiają do silnika crawlowania - ich wyniki
+    # odtwarzamy z checkpointu. Nowe wyniki są zapisywane na bieżąco (bez treści dla etapu AI,
+    # która zostaje tylko na dysku), zanim trafią dalej.
+    replayed = deque()
+
+    def remaining():
+        for url in urls:
+            stored = store.get_result(run_id, url)
+            if stored is None:
+                yield url
+            else:
+                replayed.append(stored)
+
+    try:
+        for result in crawl(remaining()):
+            while replayed:
+                yield replayed.popleft()
+            store.spill_payload(run_id, result)
+            store.save_result(run_id, result)
+            yield result
+        while replayed:
+            yield replayed.popleft()
+    finally:
+        store.flush()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CheckpointStore(data_path('checkpoints.sqlite'))
+        return _store
@@ -0,0 +1,210 @@
+import argparse
+import sys
+import threading
+import time
+
+from .audit import (
+    AUDIT_ELEMENTS, CRAWL_MODE_ASYNC, CRAWL_MODE_PIPELINE, CRAWL_MODE_THREADS, DEFAULT_AUDIT_ELEMENTS, build_settings,
+    get_result_columns, run_audit, start_audit
+)
+from .async_engine import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_LIMIT
+from .checkpoints import get_checkpoint_store
+from .export import OUTPUT_FORMATS, resolve_output_format, write_results
+from .fetching import DEFAULT_POOL_SIZE
+from .frontier import DEFAULT_MAX_DEPTH, DEFAULT_MAX_PAGES
+from .link_check import LINK_CHECK_ELEMENT, LINK_REPORT_COLUMNS
+from .llm import DEFAULT_LLM_PARALLELISM
+from .structured_data import STRUCTURED_DATA_ELEMENT
+
+
+CRAWL_MODES = {
+    'threads': CRAWL_MODE_THREADS,
+    'async': CRAWL_MODE_ASYNC,
+    'pipeline': CRAWL_MODE_PIPELINE,
+}
+# Elementy spoza domyślnego zestawu (np. sprawdzanie linków zewnętrznych) - tylko na wyraźne życzenie
+OPT_IN_ELEMENTS = [element for element in AUDIT_ELEMENTS if element not in DEFAULT_AUDIT_ELEMENTS]
+# Co ile sekund wypisujemy postęp na stderr
+PROGRESS_INTERVAL = 5.0
+# Opcje określające zakres i sposób audytu - przy --resume obowiązują ustawienia zapisane w checkpoincie
+SETTINGS_OPTIONS = (
+    'sitemap', 'urls', 'crawl', 'elements', 'mode', 'workers', 'per_host', 'parse_workers', 'no_polite',
+    'no_page_store', 'max_depth', 'max_pages', 'all_domains', 'generate_meta', 'context', 'optimize_headings',
+    'llm_parallelism', 'structured_data_ai',
+)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m audytorek',
+        description='Audyt SEO bez interfejsu Streamlit - np. do nocnych audytów z crona.'
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--sitemap', help='URL sitemapy (także indeksu sitemap lub pliku .xml.gz)')
+    source.add_argument('--urls', help="plik z listą adresów URL, jeden na linię ('-' = stdin)")
+    source.add_argument('--crawl', nargs='+', metavar='URL', help='adresy startowe crawla po linkach')
+    parser.add_argument('-o', '--output', required=True, help='plik wynikowy (.csv, .jsonl, .parquet, .xlsx)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, help='format wyników (domyślnie z rozszerzenia pliku)')
+    parser.add_argument('--elements', default=','.join(DEFAULT_AUDIT_ELEMENTS),
+                        help='elementy do pobrania, rozdzielone przecinkami (domyślnie: %(default)s); '
+                             f"dodatkowe elementy trzeba podać jawnie: {', '.join(OPT_IN_ELEMENTS)}")
+    parser.add_argument('--mode', choices=CRAWL_MODES, default='threads', help='silnik crawlowania')
+    parser.add_argument('--workers', type=int, help='liczba wątków lub zapytań w locie (tryb async)')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST_LIMIT,
+                        help='limit równoległych zapytań na host (tryb async)')
+    parser.add_argument('--parse-workers', type=int, help='liczba procesów parsujących (tryb pipeline)')
+    parser.add_argument('--no-polite', action='store_true', help='bez adaptacyjnego tempa na host')
+    parser.add_argument('--no-page-store', action='store_true', help='bez audytu przyrostowego (magazynu stron)')
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH, help='głębokość crawla po linkach')
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_MAX_PAGES, help='limit stron crawla po linkach')
+    parser.add_argument('--all-domains', action='store_true', help='crawl po linkach także poza domeną startową')
+    parser.add_argument('--generate-meta', action='store_true', help='generuj nowe meta tagi przez AI')
+    parser.add_argument('--context', default='', help='kontekst dla generowania meta tagów')
+    parser.add_argument('--optimize-headings', action='store_true', help='optymalizuj nagłówki przez AI')
+    parser.add_argument('--llm-parallelism', type=int, default=DEFAULT_LLM_PARALLELISM,
+                        help='liczba równoległych zapytań do modelu przy optymalizacji nagłówków')
+    parser.add_argument('--structured-data-ai', action='store_true',
+                        help=f"rekomendacje AI dla problemów z danymi strukturalnymi (element '{STRUCTURED_DATA_ELEMENT}'), "
+                             'jedno zapytanie na unikalny zestaw problemów')
+    parser.add_argument('--resume', metavar='RUN_ID',
+                        help='wznów przerwany audyt z checkpointu z zapisanymi ustawieniami (bez opcji źródła i audytu)')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='zapisz metryki etapów (format tekstowy Prometheusa, np. dla node_exporter textfile)')
+    parser.add_argument('--link-report', metavar='PATH',
+                        help=f"zapisz raport niedziałających linków i przekierowań (element '{LINK_CHECK_ELEMENT}')")
+    parser.add_argument('-q', '--quiet', action='store_true', help='nie wypisuj postępu')
+    return parser
+
+
+def read_urls(path):
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        return [line.strip() for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def settings_from_args(args):
+    elements = [element.strip() for element in args.elements.split(',') if element.strip()]
+    unknown = [element for element in elements if element not in AUDIT_ELEMENTS]
+    if unknown:
+        raise ValueError(f"Nieznane elementy: {', '.join(unknown)}. Dostępne: {', '.join(AUDIT_ELEMENTS)}")
+
+    crawl_mode = CRAWL_MODES[args.mode]
+    link_crawl = None
+    if args.crawl:
+        link_crawl = {'max_depth': args.max_depth, 'max_pages': args.max_pages, 'same_domain': not args.all_domains}
+    return build_settings(
+        urls=args.crawl or (read_urls(args.urls) if args.urls else []),
+        sitemap_url=args.sitemap or '',
+        link_crawl=link_crawl,
+        elements=elements,
+        crawl_mode=crawl_mode,
+        max_workers=args.workers or (DEFAULT_CONCURRENCY if crawl_mode == CRAWL_MODE_ASYNC else DEFAULT_POOL_SIZE),
+        per_host_limit=args.per_host,
+        polite_crawl=not args.no_polite,
+        use_page_store=not args.no_page_store,
+        parse_workers=args.parse_workers,
+        generate_new_meta=args.generate_meta,
+        optimize_headings=args.optimize_headings,
+        headings_settings={'parallelism': args.llm_parallelism},
+        context=args.context,
+        structured_data_ai=args.structured_data_ai,
+    )
+
+
+def load_resumed_settings(run_id):
+    settings = get_checkpoint_store().load_settings(run_id)
+    if settings is None:
+        raise ValueError(f'Nie znaleziono checkpointu {run_id}')
+    # Checkpointy starszych wersji nie mają nowszych ustawień - uzupełniamy je wartościami domyślnymi
+    return dict(build_settings(), **settings)
+
+
+def check_args(parser, args):
+    if args.resume:
+        conflicting = [f"--{dest.replace('_', '-')}" for dest in SETTINGS_OPTIONS
+                       if getattr(args, dest) != parser.get_default(dest)]
+        if conflicting:
+            parser.error(f"opcji {', '.join(conflicting)} nie można łączyć z --resume - "
+                         'audyt jest wznawiany z ustawieniami zapisanymi w checkpoincie')
+    elif not (args.sitemap or args.urls or args.crawl):
+        parser.error('wymagana jest jedna z opcji --sitemap, --urls, --crawl albo --resume')
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    check_args(parser, args)
+    try:
+        resolve_output_format(args.output, args.format)
+        settings = load_resumed_settings(args.resume) if args.resume else settings_from_args(args)
+    except (OSError, ValueError) as e:
+        log(f'Błąd: {e}')
+        return 2
+
+    job = start_audit(settings, run_id=args.resume)
+    run_id = job.settings['run_id']
+    if not args.quiet:
+        log(f'Audyt {job.label} (checkpoint {run_id})')
+
+    # Audyt działa w osobnym wątku, a główny wątek raportuje postęp i obsługuje Ctrl+C
+    failure = []
+
+    def run():
+        try:
+            run_audit(job, job.settings, export=False)
+        except Exception as e:
+            failure.append(e)
+
+    job.started_at = time.time()
+    worker = threading.Thread(target=run, name='audytorek-cli', daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(PROGRESS_INTERVAL)
+            if worker.is_alive() and not args.quiet:
+                log(f'{job.phase}: {job.done}/{job.total}, {job.throughput():.1f} stron/s')
+    except KeyboardInterrupt:
+        job.cancel_event.set()
+        log(f'Przerywanie... audyt można wznowić opcją --resume {run_id}')
+        worker.join()
+        return 130
+    job.finished_at = time.time()
+
+    if failure:
+        log(f'Audyt zakończył się błędem: {failure[0]}')
+        return 1
+    for url, e in job.errors:
+        log(f'Błąd podczas pobierania sitemapy {url}: {e}')
+    if not job.results:
+        log('Brak wyników - nie udało się pobrać żadnego adresu URL.')
+        return 1
+
+    columns = get_result_columns(settings['elements_to_fetch'], settings['generate_new_meta'], settings['optimize_headings'],
+                                 settings['structured_data_ai'])
+    if any('Error' in result for result in job.results):
+        columns.append('Error')
+    write_results(job.results, columns, args.output, args.format)
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            f.write(job.metrics.to_prometheus())
+    if args.link_report:
+        if job.link_checker is None:
+            log(f"Raport linków pominięty - audyt nie obejmował elementu '{LINK_CHECK_ELEMENT}'")
+        else:
+            write_results(job.link_checker.iter_report(), LINK_REPORT_COLUMNS, args.link_report)
+    if not args.quiet:
+        errors = sum('Error' in result for result in job.results)
+        log(f'Zapisano {len(job.results)} wierszy ({errors} błędów) do {args.output} '
+            f'w {job.finished_at - job.started_at:.1f} s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+import os
+import sys
+
+
+def get_secret(name):
+    # W aplikacji Streamlit klucze pochodzą z st.secrets, a poza nią (CLI, cron) ze zmiennych
+    # środowiskowych o nazwie pisanej wielkimi literami, np. OPENAI_API_KEY
+    if 'streamlit' in sys.modules:
+        import streamlit as st
+        try:
+            return st.secrets[name]
+        except Exception:
+            pass
+    return os.environ.get(name.upper())
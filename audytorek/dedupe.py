@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+
+# Strony z krótszą treścią nie dostają odcisku - puste szablony (np. aplikacje JS) nie są duplikatami treści
+MIN_WORDS = 20
+SHINGLE_SIZE = 3
+FINGERPRINT_BITS = 64
+# Odciski różniące się na najwyżej tylu bitach traktujemy jako zbliżone duplikaty (Manku i in., 2007)
+MAX_DISTANCE = 3
+# Odcisk dzielimy na MAX_DISTANCE + 1 pasm - przy odległości <= MAX_DISTANCE co najmniej jedno pasmo jest identyczne
+BANDS = MAX_DISTANCE + 1
+BAND_BITS = FINGERPRINT_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+WORD_HASH_BASE = np.uint64(0x100000001b3)
+WORD_HASH_BASE_INVERSE = np.uint64(pow(0x100000001b3, -1, 1 << 64))
+# Nieparzyste mnożniki pozycji słowa w trójce - kolejność słów zmienia skrót trójki
+SHINGLE_MULTIPLIERS = tuple(np.uint64(m) for m in (0x9e3779b97f4a7c15, 0xc2b2ae3d27d4eb4f, 0x165667b19e3779f9))
+# Kolumna z adresem strony wiodącej grupy zbliżonych duplikatów (pusta dla stron unikalnych); wybrana jako
+# element audytu włącza liczenie odcisków treści i współdzielenie wyników AI w grupie
+DUPLICATE_COLUMN = 'Duplikat treści'
+
+
+def _mix(values):
+    # Finalizer splitmix64 - rozprasza bity kombinacji skrótów słów
+    values ^= values >> np.uint64(30)
+    values *= np.uint64(0xbf58476d1ce4e5b9)
+    values ^= values >> np.uint64(27)
+    values *= np.uint64(0x94d049bb133111eb)
+    values ^= values >> np.uint64(31)
+    return values
+
+
+def _word_hashes(words):
+    # Wielomianowy skrót bajtów UTF-8 każdego słowa liczony naraz dla całego tekstu: sumy prefiksowe
+    # bajt * P^pozycja, różnica na granicach słowa i przesunięcie do początku słowa mnożeniem przez P^-start
+    data = np.frombuffer(' '.join(words).encode('utf-8'), dtype=np.uint8)
+    size = len(data)
+    powers = np.ones(size + 1, dtype=np.uint64)
+    powers[1:] = np.cumprod(np.full(size, WORD_HASH_BASE, dtype=np.uint64))
+    inverse_powers = np.ones(size, dtype=np.uint64)
+    inverse_powers[1:] = np.cumprod(np.full(size - 1, WORD_HASH_BASE_INVERSE, dtype=np.uint64))
+    prefix = np.zeros(size + 1, dtype=np.uint64)
+    np.cumsum(data * powers[:size], out=prefix[1:])
+    spaces = np.flatnonzero(data == ord(' '))
+    starts = np.concatenate(([0], spaces + 1))
+    ends = np.concatenate((spaces, [size]))
+    return _mix((prefix[ends] - prefix[starts]) * inverse_powers[starts] + powers[ends - starts])
+
+
+def simhash(text):
+    # 64-bitowy SimHash ze zbioru trójek słów; None dla stron z zbyt małą ilością treści.
+    # Słowa haszujemy raz, a skróty trójek składamy z nich wektorowo
+    words = text.lower().split()
+    if len(words) < MIN_WORDS:
+        return None
+    tokens = _word_hashes(words)
+    count = len(words) - SHINGLE_SIZE + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset, multiplier in enumerate(SHINGLE_MULTIPLIERS):
+        hashes += tokens[offset:offset + count] * multiplier
+    # Powtarzające się trójki słów liczą się raz, jak w zbiorze
+    hashes = np.unique(_mix(hashes))
+    # Bity wszystkich skrótów naraz: wiersz na trójkę słów, kolumna na bit (od najmłodszego)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+    return int.from_bytes(np.packbits(majority, bitorder='little').tobytes(), 'little')
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateIndex:
+    # Grupuje strony o zbliżonej treści w trakcie crawla - każda grupa ma stronę wiodącą (pierwszą
+    # zgłoszoną), a wyniki AI liczone są raz na grupę i współdzielone przez pozostałe strony
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.bands = [{} for _ in range(BANDS)]  # wartość pasma -> [(odcisk, URL strony wiodącej)]
+        self.shared_results = {}  # (URL strony wiodącej, etap) -> Future
+
+    def assign(self, url, fingerprint):
+        # Zwraca URL strony wiodącej, jeśli strona jest zbliżonym duplikatem; inaczej zostaje nową stroną wiodącą
+        if fingerprint is None:
+            return None
+        keys = [(fingerprint >> (band * BAND_BITS)) & BAND_MASK for band in range(BANDS)]
+        with self.lock:
+            for band, key in zip(self.bands, keys):
+                for candidate, leader in band.get(key, ()):
+                    if hamming_distance(candidate, fingerprint) <= self.max_distance:
+                        return leader
+            entry = (fingerprint, url)
+            for band, key in zip(self.bands, keys):
+                band.setdefault(key, []).append(entry)
+        return None
+
+    def shared(self, leader, stage, compute):
+        # Pierwsza strona grupy wykonuje compute(), pozostałe czekają na jej wynik
+        key = (leader, stage)
+        with self.lock:
+            future = self.shared_results.get(key)
+            owner = future is None
+            if owner:
+                future = self.shared_results[key] = Future()
+        if owner:
+            try:
+                future.set_result(compute())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
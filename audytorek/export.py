@@ -0,0 +1,134 @@
+import csv
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+
+import xlsxwriter
+
+
+SHEET_NAME = 'SEO Audit'
+# Szerokość kolumn liczymy z pierwszych wierszy zamiast z całego zbioru wyników
+WIDTH_SAMPLE_ROWS = 200
+# Excel i tak nie wyświetli sensownie szerszej kolumny
+MAX_COLUMN_WIDTH = 100
+
+
+def _cell_text(value):
+    return '' if value is None else str(value)
+
+
+class ResultExporter:
+    # Zapisuje wiersze wyników przyrostowo do plików tymczasowych XLSX i CSV.
+    # xlsxwriter w trybie constant_memory zrzuca każdy wiersz na dysk od razu po zapisaniu,
+    # więc zużycie pamięci nie zależy od liczby audytowanych stron.
+    def __init__(self, columns, directory=None):
+        self.columns = list(columns)
+        self.xlsx_path = self._temp_path('.xlsx', directory)
+        self.csv_path = self._temp_path('.csv', directory)
+        self.workbook = xlsxwriter.Workbook(self.xlsx_path, {'constant_memory': True, 'strings_to_urls': False})
+        self.worksheet = self.workbook.add_worksheet(SHEET_NAME)
+        self.wrap_format = self.workbook.add_format({'text_wrap': True, 'valign': 'top'})
+        self.csv_file = open(self.csv_path, 'w', newline='', encoding='utf-8-sig')
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(self.columns)
+        self.sample = []
+        self.rows = 0
+
+    @staticmethod
+    def _temp_path(suffix, directory):
+        handle, path = tempfile.mkstemp(prefix='audytorek_', suffix=suffix, dir=directory)
+        os.close(handle)
+        return path
+
+    def write(self, result):
+        row = [_cell_text(result.get(column)) for column in self.columns]
+        self.csv_writer.writerow(row)
+        if self.sample is not None:
+            # Tryb constant_memory wymaga zapisu wierszy po kolei, więc próbkę do wyliczenia
+            # szerokości kolumn buforujemy, a zapisujemy ją dopiero po ustawieniu kolumn
+            self.sample.append(row)
+            if len(self.sample) >= WIDTH_SAMPLE_ROWS:
+                self._flush_sample()
+            return
+        self._write_xlsx_row(row)
+
+    def _flush_sample(self):
+        for idx, column in enumerate(self.columns):
+            max_len = max([len(column)] + [len(row[idx]) for row in self.sample]) + 1
+            self.worksheet.set_column(idx, idx, min(max_len, MAX_COLUMN_WIDTH), self.wrap_format)
+        self.worksheet.write_row(0, 0, self.columns)
+        sample, self.sample = self.sample, None
+        for row in sample:
+            self._write_xlsx_row(row)
+
+    def _write_xlsx_row(self, row):
+        self.rows += 1
+        self.worksheet.write_row(self.rows, 0, row)
+
+    def close(self):
+        if self.sample is not None:
+            self._flush_sample()
+        self.workbook.close()
+        self.csv_file.close()
+        return {'xlsx': self.xlsx_path, 'csv': self.csv_path}
+
+
+def export_results(results, columns, directory=None):
+    exporter = ResultExporter(columns, directory)
+    try:
+        for result in results:
+            exporter.write(result)
+    finally:
+        paths = exporter.close()
+    return paths
+
+
+OUTPUT_FORMATS = ('csv', 'jsonl', 'parquet', 'xlsx')
+
+
+def resolve_output_format(path, output_format=None):
+    # Format domyślnie z rozszerzenia pliku - CLI sprawdza go przed audytem, a nie dopiero po crawlu
+    output_format = output_format or os.path.splitext(path)[1].lstrip('.').lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Nieobsługiwany format wyników: {output_format}')
+    if output_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise ValueError('Zapis w formacie parquet wymaga pakietu pyarrow (pip install pyarrow)')
+    return output_format
+
+
+def write_results(results, columns, path, output_format=None):
+    # Zapis wyników do pliku wskazanego przez użytkownika (CLI)
+    output_format = resolve_output_format(path, output_format)
+    if output_format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for result in results:
+                writer.writerow([_cell_text(result.get(column)) for column in columns])
+    elif output_format == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as f:
+            for result in results:
+                row = {column: result[column] for column in columns if column in result}
+                if 'Error' in result:
+                    row['Error'] = result['Error']
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    elif output_format == 'parquet':
+        # pandas (i pyarrow) są potrzebne tylko dla tego formatu
+        import pandas as pd
+        pd.DataFrame(
+            [[_cell_text(result.get(column)) for column in columns] for result in results], columns=columns
+        ).to_parquet(path, index=False)
+    elif output_format == 'xlsx':
+        paths = export_results(results, columns, os.path.dirname(os.path.abspath(path)))
+        shutil.move(paths['xlsx'], path)
+        os.remove(paths['csv'])
+
+
+def remove_export_files(paths):
+    for path in (paths or {}).values():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,166 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+from .metrics import StageTimer
+from .scheduler import RETRYABLE_STATUSES, RetryableFetchError, parse_retry_after
+
+
+# Domyślna liczba połączeń keep-alive na host - odpowiada domyślnej liczbie wątków crawlera
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 10
+# Limit rozmiaru treści strony - większe odpowiedzi (i niekończące się strumienie) przerywamy
+MAX_BODY_BYTES = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Przy czytaniu do </head> mniejsze fragmenty - mniej zbędnych bajtów po końcu sekcji head
+HEAD_CHUNK_SIZE = 16 * 1024
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+# Po </head> czytamy jeszcze najwyżej tyle bajtów: mała strona zostaje pobrana w całości, a połączenie
+# wraca do puli keep-alive; przy większej przerywamy (zerwane połączenie trzeba otworzyć ponownie)
+HEAD_DRAIN_BYTES = 32 * 1024
+
+# Moduł jest importowany raz na proces, więc sesja przetrwa kolejne przebiegi skryptu Streamlit
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def _build_session(pool_size):
+    session = requests.Session()
+    # pool_connections - liczba hostów z własną pulą, pool_maxsize - liczba połączeń do jednego hosta
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # make_headers dodaje 'br' (i 'zstd') tylko wtedy, gdy urllib3 potrafi je zdekodować
+    session.headers.update(make_headers(keep_alive=True, accept_encoding=True))
+    return session
+
+
+def get_session(pool_size=None):
+    global _session, _session_pool_size
+
+    pool_size = max(pool_size or DEFAULT_POOL_SIZE, 1)
+    with _session_lock:
+        # Pulę tylko powiększamy - stara sesja może być jeszcze używana przez inne wątki
+        if _session is None or pool_size > _session_pool_size:
+            _session = _build_session(pool_size)
+            _session_pool_size = pool_size
+        return _session
+
+
+class SkippedPageError(Exception):
+    # Strona pominięta bez pobierania całej treści (np. PDF albo zbyt duży plik)
+    pass
+
+
+def check_page_headers(headers, max_bytes=MAX_BODY_BYTES):
+    # Typ i rozmiar sprawdzamy przed pobraniem treści; brak Content-Type traktujemy jak HTML
+    content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type and content_type not in HTML_CONTENT_TYPES:
+        raise SkippedPageError(f'Pominięto: typ treści {content_type}')
+    length = headers.get('Content-Length', '')
+    if length.isdigit() and int(length) > max_bytes:
+        raise SkippedPageError(f'Pominięto: rozmiar {int(length) / 1024 / 1024:.1f} MB przekracza limit')
+
+
+class BodyReader:
+    # Składa treść strony z kolejnych fragmentów; feed() zwraca True, gdy dalsze czytanie nie jest potrzebne.
+    # complete=False oznacza treść uciętą po </head> (wystarcza do elementów z sekcji head).
+    def __init__(self, head_only=False, max_bytes=MAX_BODY_BYTES):
+        self.head_only = head_only
+        self.max_bytes = max_bytes
+        self.chunks = []
+        self.size = 0
+        self.tail = b''
+        self.drained = None  # bajty przeczytane po </head>
+        self.complete = True
+
+    def feed(self, chunk):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise SkippedPageError(f'Pominięto: strona przekracza limit {self.max_bytes // 1024 // 1024} MB')
+        if not self.head_only:
+            return False
+        if self.drained is None:
+            # Znacznik może być rozcięty między fragmentami, więc szukamy go razem z końcówką poprzedniego;
+            # strony bez zamkniętej sekcji head kończą ją na początku <body>
+            window = (self.tail + chunk).lower()
+            positions = [position for position in (window.find(b'</head'), window.find(b'<body')) if position >= 0]
+            self.tail = chunk[-6:]
+            if not positions:
+                return False
+            position = min(positions)
+            self.drained = len(window) - position
+        else:
+            self.drained += len(chunk)
+        if self.drained > HEAD_DRAIN_BYTES:
+            self.complete = False
+            return True
+        return False
+
+    @property
+    def chunk_size(self):
+        return HEAD_CHUNK_SIZE if self.head_only else CHUNK_SIZE
+
+    @property
+    def content(self):
+        return b''.join(self.chunks)
+
+
+def read_body(response, head_only=False, max_bytes=MAX_BODY_BYTES, retryable=False):
+    # Treść odpowiedzi requests pobranej z stream=True; zwraca (treść, czy kompletna).
+    # retryable - zerwanie połączenia w trakcie czytania zgłaszamy jako błąd do ponowienia
+    # (tylko gdy zapytanie idzie przez harmonogram, który ponowienia obsługuje)
+    check_page_headers(response.headers, max_bytes)
+    reader = BodyReader(head_only, max_bytes)
+    try:
+        for chunk in response.iter_content(reader.chunk_size):
+            if reader.feed(chunk):
+                break
+    except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+        if retryable:
+            raise RetryableFetchError(str(e)) from e
+        raise
+    return reader.content, reader.complete
+
+
+def http_request(method, url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    return get_session().request(method, url, timeout=timeout, **kwargs)
+
+
+def http_get(url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    return http_request('GET', url, timeout=timeout, **kwargs)
+
+
+def scheduled_get(url, scheduler, timeout=DEFAULT_TIMEOUT, metrics=None, **kwargs):
+    return scheduled_request('GET', url, scheduler, timeout=timeout, metrics=metrics, **kwargs)
+
+
+def scheduled_request(method, url, scheduler, timeout=DEFAULT_TIMEOUT, metrics=None, **kwargs):
+    # Zapytanie z poszanowaniem limitów hosta; 429/503 i timeouty zgłaszamy jako błędy do ponowienia
+    with StageTimer(metrics, 'wait'):
+        scheduler.acquire(url)
+    started = time.monotonic()
+    status = None
+    retry_after = None
+    timed_out = False
+    try:
+        response = http_request(method, url, timeout=timeout, **kwargs)
+        status = response.status_code
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+    except (requests.Timeout, requests.ConnectionError) as e:
+        timed_out = True
+        raise RetryableFetchError(str(e)) from e
+    finally:
+        scheduler.release(url, time.monotonic() - started, status=status,
+                          retry_after=retry_after, timed_out=timed_out)
+
+    if status in RETRYABLE_STATUSES:
+        # Przy stream=True treść nie została przeczytana - zamykamy odpowiedź, zwalniając połączenie
+        response.close()
+        raise RetryableFetchError(f'HTTP {status}', retry_after)
+    return response
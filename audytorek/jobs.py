@@ -0,0 +1,165 @@
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .export import remove_export_files
+from .metrics import METRICS_KEY, MetricsCollector
+
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_CANCELLED = 'cancelled'
+JOB_FAILED = 'failed'
+FINISHED_STATUSES = {JOB_COMPLETED, JOB_CANCELLED, JOB_FAILED}
+
+# Tyle audytów działa naraz - kolejne czekają w kolejce
+MAX_CONCURRENT_JOBS = 4
+# Zakończone zadania (z wynikami w pamięci) trzymamy tylko do tego limitu
+MAX_FINISHED_JOBS = 10
+# Ostatnio ukończone strony trzymane w zadaniu na potrzeby podglądu wyników
+RESULTS_PREVIEW_ROWS = 1000
+
+
+class CrawlJob:
+    # Stan audytu działającego w tle - wątek zadania go aktualizuje, a interfejs tylko odczytuje
+    def __init__(self, label, settings):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.settings = settings
+        self.status = JOB_QUEUED
+        self.phase = 'W kolejce'
+        self.results = []
+        # Gdy wiersze trafiają od razu do eksportu i checkpointu, zadanie nie musi trzymać ich wszystkich
+        self.keep_results = True
+        self.result_count = 0
+        self.recent = deque(maxlen=RESULTS_PREVIEW_ROWS)
+        self.errors = []
+        self.outputs = {}
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.metrics = MetricsCollector()
+        # LinkChecker po sprawdzeniu linków (raport niedziałających linków i przekierowań)
+        self.link_checker = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def add_result(self, result):
+        # Pomiary strony trafiają do agregatów (i są w checkpoincie), więc wiersz w pamięci ich nie trzyma
+        self.metrics.observe(result)
+        result.pop(METRICS_KEY, None)
+        self.result_count += 1
+        self.recent.append(result)
+        if self.keep_results:
+            self.results.append(result)
+
+    def release_results(self):
+        # Pełne wiersze są już w eksporcie i checkpoincie - w pamięci zostaje tylko podgląd
+        self.keep_results = False
+        self.results = []
+
+    def add_error(self, url, error):
+        self.errors.append((url, error))
+
+    def set_progress(self, done, total, phase=None):
+        self.done = done
+        self.total = max(total, done)
+        if phase:
+            self.phase = phase
+
+    def throughput(self):
+        # Stron na sekundę od startu zadania
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.result_count / elapsed if elapsed > 0 else 0.0
+
+
+class JobManager:
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS):
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='audytorek-job')
+
+    def submit(self, label, target, settings):
+        # target(job, settings) wykonuje cały audyt i na bieżąco aktualizuje stan zadania
+        job = CrawlJob(label, settings)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self._prune()
+        self.executor.submit(self._run, job, target)
+        return job
+
+    def _run(self, job, target):
+        if job.cancelled:
+            job.status = JOB_CANCELLED
+            job.finished_at = time.time()
+            return
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        status = JOB_FAILED
+        try:
+            target(job, job.settings)
+            status = JOB_CANCELLED if job.cancelled else JOB_COMPLETED
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+        finally:
+            # Zakończone zadanie zostaje na liście do MAX_FINISHED_JOBS - bez pełnych wyników w pamięci
+            job.release_results()
+            # Czas zakończenia ustawiamy przed statusem - interfejs czyta oba bez blokady
+            job.finished_at = time.time()
+            job.status = status
+
+    def _prune(self):
+        finished = sorted(
+            (job for job in self.jobs.values() if job.finished), key=lambda job: job.finished_at
+        )
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            remove_export_files(job.outputs.get('export_paths'))
+            remove_export_files(job.outputs.get('link_report_paths'))
+            del self.jobs[job.job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def active_run_ids(self):
+        # Checkpointy, do których zapisują jeszcze niezakończone zadania
+        with self.lock:
+            return {job.settings.get('run_id') for job in self.jobs.values() if not job.finished}
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job:
+            job.cancel_event.set()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
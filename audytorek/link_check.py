@@ -0,0 +1,217 @@
+import threading
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urldefrag, urljoin
+
+import requests
+
+from .fetching import DEFAULT_TIMEOUT, http_request, scheduled_request
+from .scheduler import RetryableFetchError
+
+
+# Element audytu sprawdzający wszystkie odnośniki i adresy canonical znalezione podczas crawla
+LINK_CHECK_ELEMENT = 'Niedziałające linki i przekierowania'
+BROKEN_LINKS_COLUMN = 'Niedziałające linki'
+REDIRECTED_LINKS_COLUMN = 'Przekierowane linki'
+CANONICAL_STATUS_COLUMN = 'Status canonical'
+LINK_CHECK_COLUMNS = [BROKEN_LINKS_COLUMN, REDIRECTED_LINKS_COLUMN, CANONICAL_STATUS_COLUMN]
+# Kolumny raportu: jeden wiersz na niedziałający lub przekierowany link na danej stronie
+LINK_REPORT_COLUMNS = ['Strona', 'Link', 'Typ', 'Status', 'Przekierowania', 'Docelowy URL', 'Błąd']
+LINK_TYPE_LINK = 'link'
+LINK_TYPE_CANONICAL = 'canonical'
+
+DEFAULT_LINK_CHECK_WORKERS = 32
+MAX_REDIRECTS = 10
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+# Serwery, które nie obsługują HEAD (albo blokują go), odpowiadają tymi kodami - wtedy pytamy GET-em
+HEAD_FALLBACK_STATUSES = {400, 403, 405, 501}
+CHECKED_SCHEMES = ('http://', 'https://')
+
+# Wynik sprawdzenia adresu; chain - kolejne przekierowania jako (URL, status)
+LinkCheck = namedtuple('LinkCheck', ['status', 'chain', 'final_url', 'error'])
+
+
+def check_link(url, scheduler=None, timeout=DEFAULT_TIMEOUT, max_redirects=MAX_REDIRECTS):
+    # Przechodzi przekierowania krok po kroku (bez automatycznego podążania w requests), żeby zapisać cały łańcuch
+    chain = []
+    current = url
+    visited = {url}
+    while True:
+        try:
+            status, location = _probe(current, scheduler, timeout)
+        except (requests.RequestException, RetryableFetchError) as e:
+            return LinkCheck(None, tuple(chain), current, _error_message(e))
+        if status not in REDIRECT_STATUSES or not location:
+            return LinkCheck(status, tuple(chain), current, None)
+        chain.append((current, status))
+        current = urldefrag(urljoin(current, location))[0]
+        if current in visited:
+            return LinkCheck(status, tuple(chain), current, 'Pętla przekierowań')
+        if len(chain) >= max_redirects:
+            return LinkCheck(status, tuple(chain), current, 'Zbyt wiele przekierowań')
+        visited.add(current)
+
+
+def _error_message(error):
+    # Krótki opis zamiast pełnego komunikatu urllib3 (który powtarza adres i całą przyczynę)
+    cause = error.__cause__ if isinstance(error, RetryableFetchError) and error.__cause__ else error
+    if isinstance(cause, requests.Timeout):
+        return 'Przekroczono limit czasu'
+    if isinstance(cause, requests.ConnectionError):
+        return 'Błąd połączenia'
+    return str(cause) or type(cause).__name__
+
+
+def _probe(url, scheduler, timeout):
+    # Status i nagłówek Location jednego adresu - najpierw HEAD, a GET (bez czytania treści) tylko w razie potrzeby
+    status, location = _request('HEAD', url, scheduler, timeout)
+    if status in HEAD_FALLBACK_STATUSES:
+        status, location = _request('GET', url, scheduler, timeout)
+    return status, location
+
+
+def _request(method, url, scheduler, timeout):
+    attempt = 0
+    while True:
+        try:
+            if scheduler is None:
+                response = http_request(method, url, timeout=timeout, allow_redirects=False, stream=True)
+            else:
+                response = scheduled_request(method, url, scheduler, timeout=timeout,
+                                             allow_redirects=False, stream=True)
+        except RetryableFetchError as e:
+            attempt += 1
+            if attempt > scheduler.max_retries:
+                raise
+            time.sleep(scheduler.retry_delay(attempt, e.retry_after))
+            continue
+        response.close()
+        return response.status_code, response.headers.get('Location')
+
+
+def format_chain(check):
+    # Np. "301 http://a/ -> 302 http://b/ -> 200"
+    hops = [f'{status} {url}' for url, status in check.chain]
+    if check.status is not None and not check.error:
+        hops.append(str(check.status))
+    return ' -> '.join(hops)
+
+
+def is_broken(check):
+    return check.error is not None or check.status >= 400
+
+
+class LinkChecker:
+    # Sprawdza odnośniki w trakcie crawla: każdy unikalny adres trafia do puli wątków raz na audyt
+    # (link ze stopki powtórzony na 40 tys. stron to jedno zapytanie). Strony zapamiętują tylko
+    # numery swoich linków, a raport powstaje po zakończeniu sprawdzania.
+    def __init__(self, workers=DEFAULT_LINK_CHECK_WORKERS, scheduler=None, timeout=DEFAULT_TIMEOUT):
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='audytorek-links')
+        self.lock = threading.Lock()
+        self.checked = threading.Condition(self.lock)
+        self.ids = {}  # URL -> numer linku
+        self.checks = []  # numer linku -> LinkCheck (None do czasu sprawdzenia)
+        self.pending = 0
+        self.pages = []  # (URL strony, numer linku canonical albo -1)
+        self.offsets = array('q', [0])  # linki strony i to link_ids[offsets[i]:offsets[i + 1]]
+        self.link_ids = array('i')
+
+    def _link_id(self, url):
+        link_id = self.ids.get(url)
+        if link_id is None:
+            link_id = self.ids[url] = len(self.checks)
+            self.checks.append(None)
+            self.pending += 1
+            self.executor.submit(self._check, link_id, url)
+        return link_id
+
+    def _check(self, link_id, url):
+        try:
+            check = check_link(url, self.scheduler, self.timeout)
+        except Exception as e:
+            check = LinkCheck(None, (), url, str(e) or type(e).__name__)
+        with self.checked:
+            self.checks[link_id] = check
+            self.pending -= 1
+            self.checked.notify_all()
+
+    def add_page(self, url, links, canonical=None):
+        link_ids = set()
+        with self.lock:
+            for link in links:
+                if link.startswith(CHECKED_SCHEMES):
+                    link_ids.add(self._link_id(urldefrag(link)[0]))
+            canonical_id = -1
+            if canonical and canonical.startswith(CHECKED_SCHEMES):
+                canonical_id = self._link_id(urldefrag(canonical)[0])
+            self.pages.append((url, canonical_id))
+            self.link_ids.extend(sorted(link_ids))
+            self.offsets.append(len(self.link_ids))
+
+    def wait(self, on_progress=None, cancelled=None):
+        # Czeka na sprawdzenie wszystkich linków; zwraca False, jeśli audyt przerwano
+        with self.checked:
+            while self.pending:
+                if cancelled and cancelled():
+                    self.close()
+                    return False
+                if on_progress:
+                    on_progress(len(self.checks) - self.pending, len(self.checks))
+                self.checked.wait(0.5)
+        self.executor.shutdown()
+        return True
+
+    def close(self):
+        # Przerwany audyt - niesprawdzone linki nie są już potrzebne
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_page_checks(self):
+        # (URL strony, [(link, wynik), ...], (canonical, wynik) albo None) dla każdej sprawdzonej strony
+        urls = list(self.ids)
+        for position, (page_url, canonical_id) in enumerate(self.pages):
+            link_ids = self.link_ids[self.offsets[position]:self.offsets[position + 1]]
+            links = [(urls[link_id], self.checks[link_id]) for link_id in link_ids]
+            canonical = None
+            if canonical_id >= 0:
+                canonical = (urls[canonical_id], self.checks[canonical_id])
+            yield page_url, links, canonical
+
+    def apply(self, results):
+        columns = {}
+        for page_url, links, canonical in self.iter_page_checks():
+            canonical_status = ''
+            if canonical:
+                check = canonical[1]
+                canonical_status = check.error or format_chain(check)
+            columns[page_url] = {
+                BROKEN_LINKS_COLUMN: sum(is_broken(check) for _, check in links),
+                REDIRECTED_LINKS_COLUMN: sum(bool(check.chain) for _, check in links),
+                CANONICAL_STATUS_COLUMN: canonical_status,
+            }
+        for result in results:
+            values = columns.get(result['URL'])
+            if values and 'Error' not in result:
+                result.update(values)
+
+    def iter_report(self):
+        # Wiersze raportu - tylko linki niedziałające albo przekierowane
+        for page_url, links, canonical in self.iter_page_checks():
+            checks = [(link, LINK_TYPE_LINK, check) for link, check in links]
+            if canonical:
+                checks.append((canonical[0], LINK_TYPE_CANONICAL, canonical[1]))
+            for link, link_type, check in checks:
+                if not is_broken(check) and not check.chain:
+                    continue
+                yield {
+                    'Strona': page_url,
+                    'Link': link,
+                    'Typ': link_type,
+                    'Status': check.status,
+                    'Przekierowania': format_chain(check) if check.chain else '',
+                    'Docelowy URL': check.final_url if check.chain else '',
+                    'Błąd': check.error or '',
+                }
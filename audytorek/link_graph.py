@@ -0,0 +1,150 @@
+from array import array
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from .frontier import normalize_url
+
+
+# Element audytu dodający kolumny z analizą linkowania wewnętrznego (liczone po zakończeniu crawla)
+LINK_GRAPH_ELEMENT = 'Linkowanie wewnętrzne'
+PAGERANK_COLUMN = 'PageRank wewnętrzny'
+INLINKS_COLUMN = 'Linki przychodzące'
+ORPHAN_COLUMN = 'Strona osierocona'
+DEPTH_COLUMN = 'Głębokość kliknięć'
+LINK_GRAPH_COLUMNS = [PAGERANK_COLUMN, INLINKS_COLUMN, ORPHAN_COLUMN, DEPTH_COLUMN]
+
+DAMPING = 0.85
+MAX_ITERATIONS = 100
+# Koniec iteracji, gdy suma zmian PageRank wszystkich stron spadnie poniżej progu
+TOLERANCE = 1e-6
+
+
+class LinkGraph:
+    # Graf linków wewnętrznych budowany w trakcie crawla: URL-e zamieniamy na numery węzłów,
+    # a krawędzie trzymamy w dwóch tablicach liczb całkowitych (kilka MB na milion krawędzi)
+    def __init__(self, seeds=()):
+        self.ids = {}  # znormalizowany URL -> numer węzła
+        self.pages = {}  # URL wiersza wyników -> numer węzła pobranej strony
+        self.sources = array('i')
+        self.targets = array('i')
+        self.seeds = []
+        for seed in seeds:
+            url = normalize_url(seed)
+            if url:
+                self.seeds.append(self._node(url))
+
+    def _node(self, url):
+        node = self.ids.get(url)
+        if node is None:
+            node = self.ids[url] = len(self.ids)
+        return node
+
+    def add_page(self, url, links):
+        normalized = normalize_url(url)
+        if normalized is None:
+            return
+        source = self._node(normalized)
+        self.pages[url] = source
+        # Kilka linków do tej samej strony liczymy jako jedną krawędź; linki do samej siebie pomijamy.
+        # Nie filtrujemy po hostach znanych w tej chwili - zależałoby to od kolejności kończenia stron;
+        # linki do adresów spoza audytu odrzuca dopiero compute()
+        targets = set()
+        for link in links:
+            link = normalize_url(link)
+            if link:
+                targets.add(self._node(link))
+        targets.discard(source)
+        self.sources.extend([source] * len(targets))
+        self.targets.extend(targets)
+
+    def _start_nodes(self):
+        # Głębokość liczymy od adresów startowych crawla, a przy sitemapie i liście URL-i od stron głównych
+        crawled = set(self.pages.values())
+        starts = [node for node in self.seeds if node in crawled]
+        if not starts:
+            starts = [node for url, node in self.pages.items() if urlsplit(normalize_url(url))[2:4] == ('/', '')]
+        return starts
+
+    def compute(self):
+        # Zwraca {URL wiersza: {kolumna: wartość}} dla pobranych stron; linki do stron spoza audytu pomijamy
+        if not self.pages:
+            return {}
+        # Numery węzłów pobranych stron zamieniamy na kolejne indeksy 0..size-1
+        nodes = np.unique(np.fromiter(self.pages.values(), dtype=np.int64, count=len(self.pages)))
+        size = len(nodes)
+        index = np.full(len(self.ids), -1, dtype=np.int64)
+        index[nodes] = np.arange(size)
+        sources = index[np.frombuffer(self.sources, dtype=np.int32)]
+        targets = index[np.frombuffer(self.targets, dtype=np.int32)]
+        internal = targets >= 0
+        sources, targets = sources[internal], targets[internal]
+
+        starts = index[self._start_nodes()]
+        inlinks = np.bincount(targets, minlength=size)
+        rank = pagerank(sources, targets, size)
+        depth = click_depth(sources, targets, size, starts)
+        orphan = inlinks == 0
+        orphan[starts] = False
+
+        # PageRank względem najsilniejszej strony serwisu (100 = strona z największą wartością)
+        scores = np.round(rank / rank.max() * 100, 2)
+        columns = {}
+        for url, node in self.pages.items():
+            position = index[node]
+            columns[url] = {
+                PAGERANK_COLUMN: float(scores[position]),
+                INLINKS_COLUMN: int(inlinks[position]),
+                ORPHAN_COLUMN: 'tak' if orphan[position] else 'nie',
+                DEPTH_COLUMN: int(depth[position]) if depth[position] >= 0 else None,
+            }
+        return columns
+
+    def apply(self, results):
+        columns = self.compute()
+        for result in results:
+            values = columns.get(result['URL'])
+            if values and 'Error' not in result:
+                result.update(values)
+
+
+def pagerank(sources, targets, size, damping=DAMPING, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    # Iteracja potęgowa na tablicach krawędzi: w każdym kroku jedno zebranie (rank[sources])
+    # i jedno sumowanie po celach (bincount) zamiast pętli po stronach. Ranga stron bez linków
+    # wychodzących rozkłada się równo na wszystkie strony.
+    out_degree = np.bincount(sources, minlength=size)
+    dangling = out_degree == 0
+    share = 1.0 / out_degree[sources]
+    rank = np.full(size, 1.0 / size)
+    for _ in range(max_iterations):
+        flow = np.bincount(targets, weights=rank[sources] * share, minlength=size)
+        updated = damping * flow + (damping * rank[dangling].sum() + 1 - damping) / size
+        change = np.abs(updated - rank).sum()
+        rank = updated
+        if change < tolerance:
+            break
+    return rank
+
+
+def click_depth(sources, targets, size, starts):
+    # BFS poziomami na grafie w układzie CSR: dla stron z bieżącego poziomu wybieramy naraz wszystkie
+    # ich krawędzie, więc każda krawędź jest odwiedzana najwyżej raz. -1 - strona nieosiągalna.
+    neighbours = targets[np.argsort(sources)]
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=size), out=offsets[1:])
+
+    depth = np.full(size, -1, dtype=np.int64)
+    frontier = np.unique(np.asarray(starts, dtype=np.int64))
+    depth[frontier] = 0
+    level = 0
+    while frontier.size:
+        level += 1
+        begins = offsets[frontier]
+        counts = offsets[frontier + 1] - begins
+        # Indeksy krawędzi wszystkich stron z poziomu: begins[i], begins[i] + 1, ..., begins[i] + counts[i] - 1
+        edges = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - begins, counts)
+        reached = np.zeros(size, dtype=bool)
+        reached[neighbours[edges]] = True
+        frontier = np.flatnonzero(reached & (depth < 0))
+        depth[frontier] = level
+    return depth
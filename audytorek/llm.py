@@ -0,0 +1,85 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .config import get_secret
+from .scheduler import TokenBucket
+
+
+# Domyślne limity dopasowane do typowego konta OpenAI dla gpt-4o-mini - można je nadpisać w formularzu
+DEFAULT_LLM_PARALLELISM = 8
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+# Zapas na odpowiedź modelu doliczany do szacunku tokenów promptu
+RESPONSE_TOKENS_ESTIMATE = 500
+
+
+_openai_lock = threading.Lock()
+# Limiter zadania wykonywanego w bieżącym wątku przez run_llm_tasks
+_task_limits = threading.local()
+
+
+def get_openai():
+    # Import klienta OpenAI jest kosztowny, więc ładujemy go dopiero przy pierwszym wywołaniu modelu
+    with _openai_lock:
+        import openai
+        if openai.api_key is None:
+            openai.api_key = get_secret('openai_api_key')
+    return openai
+
+
+def estimate_tokens(text):
+    # Przybliżenie bez tokenizera: ok. 4 znaki na token; zamiast tekstu można podać jego długość
+    length = text if isinstance(text, int) else len(text)
+    return length // 4 + RESPONSE_TOKENS_ESTIMATE
+
+
+class LLMRateLimiter:
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        # Limity OpenAI są minutowe, więc pojemność kubełka odpowiada limitowi na minutę
+        self.requests = TokenBucket(requests_per_minute / 60, capacity=requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute)
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        # Zapytanie większe niż cały limit minutowy i tak musi kiedyś przejść
+        tokens = min(tokens, self.tokens.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                if self.requests.tokens >= 1 and self.tokens.tokens >= tokens:
+                    self.requests.tokens -= 1
+                    self.tokens.tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self.requests.tokens) / self.requests.rate,
+                    (tokens - self.tokens.tokens) / self.tokens.rate,
+                )
+            time.sleep(min(max(wait, 0.01), 5.0))
+
+
+def acquire_llm_quota(tokens):
+    # Wywoływane tuż przed zapytaniem do API, czyli dopiero po chybieniu w cache AI - odpowiedzi
+    # z cache nie zużywają limitów. Poza run_llm_tasks (bez limitera) nic nie robi.
+    limiter = getattr(_task_limits, 'limiter', None)
+    if limiter is not None:
+        limiter.acquire(tokens)
+
+
+def run_llm_tasks(tasks, call, parallelism=DEFAULT_LLM_PARALLELISM, limiter=None):
+    # tasks: iterowalne pary (klucz, dane); zwraca pary (klucz, wynik wywołania) w kolejności ukończenia.
+    # Limiter obowiązuje zapytania do API wykonywane przez call() (zob. acquire_llm_quota)
+    def run(task):
+        key, payload = task
+        _task_limits.limiter = limiter
+        try:
+            return key, call(payload)
+        finally:
+            _task_limits.limiter = None
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = [executor.submit(run, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,148 @@
+import re
+
+from bs4 import Tag
+
+
+# Typowe miejsca menu w kolejności ważności: pierwszy <nav>, potem id/klasa zawierające "menu" lub "nav"
+MENU_CANDIDATES = (
+    ('tag', 'nav'),
+    ('id', re.compile('menu', re.I)),
+    ('class', re.compile('menu', re.I)),
+    ('id', re.compile('nav', re.I)),
+    ('class', re.compile('nav', re.I)),
+)
+MENU_LIST_TAGS = ('ul', 'ol')
+MENU_ITEM_TAGS = ('li', 'div')
+# Elementy traktowane jako osobne menu w trybie zaawansowanym
+LINK_MENU_TAGS = ('ul', 'ol', 'nav')
+CONTENT_START_TAGS = ('h1', 'h2')
+
+
+def _iter_with_ancestors(root):
+    # Elementy poddrzewa w kolejności dokumentu razem z listą ich przodków (od root do rodzica).
+    # Lista jest współdzielona między krokami - przodków zdejmujemy po wyjściu z ich poddrzewa,
+    # więc całe przejście jest liniowe względem liczby elementów.
+    path = [root]
+    for element in root.descendants:
+        if not isinstance(element, Tag):
+            continue
+        while path[-1] is not element.parent:
+            path.pop()
+        yield element, path
+        path.append(element)
+
+
+def _matches_candidate(element, kind, pattern):
+    if kind == 'tag':
+        return element.name == pattern
+    if kind == 'id':
+        value = element.get('id')
+        return value is not None and pattern.search(value) is not None
+    return any(pattern.search(value) for value in element.get('class') or ())
+
+
+def find_menu_automatically(soup):
+    # Jedno przejście zamiast osobnego find() dla każdego wzorca - wynik jak dla pierwszego pasującego wzorca
+    found = [None] * len(MENU_CANDIDATES)
+    for element in soup.find_all(True):
+        for position, (kind, pattern) in enumerate(MENU_CANDIDATES):
+            if found[position] is None and _matches_candidate(element, kind, pattern):
+                found[position] = element
+        if found[0] is not None:
+            break
+    return next((element for element in found if element is not None), None)
+
+
+def _first_descendants(root):
+    # Dla każdego elementu pierwszy potomny link i pierwsza lista (jak item.find('a') i item.find(['ul', 'ol'])).
+    # Przodkowie bez przypisanego linku tworzą zawsze koniec ścieżki, więc każdy element przypisujemy raz.
+    first_link = {}
+    first_list = {}
+    link_pending = list_pending = 0
+    for element, path in _iter_with_ancestors(root):
+        depth = len(path)
+        link_pending = min(link_pending, depth)
+        list_pending = min(list_pending, depth)
+        if element.name == 'a':
+            for ancestor in path[link_pending:]:
+                first_link[id(ancestor)] = element
+            link_pending = depth
+        elif element.name in MENU_LIST_TAGS:
+            for ancestor in path[list_pending:]:
+                first_list[id(ancestor)] = element
+            list_pending = depth
+    return first_link, first_list
+
+
+def build_menu_structure(menu_element):
+    # Hierarchia menu: elementy li/div z pierwszym linkiem jako pozycją i pierwszą listą jako podmenu
+    first_link, first_list = _first_descendants(menu_element)
+
+    def parse_menu_item(item, parent=None):
+        link = first_link.get(id(item))
+        if link is None:
+            return None
+        result = {'text': link.get_text(strip=True), 'url': link.get('href'), 'parent': parent}
+        submenu = first_list.get(id(item))
+        if submenu is not None:
+            result['children'] = []
+            for sub_item in submenu.find_all(MENU_ITEM_TAGS, recursive=False):
+                child = parse_menu_item(sub_item, result['text'])
+                if child:
+                    result['children'].append(child)
+        return result
+
+    menu_structure = []
+    for item in menu_element.find_all(MENU_ITEM_TAGS, recursive=False):
+        parsed_item = parse_menu_item(item)
+        if parsed_item:
+            menu_structure.append(parsed_item)
+    return menu_structure
+
+
+def extract_link_menus(soup):
+    # Wszystkie listy ul/ol/nav przed pierwszym nagłówkiem h1/h2 (od najbliższego poprzedzającego <body>)
+    # razem z ich linkami. Link z zagnieżdżonej listy należy do każdej listy nadrzędnej; tekst elementu li
+    # nadrzędnego wobec linku liczymy raz na element.
+    menu_links = {}  # id listy -> linki w kolejności dokumentu
+    menus_since_body = []
+    since_body_ids = set()
+    all_menus = []
+    item_texts = {}
+    content_start = None
+    open_menu = None  # (głębokość, lista) - najbardziej zewnętrzna lista otwarta w chwili napotkania h1/h2
+
+    for element, path in _iter_with_ancestors(soup):
+        if content_start is not None:
+            # Po nagłówku liczą się już tylko linki list, które go zawierają
+            if open_menu is None or len(path) <= open_menu[0] or path[open_menu[0]] is not open_menu[1]:
+                break
+        elif element.name in CONTENT_START_TAGS:
+            content_start = element
+            open_menu = next(((depth, ancestor) for depth, ancestor in enumerate(path)
+                              if id(ancestor) in since_body_ids), None)
+            continue
+        elif element.name == 'body':
+            menus_since_body = []
+            since_body_ids = set()
+        elif element.name in LINK_MENU_TAGS:
+            menu_links[id(element)] = []
+            menus_since_body.append(element)
+            since_body_ids.add(id(element))
+            all_menus.append(element)
+
+        if element.name == 'a' and element.get('href') is not None:
+            parent = next((ancestor for ancestor in reversed(path) if ancestor.name == 'li'), None)
+            parent_text = None
+            if parent is not None:
+                parent_text = item_texts.get(id(parent))
+                if parent_text is None:
+                    parent_text = item_texts[id(parent)] = parent.get_text(strip=True)
+            item = {'text': element.get_text(strip=True), 'url': element['href'], 'parent': parent_text}
+            for ancestor in path:
+                links = menu_links.get(id(ancestor))
+                if links is not None:
+                    links.append(item)
+
+    menus = menus_since_body if content_start is not None else all_menus
+    return [menu_links[id(menu)] for menu in menus if menu_links[id(menu)]]
@@ -0,0 +1,177 @@
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+# Klucz wiersza wyniku z pomiarami strony (czasy etapów w sekundach, status, rozmiar, przekierowania, ponowienia)
+METRICS_KEY = '_metrics'
+# Etapy obsługi jednego URL-a w kolejności wykonywania. DNS i nawiązanie połączenia mierzy tylko
+# tryb asyncio (aiohttp); w trybach opartych o requests wchodzą w czas do pierwszego bajtu.
+STAGES = ('wait', 'dns', 'connect', 'ttfb', 'download', 'parse', 'ai')
+STAGE_LABELS = {
+    'wait': 'Oczekiwanie na limit hosta',
+    'dns': 'DNS',
+    'connect': 'Połączenie',
+    'ttfb': 'Czas do pierwszego bajtu',
+    'download': 'Pobieranie treści',
+    'parse': 'Parsowanie',
+    'ai': 'Generowanie AI',
+}
+# Przedziały histogramu czasów etapów (w sekundach), jak w domyślnych przedziałach klientów Prometheusa
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_HOSTS_LIMIT = 20
+
+
+def new_page_metrics():
+    return {'retries': 0}
+
+
+def add_stage(metrics, stage, seconds):
+    if metrics is not None:
+        metrics[stage] = metrics.get(stage, 0.0) + max(seconds, 0.0)
+
+
+class StageTimer:
+    # with StageTimer(metrics, 'parse'): ... - dolicza czas bloku do etapu
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add_stage(self.metrics, self.stage, time.perf_counter() - self.started)
+        return False
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsCollector:
+    # Agregaty pomiarów całego audytu; observe() wywołuje wątek crawla, odczyty - interfejs
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.errors = 0
+        self.bytes = 0
+        self.redirects = 0
+        self.retries = 0
+        self.statuses = Counter()
+        self.stage_sums = Counter()
+        self.stage_counts = Counter()
+        self.stage_buckets = {stage: [0] * len(BUCKETS) for stage in STAGES}
+        self.hosts = {}  # host -> [strony, łączny czas, błędy]
+        self.timeline = Counter()  # sekunda (czas uniksowy) -> liczba ukończonych stron
+
+    def observe(self, result):
+        metrics = result.get(METRICS_KEY) or {}
+        host = urlsplit(result.get('URL', '')).hostname or ''
+        total = sum(metrics.get(stage, 0.0) for stage in STAGES)
+        failed = 'Error' in result
+        with self.lock:
+            self.pages += 1
+            self.errors += failed
+            self.bytes += metrics.get('bytes', 0)
+            self.redirects += metrics.get('redirects', 0)
+            self.retries += metrics.get('retries', 0)
+            self.statuses[metrics.get('status') or ('error' if failed else 'unknown')] += 1
+            for stage in STAGES:
+                if stage not in metrics:
+                    continue
+                seconds = metrics[stage]
+                self.stage_sums[stage] += seconds
+                self.stage_counts[stage] += 1
+                buckets = self.stage_buckets[stage]
+                for idx, bound in enumerate(BUCKETS):
+                    if seconds <= bound:
+                        buckets[idx] += 1
+            host_stats = self.hosts.setdefault(host, [0, 0.0, 0])
+            host_stats[0] += 1
+            host_stats[1] += total
+            host_stats[2] += failed
+            self.timeline[int(time.time())] += 1
+
+    def stage_summary(self):
+        with self.lock:
+            return [
+                {
+                    'Etap': STAGE_LABELS[stage],
+                    'Strony': self.stage_counts[stage],
+                    'Łącznie [s]': round(self.stage_sums[stage], 2),
+                    'Średnio [ms]': round(self.stage_sums[stage] * 1000 / self.stage_counts[stage], 1),
+                }
+                for stage in STAGES if self.stage_counts[stage]
+            ]
+
+    def slow_hosts(self, limit=SLOW_HOSTS_LIMIT):
+        with self.lock:
+            rows = [
+                {'Host': host, 'Strony': pages, 'Średni czas [ms]': round(total * 1000 / pages, 1), 'Błędy': errors}
+                for host, (pages, total, errors) in self.hosts.items()
+            ]
+        return sorted(rows, key=lambda row: row['Średni czas [ms]'], reverse=True)[:limit]
+
+    def throughput_timeline(self):
+        # Strony na sekundę od pierwszej ukończonej strony (z zerami w przerwach)
+        with self.lock:
+            if not self.timeline:
+                return []
+            first, last = min(self.timeline), max(self.timeline)
+            return [self.timeline.get(second, 0) for second in range(first, last + 1)]
+
+    def to_prometheus(self):
+        # Format tekstowy Prometheusa (exposition format 0.0.4)
+        lines = [
+            '# HELP audytorek_pages_total Liczba przetworzonych stron',
+            '# TYPE audytorek_pages_total counter',
+            f'audytorek_pages_total {self.pages}',
+            '# HELP audytorek_errors_total Liczba stron zakończonych błędem',
+            '# TYPE audytorek_errors_total counter',
+            f'audytorek_errors_total {self.errors}',
+            '# HELP audytorek_response_bytes_total Łączny rozmiar pobranych treści',
+            '# TYPE audytorek_response_bytes_total counter',
+            f'audytorek_response_bytes_total {self.bytes}',
+            '# HELP audytorek_redirects_total Liczba przekierowań',
+            '# TYPE audytorek_redirects_total counter',
+            f'audytorek_redirects_total {self.redirects}',
+            '# HELP audytorek_retries_total Liczba ponowionych zapytań',
+            '# TYPE audytorek_retries_total counter',
+            f'audytorek_retries_total {self.retries}',
+            '# HELP audytorek_responses_total Odpowiedzi według statusu HTTP',
+            '# TYPE audytorek_responses_total counter',
+        ]
+        with self.lock:
+            for status, count in sorted(self.statuses.items(), key=lambda item: str(item[0])):
+                lines.append(f'audytorek_responses_total{{status="{_escape_label(status)}"}} {count}')
+            lines += [
+                '# HELP audytorek_stage_seconds Czas etapów obsługi strony',
+                '# TYPE audytorek_stage_seconds histogram',
+            ]
+            for stage in STAGES:
+                if not self.stage_counts[stage]:
+                    continue
+                for bound, count in zip(BUCKETS, self.stage_buckets[stage]):
+                    lines.append(f'audytorek_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'audytorek_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {self.stage_counts[stage]}')
+                lines.append(f'audytorek_stage_seconds_sum{{stage="{stage}"}} {self.stage_sums[stage]:.6f}')
+                lines.append(f'audytorek_stage_seconds_count{{stage="{stage}"}} {self.stage_counts[stage]}')
+            lines += [
+                '# HELP audytorek_host_seconds_total Łączny czas obsługi stron według hosta',
+                '# TYPE audytorek_host_seconds_total counter',
+            ]
+            for host, (pages, total, errors) in sorted(self.hosts.items()):
+                lines.append(f'audytorek_host_seconds_total{{host="{_escape_label(host)}"}} {total:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+def collect_metrics(results):
+    # Agregaty odtworzone z zapisanych wierszy (np. audytu wczytanego z checkpointu) - bez osi czasu
+    collector = MetricsCollector()
+    for result in results:
+        collector.observe(result)
+    collector.timeline.clear()
+    return collector
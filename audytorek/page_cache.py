@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+
+from bs4 import BeautifulSoup
+
+from .fetching import http_get, read_body
+
+
+# Wspólny dla zakładek cache pobranych stron (w pamięci procesu) - ograniczony sumą bajtów i wiekiem wpisów
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 10 * 60
+# Drzewo BeautifulSoup zajmuje w pamięci kilka razy więcej niż surowy HTML - tyle doliczamy do limitu
+SOUP_SIZE_FACTOR = 8
+
+
+class CachedPage:
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+        self.fetched_at = time.monotonic()
+        self.soup = None
+
+    @property
+    def size(self):
+        size = len(self.content)
+        if self.soup is not None:
+            size += len(self.content) * SOUP_SIZE_FACTOR
+        return size
+
+
+class PageCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.pages = OrderedDict()  # URL -> CachedPage, od najdawniej używanej
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url):
+        with self.lock:
+            page = self.pages.get(url)
+            if page is not None and time.monotonic() - page.fetched_at > self.ttl:
+                self._remove(url)
+                page = None
+            if page is None:
+                self.misses += 1
+                return None
+            self.pages.move_to_end(url)
+            self.hits += 1
+            return page
+
+    def put(self, url, content):
+        page = CachedPage(url, content)
+        with self.lock:
+            self._remove(url)
+            self.pages[url] = page
+            self.total += page.size
+            self._evict()
+        return page
+
+    def remember(self, url, status, content, complete=True):
+        # Pełne strony pobrane przez audyt - analiza tej samej strony w zakładkach
+        # Dane strukturalne i Tester menu nie wymaga wtedy ponownego pobrania
+        if complete and status in (200, 304):
+            self.put(url, content)
+
+    def fetch(self, url):
+        # Treść strony z cache albo pobrana raz i zapamiętana; błędy HTTP zgłaszamy jak raise_for_status
+        page = self.get(url)
+        if page is not None:
+            return page
+        response = http_get(url, stream=True)
+        try:
+            response.raise_for_status()
+            content, _ = read_body(response)
+        finally:
+            response.close()
+        return self.put(url, content)
+
+    def get_soup(self, url):
+        # Sparsowany dokument współdzielony przez zakładki - wywołujący tylko go czytają, nie modyfikują
+        page = self.fetch(url)
+        if page.soup is None:
+            soup = BeautifulSoup(page.content, 'html.parser')
+            with self.lock:
+                if page.soup is None and self.pages.get(url) is page:
+                    old_size = page.size
+                    page.soup = soup
+                    self.total += page.size - old_size
+                    self._evict()
+                else:
+                    page.soup = page.soup or soup
+        return page.soup
+
+    def _remove(self, url):
+        page = self.pages.pop(url, None)
+        if page is not None:
+            self.total -= page.size
+
+    def _evict(self):
+        # Ostatnio dodana strona zostaje nawet ponad limitem - inaczej duża strona nie trafiłaby do cache
+        while self.total > self.max_bytes and len(self.pages) > 1:
+            _, page = self.pages.popitem(last=False)
+            self.total -= page.size
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.total = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.pages), 'bytes': self.total}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache()
+        return _cache
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from .parsing import build_page_result
+from .storage import data_path
+
+
+# Zmiana sposobu ekstrakcji musi unieważnić zapisane wyniki parsowania
+PARSER_VERSION = 4
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def options_key(elements, optimize_headings, collect_links=False):
+    raw = json.dumps([PARSER_VERSION, sorted(elements), bool(optimize_headings), bool(collect_links)])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class PageStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT NOT NULL, '
+            'body BLOB NOT NULL, fetched_at REAL NOT NULL)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS extractions ('
+            'url TEXT NOT NULL, options_key TEXT NOT NULL, content_hash TEXT NOT NULL, parsed TEXT NOT NULL, '
+            'PRIMARY KEY (url, options_key))'
+        )
+        self.conn.commit()
+
+    def conditional_headers(self, url):
+        with self.lock:
+            row = self.conn.execute('SELECT etag, last_modified FROM pages WHERE url = ?', (url,)).fetchone()
+        headers = {}
+        if row:
+            etag, last_modified = row
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def resolve_body(self, url, status, headers, content, complete=True):
+        # Przy 304 zwracamy zapisaną treść strony, przy 200 aktualizujemy magazyn
+        # (treści uciętej po </head> nie zapisujemy - nie nadaje się do pełnego audytu)
+        if status == 304:
+            with self.lock:
+                row = self.conn.execute('SELECT body FROM pages WHERE url = ?', (url,)).fetchone()
+                self.conn.execute('UPDATE pages SET fetched_at = ? WHERE url = ?', (time.time(), url))
+                self.conn.commit()
+            if row is None:
+                raise ValueError('Serwer zwrócił 304, ale strony nie ma w magazynie')
+            return zlib.decompress(row[0])
+
+        if status == 200 and complete:
+            with self.lock:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, body, fetched_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (url, headers.get('ETag'), headers.get('Last-Modified'), content_hash(content),
+                     zlib.compress(content), time.time())
+                )
+                self.conn.commit()
+        return content
+
+    def load_extraction(self, url, content, elements, optimize_headings, collect_links=False):
+        # Zapisany wynik parsowania niezmienionej treści (ten sam hash) albo None
+        key = options_key(elements, optimize_headings, collect_links)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT parsed FROM extractions WHERE url = ? AND options_key = ? AND content_hash = ?',
+                (url, key, content_hash(content))
+            ).fetchone()
+        if row:
+            result, meta_content = json.loads(row[0])
+            return result, meta_content
+        return None
+
+    def save_extraction(self, url, content, parsed, elements, optimize_headings, collect_links=False):
+        key = options_key(elements, optimize_headings, collect_links)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO extractions (url, options_key, content_hash, parsed) VALUES (?, ?, ?, ?)',
+                (url, key, content_hash(content), json.dumps(parsed, ensure_ascii=False))
+            )
+            self.conn.commit()
+
+    def parse(self, url, content, elements, optimize_headings, collect_links=False):
+        # Niezmieniona treść nie jest parsowana ponownie - zwracamy zapisany wynik
+        parsed = self.load_extraction(url, content, elements, optimize_headings, collect_links)
+        if parsed is None:
+            parsed = build_page_result(url, content, elements, optimize_headings, collect_links)
+            self.save_extraction(url, content, parsed, elements, optimize_headings, collect_links)
+        return parsed
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_page_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PageStore(data_path('page_store.sqlite'))
+        return _store
@@ -0,0 +1,284 @@
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from .config import get_secret
+from .fetching import get_session, http_get
+from .scheduler import MAX_BACKOFF, RetryableFetchError, TokenBucket, parse_retry_after
+from .storage import data_path
+
+
+PSI_API_URL = 'https://www.googleapis.com/pagespeedonline/v5/runPagespeed'
+PSI_STRATEGIES = ('mobile', 'desktop')
+# Test Lighthouse trwa zwykle od kilku do kilkudziesięciu sekund
+PSI_TIMEOUT = 120
+# Domyślny limit API to 240 zapytań na minutę na projekt; test trwa długo, więc limit
+# wykorzystujemy dopiero przy wielu zapytaniach w locie
+DEFAULT_PSI_REQUESTS_PER_MINUTE = 240
+DEFAULT_PSI_CONCURRENCY = 8
+PSI_MAX_RETRIES = 4
+# Przekroczenie limitu (429 albo 403 z takim powodem) wstrzymuje wszystkie wątki
+QUOTA_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+# Przejściowe błędy Lighthouse dotyczą jednego adresu - ponawia je tylko wątek, który je dostał
+TRANSIENT_PSI_STATUSES = {500, 502, 503, 504}
+PSI_TRANSIENT_RETRIES = 2
+TRANSIENT_RETRY_DELAY = 5.0
+
+PSI_METRICS = {
+    'first-contentful-paint': 'First Contentful Paint (FCP)',
+    'largest-contentful-paint': 'Largest Contentful Paint (LCP)',
+    'total-blocking-time': 'Total Blocking Time (TBT)',
+    'cumulative-layout-shift': 'Cumulative Layout Shift (CLS)',
+    'speed-index': 'Speed Index'
+}
+PERFORMANCE_COLUMN = 'Wynik wydajności'
+OPPORTUNITIES_COLUMN = 'Najważniejsze możliwości'
+PSI_COLUMNS = ['URL', 'Strategia', PERFORMANCE_COLUMN] + list(PSI_METRICS.values()) + [OPPORTUNITIES_COLUMN, 'Error']
+# Tyle możliwości optymalizacji (wg szacowanej oszczędności) trafia do wiersza wyników zbiorczych
+MAX_OPPORTUNITIES_IN_ROW = 3
+
+
+class PageSpeedError(Exception):
+    pass
+
+
+class PageSpeedQuotaError(RetryableFetchError):
+    pass
+
+
+def metric_category(score):
+    if score >= 0.9:
+        return 'Dobrze'
+    if score >= 0.5:
+        return 'Wymaga poprawy'
+    return 'Słabo'
+
+
+def summarize_pagespeed(data):
+    # Z odpowiedzi API (kilka MB, głównie zrzuty ekranu i szczegóły audytów) zostawiamy
+    # tylko to, co pokazujemy w interfejsie i przekazujemy do analizy AI
+    lighthouse_result = data.get('lighthouseResult', {})
+    audits = lighthouse_result.get('audits', {})
+    performance = lighthouse_result.get('categories', {}).get('performance', {})
+
+    metrics = {}
+    for audit_key, metric_name in PSI_METRICS.items():
+        audit = audits.get(audit_key, {})
+        score = audit.get('score') or 0
+        metrics[metric_name] = {
+            'display_value': audit.get('displayValue', ''),
+            'score': score,
+            'numeric_value': audit.get('numericValue', 0),
+            'category': metric_category(score),
+        }
+
+    opportunities = []
+    diagnostics = []
+    for audit in audits.values():
+        details = audit.get('details') or {}
+        entry = {
+            'title': audit.get('title'),
+            'description': audit.get('description'),
+            'display_value': audit.get('displayValue', ''),
+        }
+        if details.get('type') == 'opportunity':
+            entry['savings_ms'] = details.get('overallSavingsMs') or 0
+            opportunities.append(entry)
+        elif audit.get('scoreDisplayMode') == 'informative':
+            diagnostics.append(entry)
+    opportunities.sort(key=lambda entry: entry['savings_ms'], reverse=True)
+
+    return {
+        'performance_score': (performance.get('score') or 0) * 100,
+        'metrics': metrics,
+        'opportunities': opportunities,
+        'diagnostics': diagnostics,
+    }
+
+
+def _api_error(response):
+    # Komunikat i powód błędu z treści odpowiedzi API Google
+    try:
+        error = response.json().get('error', {})
+    except ValueError:
+        return f'HTTP {response.status_code}', None
+    reasons = [item.get('reason') for item in error.get('errors', [])]
+    return error.get('message') or f'HTTP {response.status_code}', reasons[0] if reasons else None
+
+
+def fetch_pagespeed(url, strategy='mobile', api_key=None, timeout=PSI_TIMEOUT):
+    params = {'url': url, 'strategy': strategy, 'category': 'performance'}
+    if api_key:
+        params['key'] = api_key
+    response = http_get(PSI_API_URL, params=params, timeout=timeout)
+    if response.status_code != 200:
+        message, reason = _api_error(response)
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if response.status_code == 429 or reason in QUOTA_REASONS:
+            raise PageSpeedQuotaError(message, retry_after)
+        if response.status_code in TRANSIENT_PSI_STATUSES:
+            raise RetryableFetchError(message, retry_after)
+        raise PageSpeedError(message)
+    return summarize_pagespeed(response.json())
+
+
+class RequestRateLimiter:
+    # Limit zapytań na minutę wspólny dla wszystkich wątków; po błędzie limitu wstrzymujemy wszystkie
+    def __init__(self, requests_per_minute):
+        self.bucket = TokenBucket(requests_per_minute / 60, capacity=max(requests_per_minute / 60, 1.0))
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait_time = max(self.paused_until - now, self.bucket.try_consume(now))
+                if wait_time <= 0:
+                    return
+            time.sleep(min(wait_time, 5.0))
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def quota_retry_delay(attempt, retry_after=None):
+    # Limit API jest minutowy, więc bez Retry-After czekamy od 15 s w górę
+    if retry_after is not None:
+        return min(retry_after, MAX_BACKOFF)
+    return min(15 * 2 ** (attempt - 1), MAX_BACKOFF)
+
+
+class PageSpeedCache:
+    # Skrócone wyniki PSI według adresu, strategii i dnia testu - ponowne uruchomienie tej samej
+    # listy (np. po przerwaniu) nie zużywa limitu API. Wyniki są ważne tylko w dniu testu,
+    # więc wpisy z wcześniejszych dni usuwamy przy otwarciu bazy
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS psi_results ('
+            'url TEXT NOT NULL, strategy TEXT NOT NULL, day TEXT NOT NULL, summary TEXT NOT NULL, '
+            'PRIMARY KEY (url, strategy, day))'
+        )
+        self.conn.execute('DELETE FROM psi_results WHERE day < ?', (datetime.date.today().isoformat(),))
+        self.conn.commit()
+
+    def get(self, url, strategy):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT summary FROM psi_results WHERE url = ? AND strategy = ? AND day = ?',
+                (url, strategy, datetime.date.today().isoformat())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, url, strategy, summary):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO psi_results (url, strategy, day, summary) VALUES (?, ?, ?, ?)',
+                (url, strategy, datetime.date.today().isoformat(), json.dumps(summary, ensure_ascii=False))
+            )
+            self.conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pagespeed_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageSpeedCache(data_path('pagespeed_cache.sqlite'))
+        return _cache
+
+
+def run_pagespeed(url, strategy='mobile', cache=None, limiter=None, api_key=None, max_retries=PSI_MAX_RETRIES):
+    # Skrócony wynik testu z cache dnia albo z API (z ponowieniami po przekroczeniu limitu
+    # i po przejściowych błędach Lighthouse)
+    cached = cache.get(url, strategy) if cache else None
+    if cached is not None:
+        return cached
+    api_key = api_key or get_secret('pagespeed_api_key')
+    quota_attempt = 0
+    transient_attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        try:
+            summary = fetch_pagespeed(url, strategy, api_key)
+            break
+        except PageSpeedQuotaError as e:
+            quota_attempt += 1
+            if quota_attempt > max_retries:
+                raise
+            delay = quota_retry_delay(quota_attempt, e.retry_after)
+            if limiter:
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
+        except RetryableFetchError as e:
+            # Błąd testu tej strony - pozostałe wątki pracują dalej
+            transient_attempt += 1
+            if transient_attempt > PSI_TRANSIENT_RETRIES:
+                raise
+            time.sleep(min(e.retry_after or TRANSIENT_RETRY_DELAY * transient_attempt, MAX_BACKOFF))
+    if cache:
+        cache.set(url, strategy, summary)
+    return summary
+
+
+def build_pagespeed_row(url, strategy, summary):
+    row = {'URL': url, 'Strategia': strategy, PERFORMANCE_COLUMN: round(summary['performance_score'])}
+    for metric_name, metric in summary['metrics'].items():
+        row[metric_name] = metric['display_value']
+    row[OPPORTUNITIES_COLUMN] = '; '.join(
+        f"{entry['title']} ({entry['display_value']})" if entry['display_value'] else entry['title']
+        for entry in summary['opportunities'][:MAX_OPPORTUNITIES_IN_ROW]
+    )
+    return row
+
+
+def iter_pagespeed_batch(urls, strategies=PSI_STRATEGIES, concurrency=DEFAULT_PSI_CONCURRENCY,
+                         requests_per_minute=DEFAULT_PSI_REQUESTS_PER_MINUTE, cache=None):
+    # Testy PSI dla listy adresów i strategii - kilka zapytań w locie w granicach limitu minutowego.
+    # Zwraca zwięzłe wiersze (PSI_COLUMNS) w kolejności ukończenia; pełne wyniki zostają w cache.
+    limiter = RequestRateLimiter(requests_per_minute)
+    api_key = get_secret('pagespeed_api_key')
+
+    def run(url, strategy):
+        try:
+            return build_pagespeed_row(url, strategy, run_pagespeed(url, strategy, cache, limiter, api_key))
+        except (requests.RequestException, RetryableFetchError, PageSpeedError, ValueError) as e:
+            return {'URL': url, 'Strategia': strategy, 'Error': str(e) or type(e).__name__}
+
+    get_session(pool_size=concurrency)
+    tasks = ((url, strategy) for url in urls for strategy in strategies)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < concurrency * 2:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(run, *task))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # Przerwana pętla (np. nowy przebieg skryptu Streamlit) nie czeka na trwające testy -
+        # ich wyniki i tak trafią do cache i zostaną użyte przy ponownym uruchomieniu
+        executor.shutdown(wait=False, cancel_futures=True)
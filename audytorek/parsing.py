@@ -0,0 +1,186 @@
+from urllib.parse import urljoin
+
+from lxml import etree
+import lxml.html
+
+from .dedupe import DUPLICATE_COLUMN, simhash
+from .structured_data import STRUCTURED_DATA_ELEMENT, extract_items, structured_data_columns, validate_items
+
+
+# Długość początku treści strony przekazywanego do generowania meta tagów
+META_CONTENT_LENGTH = 1000
+# Limit treści przekazywanej do optymalizacji nagłówków
+OPTIMIZATION_CONTENT_LENGTH = 5000
+
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+# Tekst tych elementów nie trafia do treści strony (tak samo jak w BeautifulSoup.get_text())
+SKIP_TEXT_TAGS = {'script', 'style', 'template'}
+# Klucz wiersza wyniku z odnośnikami strony - używany tylko przez crawl podążający za linkami
+LINKS_KEY = '_links'
+# Pola wiersza potrzebne tylko optymalizacji nagłówków - po crawlu trafiają z wiersza na dysk
+HEADINGS_PAYLOAD_FIELDS = ('content_for_optimization', 'existing_headings')
+# Klucz wiersza z adresem z <link rel="canonical"> (rozwiązanym jak odnośniki) - do sprawdzania linków
+CANONICAL_KEY = '_canonical'
+# Klucz wiersza z odciskiem SimHash treści strony - do wykrywania zbliżonych duplikatów
+FINGERPRINT_KEY = '_simhash'
+
+
+def _strip_join(chunks):
+    # Odpowiednik Tag.get_text(strip=True) - przycięte fragmenty sklejone bez separatora
+    return ''.join(chunk.strip() for chunk in chunks)
+
+
+def parse_html(content, structured_data=False):
+    # Jedno przejście po drzewie lxml zbiera wszystkie elementy potrzebne w audycie
+    # (z structured_data także bloki JSON-LD i elementy najwyższego poziomu Microdata/RDFa)
+    page = {
+        'h1': None,
+        'headings': [],
+        'title': None,
+        'meta_description': None,
+        'canonical': None,
+        'base': None,
+        'links': [],
+        'text': '',
+        'text_lines': [],
+        'json_ld': [],
+        'microdata': [],
+        'rdfa': [],
+    }
+    try:
+        root = lxml.html.document_fromstring(content)
+    except (etree.ParserError, ValueError):
+        # Pusty dokument - zwracamy stronę bez żadnych elementów
+        return page
+
+    chunks = []
+    headings = []  # [poziom, tekst] w kolejności dokumentu; tekst uzupełniamy przy zamknięciu nagłówka
+    open_headings = []  # (indeks w headings, indeks pierwszego fragmentu tekstu nagłówka)
+    title_start = None
+    skip_depth = 0
+
+    for event, el in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        tag = el.tag
+        if not isinstance(tag, str):
+            # Komentarze i instrukcje przetwarzania - pomijamy treść, ale nie tekst po nich
+            if not skip_depth and el.tail:
+                chunks.append(el.tail)
+            continue
+
+        if event == 'start':
+            if structured_data:
+                if tag == 'script' and el.get('type', '').split(';')[0].strip().lower() == 'application/ld+json':
+                    page['json_ld'].append(el.text or '')
+                elif el.get('itemscope') is not None and el.get('itemprop') is None:
+                    page['microdata'].append(el)
+                elif el.get('typeof') is not None and el.get('property') is None:
+                    page['rdfa'].append(el)
+
+            if tag in SKIP_TEXT_TAGS:
+                skip_depth += 1
+            elif tag in HEADING_TAGS:
+                open_headings.append((len(headings), len(chunks)))
+                headings.append([tag.upper(), ''])
+            elif tag == 'title' and page['title'] is None and title_start is None:
+                title_start = len(chunks)
+            elif tag == 'meta' and page['meta_description'] is None and el.get('name') == 'description':
+                page['meta_description'] = el.get('content', '').strip()
+            elif tag == 'link' and page['canonical'] is None and 'canonical' in el.get('rel', '').split():
+                page['canonical'] = el.get('href')
+            elif tag == 'a' and el.get('href'):
+                page['links'].append(el.get('href').strip())
+            elif tag == 'base' and page['base'] is None and el.get('href'):
+                page['base'] = el.get('href').strip()
+
+            if not skip_depth and el.text:
+                chunks.append(el.text)
+            continue
+
+        if tag in SKIP_TEXT_TAGS:
+            skip_depth -= 1
+        elif tag in HEADING_TAGS and open_headings:
+            index, start = open_headings.pop()
+            headings[index][1] = _strip_join(chunks[start:])
+        elif tag == 'title' and title_start is not None and page['title'] is None:
+            page['title'] = _strip_join(chunks[title_start:])
+
+        if not skip_depth and el.tail:
+            chunks.append(el.tail)
+
+    page['headings'] = [(level, text) for level, text in headings]
+    page['h1'] = next((text for level, text in page['headings'] if level == 'H1'), None)
+    page['text'] = ''.join(chunks)
+    page['text_lines'] = [line for line in (chunk.strip() for chunk in chunks) if line]
+    return page
+
+
+def parse_structured_data(content, expected_type=None):
+    # Dane strukturalne pojedynczej strony: (elementy, błędy, ostrzeżenia) - np. dla zakładki Dane strukturalne
+    page = parse_html(content, structured_data=True)
+    items, errors = extract_items(page['json_ld'], page['microdata'], page['rdfa'])
+    validation_errors, warnings = validate_items(items, expected_type)
+    return items, list(dict.fromkeys(errors)) + validation_errors, warnings
+
+
+def _resolve_links(url, base, hrefs):
+    try:
+        base = urljoin(url, base) if base else url
+    except ValueError:
+        base = url
+    links = []
+    for href in hrefs:
+        try:
+            links.append(urljoin(base, href))
+        except ValueError:
+            # Niepoprawny adres (np. uszkodzony IPv6) - pomijamy odnośnik
+            continue
+    return links
+
+
+def build_page_result(url, content, elements, optimize_headings, collect_links=False):
+    # Funkcja bez efektów ubocznych (bez AI i Streamlit), dzięki czemu może działać w osobnym procesie.
+    # Zwraca wiersz wyniku oraz początek treści strony potrzebny do generowania meta tagów.
+    page = parse_html(content, structured_data=STRUCTURED_DATA_ELEMENT in elements)
+    result = {'URL': url}
+
+    for element in elements:
+        if element == 'H1':
+            result['H1'] = page['h1'] or ''
+        elif element == 'Wszystkie nagłówki':
+            result['Wszystkie nagłówki'] = '\n'.join(f"{level}: {text}" for level, text in page['headings'])
+        elif element == 'Meta title':
+            result['Meta title'] = page['title'] or ''
+        elif element == 'Meta description':
+            result['Meta description'] = page['meta_description'] or ''
+        elif element == 'Canonical':
+            if page['canonical'] is not None:
+                if page['canonical'] == url:
+                    result['Canonical'] = 'self reference'
+                else:
+                    result['Canonical'] = 'other'
+            else:
+                result['Canonical'] = 'brak'
+        elif element == STRUCTURED_DATA_ELEMENT:
+            result.update(structured_data_columns(page['json_ld'], page['microdata'], page['rdfa']))
+
+    # Jeśli optymalizacja nagłówków jest włączona, zbieramy dane
+    if optimize_headings:
+        content = '\n'.join(page['text_lines'])
+        result['content_for_optimization'] = content[:OPTIMIZATION_CONTENT_LENGTH]
+        result['existing_headings'] = [{'level': level, 'text': text} for level, text in page['headings']]
+
+    # Odcisk treści do grupowania zbliżonych duplikatów (np. paginacji i wariantów z parametrami) -
+    # liczony tylko, gdy wykrywanie duplikatów jest wybrane w audycie
+    if DUPLICATE_COLUMN in elements:
+        fingerprint = simhash(' '.join(page['text_lines']))
+        if fingerprint is not None:
+            result[FINGERPRINT_KEY] = fingerprint
+
+    # Odnośniki rozwiązujemy względem <base href>, jeśli strona go ustawia
+    if collect_links:
+        result[LINKS_KEY] = _resolve_links(url, page['base'], page['links'])
+        canonical = _resolve_links(url, page['base'], [page['canonical']] if page['canonical'] else [])
+        if canonical:
+            result[CANONICAL_KEY] = canonical[0]
+
+    return result, page['text'][:META_CONTENT_LENGTH]
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .metrics import METRICS_KEY, StageTimer, new_page_metrics
+from .scheduler import RetryableFetchError
+
+
+DEFAULT_IO_WORKERS = 10
+
+_DONE = object()
+
+
+def default_parse_workers():
+    return os.cpu_count() or 1
+
+
+def iter_crawl_pipelined(urls, download, parse_page, finalize=None, io_workers=DEFAULT_IO_WORKERS,
+                         parse_workers=None, queue_size=None, scheduler=None, load_parsed=None, save_parsed=None):
+    # Potok dwuetapowy: wątki I/O pobierają surowe bajty do ograniczonej kolejki, a procesy
+    # parsujące (po jednym na rdzeń) zamieniają je w wiersze wyników. Pełna kolejka wstrzymuje
+    # pobieranie, więc w pamięci nigdy nie czeka więcej niż `queue_size` nieprzetworzonych stron.
+    # load_parsed(url, content) zwraca zapisany wynik parsowania (np. z magazynu stron) - takie strony
+    # omijają procesy parsujące, a nowe wyniki trafiają z powrotem przez save_parsed(url, content, parsed).
+    parse_workers = parse_workers or default_parse_workers()
+    queue_size = queue_size or parse_workers * 4
+    raw_pages = queue.Queue(maxsize=queue_size)
+    results = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    errors = []
+
+    url_iter = iter(urls)
+    url_lock = threading.Lock()
+
+    def put(target, item):
+        while not stop_event.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def next_url():
+        with url_lock:
+            return next(url_iter, None)
+
+    def download_with_retries(url):
+        # Zwraca treść i pomiary ostatniej próby (z liczbą wcześniejszych ponowień)
+        attempt = 0
+        while True:
+            metrics = new_page_metrics()
+            metrics['retries'] = attempt
+            try:
+                return download(url, metrics=metrics), metrics
+            except RetryableFetchError as e:
+                attempt += 1
+                if scheduler is None or attempt > scheduler.max_retries:
+                    raise
+                time.sleep(scheduler.retry_delay(attempt, e.retry_after))
+
+    def io_worker():
+        while not stop_event.is_set():
+            url = next_url()
+            if url is None:
+                return
+            try:
+                content, metrics = download_with_retries(url)
+                parsed = None
+                if load_parsed:
+                    with StageTimer(metrics, 'parse'):
+                        parsed = load_parsed(url, content)
+            except Exception as e:
+                put(results, {'URL': url, 'Error': str(e)})
+                continue
+            put(raw_pages, (url, content, metrics, parsed))
+
+    def parse_driver(pool):
+        # Wątek sterujący czeka na wynik procesu bez trzymania GIL, a etap końcowy
+        # (np. generowanie meta tagów przez AI) wykonuje już poza procesami parsującymi
+        while not stop_event.is_set():
+            try:
+                item = raw_pages.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            url, content, metrics, parsed = item
+            try:
+                if parsed is None:
+                    with StageTimer(metrics, 'parse'):
+                        parsed = pool.submit(parse_page, url, content).result()
+                    if save_parsed:
+                        save_parsed(url, content, parsed)
+                result = finalize(parsed, metrics=metrics) if finalize else parsed
+            except Exception as e:
+                result = {'URL': url, 'Error': str(e)}
+            result[METRICS_KEY] = metrics
+            put(results, result)
+
+    def run():
+        io_threads = [threading.Thread(target=io_worker, daemon=True) for _ in range(io_workers)]
+        # Przy etapie końcowym z AI potrzeba więcej wątków sterujących niż procesów,
+        # żeby czekanie na odpowiedź modelu nie blokowało parserów
+        drivers_count = parse_workers + (io_workers if finalize else 0)
+        try:
+            # 'spawn' - proces Streamlit ma wiele wątków, więc fork mógłby skopiować zajęte blokady
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=parse_workers, mp_context=context) as pool:
+                drivers = [threading.Thread(target=parse_driver, args=(pool,), daemon=True)
+                           for _ in range(drivers_count)]
+                for thread in io_threads + drivers:
+                    thread.start()
+                for thread in io_threads:
+                    thread.join()
+                for _ in drivers:
+                    put(raw_pages, _DONE)
+                for thread in drivers:
+                    thread.join()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(results, _DONE)
+
+    coordinator = threading.Thread(target=run, name='audytorek-pipeline', daemon=True)
+    coordinator.start()
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        stop_event.set()
+        coordinator.join()
+
+    if errors:
+        raise errors[0]
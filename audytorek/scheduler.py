@@ -0,0 +1,183 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+# Odpowiedzi, po których zwalniamy i ponawiamy zapytanie zamiast zapisywać błąd
+RETRYABLE_STATUSES = {429, 503}
+
+DEFAULT_MAX_RETRIES = 3
+# Czasy odpowiedzi wygładzamy dwiema średnimi: szybką (bieżące opóźnienie) i wolną (kroczące odniesienie)
+FAST_LATENCY_WEIGHT = 0.2
+BASELINE_LATENCY_WEIGHT = 0.02
+# Host uznajemy za przeciążony, gdy bieżące opóźnienie przekracza odniesienie tyle razy
+# przez SLOW_SAMPLES kolejnych odpowiedzi - pojedyncze wahania czasu odpowiedzi nie spowalniają crawla
+LATENCY_TOLERANCE = 2.0
+SLOW_SAMPLES = 5
+MAX_BACKOFF = 60.0
+
+
+class RetryableFetchError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    # Retry-After może zawierać liczbę sekund albo datę HTTP
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, now, amount=1.0):
+        # Zwraca 0, jeśli token został pobrany, w przeciwnym razie czas oczekiwania na brakujące tokeny
+        self.refill(now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class HostState:
+    def __init__(self, concurrency):
+        # Limit tempa (kubełek) pojawia się dopiero po pierwszym sygnale przeciążenia hosta
+        self.bucket = None
+        self.concurrency = float(concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.latency = None
+        self.baseline_latency = None
+        self.slow_samples = 0
+
+
+class PoliteScheduler:
+    # Zdrowy host od początku dostaje pełną skonfigurowaną współbieżność; zwalniamy dopiero po 429/503,
+    # timeoutach albo utrzymującym się wzroście czasu odpowiedzi względem kroczącego odniesienia
+    def __init__(self, initial_rate=5.0, max_rate=50.0, min_rate=0.2, max_concurrency=10,
+                 max_retries=DEFAULT_MAX_RETRIES, rate_step=0.1):
+        self.initial_rate = initial_rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.rate_step = rate_step
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _host_state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = HostState(self.max_concurrency)
+            self.hosts[host] = state
+        return state
+
+    def try_acquire(self, url):
+        host = urlparse(url).netloc
+        now = time.monotonic()
+        with self.lock:
+            state = self._host_state(host)
+            if now < state.blocked_until:
+                return state.blocked_until - now
+            if state.in_flight >= int(state.concurrency):
+                # Czekamy na zwolnienie slotu przez inne zapytanie do tego hosta
+                return 0.05
+            if state.bucket is not None:
+                wait = state.bucket.try_consume(now)
+                if wait:
+                    return wait
+            state.in_flight += 1
+            return 0.0
+
+    def acquire(self, url):
+        while True:
+            wait = self.try_acquire(url)
+            if not wait:
+                return
+            time.sleep(min(wait, 1.0))
+
+    async def acquire_async(self, url):
+        while True:
+            wait = self.try_acquire(url)
+            if not wait:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def release(self, url, latency, status=None, retry_after=None, timed_out=False):
+        host = urlparse(url).netloc
+        now = time.monotonic()
+        with self.lock:
+            state = self._host_state(host)
+            state.in_flight = max(state.in_flight - 1, 0)
+
+            if timed_out or status in RETRYABLE_STATUSES:
+                self._back_off(state, now, retry_after)
+                return
+
+            if state.latency is None:
+                state.latency = state.baseline_latency = latency
+            else:
+                state.latency += FAST_LATENCY_WEIGHT * (latency - state.latency)
+                state.baseline_latency += BASELINE_LATENCY_WEIGHT * (latency - state.baseline_latency)
+
+            if state.latency > state.baseline_latency * LATENCY_TOLERANCE:
+                state.slow_samples += 1
+                if state.slow_samples >= SLOW_SAMPLES:
+                    # Opóźnienie rośnie od kilku odpowiedzi - łagodnie zmniejszamy współbieżność
+                    state.concurrency = max(state.concurrency * 0.75, 1.0)
+                    state.slow_samples = 0
+                return
+
+            # Host odpowiada jak zwykle - addytywnie wracamy do pełnej współbieżności i tempa
+            state.slow_samples = 0
+            state.concurrency = min(state.concurrency + 1 / state.concurrency, self.max_concurrency)
+            bucket = state.bucket
+            if bucket is not None:
+                bucket.rate += self.rate_step
+                bucket.capacity = max(bucket.rate, 1.0)
+                if bucket.rate >= self.max_rate:
+                    state.bucket = None
+
+    def _back_off(self, state, now, retry_after):
+        # Multiplikatywne zmniejszenie współbieżności i tempa, a przy Retry-After pauza dla całego hosta
+        if state.bucket is None:
+            # Pierwszy sygnał - limit tempa zaczyna się od połowy dotychczasowej przepustowości hosta
+            throughput = state.concurrency / state.latency if state.latency else self.initial_rate
+            rate = min(max(throughput / 2, self.min_rate), self.max_rate)
+            state.bucket = TokenBucket(rate, capacity=max(rate, 1.0))
+        else:
+            bucket = state.bucket
+            bucket.rate = max(bucket.rate / 2, self.min_rate)
+            bucket.capacity = max(bucket.rate, 1.0)
+            bucket.tokens = min(bucket.tokens, bucket.capacity)
+        state.concurrency = max(state.concurrency / 2, 1.0)
+        state.slow_samples = 0
+        pause = retry_after if retry_after is not None else 1.0 / state.bucket.rate
+        state.blocked_until = max(state.blocked_until, now + pause)
+
+    def retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF)
+        # Wykładniczy backoff z losowym rozrzuceniem, żeby ponowienia nie przychodziły falą
+        return min(2 ** (attempt - 1), MAX_BACKOFF) * (0.5 + random.random())
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import io
+import itertools
+import queue
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .fetching import get_session
+
+
+DEFAULT_SITEMAP_WORKERS = 8
+DEFAULT_SITEMAP_TIMEOUT = 30
+GZIP_MAGIC = b'\x1f\x8b'
+UTF8_BOM = b'\xef\xbb\xbf'
+READ_CHUNK_SIZE = 64 * 1024
+
+_DONE = object()
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def url_fingerprint(url):
+    # 8-bajtowy skrót zamiast całego napisu - zbiór odwiedzonych URL-i zajmuje kilka razy mniej pamięci
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class _ChunkStream(io.RawIOBase):
+    # Obiekt plikowy nad iteratorem fragmentów odpowiedzi HTTP
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self.buffer:
+            self.buffer = next(self.chunks, b'')
+            if not self.buffer:
+                return 0
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def _open_sitemap(url, timeout):
+    response = get_session().get(url, stream=True, timeout=timeout)
+    response.raise_for_status()
+    # Content-Encoding (np. gzip z serwera) dekoduje iter_content, plik .xml.gz rozpakowujemy sami w locie
+    stream = io.BufferedReader(_ChunkStream(response.iter_content(chunk_size=READ_CHUNK_SIZE)))
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=stream))
+    return response, stream
+
+
+def _iter_text_entries(chunks):
+    # Sitemapa w formie zwykłego tekstu - jeden URL na linię
+    stream = io.BufferedReader(_ChunkStream(chunk for chunk in chunks if chunk))
+    for line in io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace'):
+        if line.strip():
+            yield 'url', line.strip()
+
+
+def iter_sitemap_entries(url, timeout=DEFAULT_SITEMAP_TIMEOUT):
+    # Zwraca pary ('sitemap' | 'url', adres) bez budowania całego drzewa dokumentu w pamięci
+    response, stream = _open_sitemap(url, timeout)
+    with response:
+        chunks = iter(partial(stream.read, READ_CHUNK_SIZE), b'')
+        head = stream.peek(64)
+        if head.startswith(UTF8_BOM):
+            head = head[len(UTF8_BOM):]
+        if not head.lstrip().startswith(b'<'):
+            yield from _iter_text_entries(chunks)
+            return
+
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        # Fragmenty wczytane przed pierwszym zdarzeniem - gdy plik jednak nie jest XML-em, czytamy je jako tekst
+        consumed = []
+        kind = 'url'
+        root = None
+        for chunk in itertools.chain(chunks, [None]):
+            try:
+                if chunk is None:
+                    parser.close()
+                else:
+                    if consumed is not None:
+                        consumed.append(chunk)
+                    parser.feed(chunk)
+                for event, elem in parser.read_events():
+                    consumed = None
+                    if event == 'start':
+                        if root is None:
+                            root = elem
+                            kind = 'sitemap' if _local_name(elem.tag) == 'sitemapindex' else 'url'
+                        continue
+                    name = _local_name(elem.tag)
+                    if name == 'loc' and elem.text and elem.text.strip():
+                        yield kind, elem.text.strip()
+                    elif name in ('url', 'sitemap'):
+                        # Czyścimy przetworzone wpisy, żeby pamięć nie rosła z rozmiarem pliku
+                        elem.clear()
+                        root.clear()
+            except ET.ParseError:
+                if consumed is None:
+                    raise
+                yield from _iter_text_entries(itertools.chain(consumed, chunks))
+                return
+
+
+def iter_sitemap_urls(sitemap_url, max_workers=DEFAULT_SITEMAP_WORKERS, timeout=DEFAULT_SITEMAP_TIMEOUT,
+                      on_error=None):
+    # Rekurencyjnie przechodzi indeksy sitemap, pobierając pliki podrzędne równolegle.
+    # URL-e są zwracane leniwie i bez powtórzeń, więc crawl może ruszyć przed wczytaniem całości.
+    found = queue.Queue(maxsize=10000)
+    stop_event = threading.Event()
+    lock = threading.Lock()
+    seen_sitemaps = set()
+    state = {'pending': 0}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                found.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def submit(url):
+        with lock:
+            if url in seen_sitemaps:
+                return
+            seen_sitemaps.add(url)
+            state['pending'] += 1
+        executor.submit(process, url)
+
+    def process(url):
+        try:
+            for kind, loc in iter_sitemap_entries(url, timeout):
+                if stop_event.is_set():
+                    return
+                if kind == 'sitemap':
+                    submit(loc)
+                else:
+                    put(loc)
+        except Exception as e:
+            put((url, e))
+        finally:
+            with lock:
+                state['pending'] -= 1
+                finished = state['pending'] == 0
+            if finished:
+                put(_DONE)
+
+    submit(sitemap_url)
+    seen_urls = set()
+    try:
+        while True:
+            item = found.get()
+            if item is _DONE:
+                break
+            if isinstance(item, tuple):
+                if on_error:
+                    on_error(*item)
+                continue
+            fingerprint = url_fingerprint(item)
+            if fingerprint in seen_urls:
+                continue
+            seen_urls.add(fingerprint)
+            yield item
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
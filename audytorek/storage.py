@@ -0,0 +1,10 @@
+import os
+
+
+# Katalog na trwałe dane crawlera (cache AI, magazyn stron, checkpointy) - można go zmienić zmienną środowiskową
+DATA_DIR = os.environ.get('AUDYTOREK_DATA_DIR', os.path.join(os.path.expanduser('~'), '.audytorek'))
+
+
+def data_path(name):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
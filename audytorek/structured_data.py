@@ -0,0 +1,266 @@
+import json
+import re
+
+
+# Element audytu z lokalną walidacją danych strukturalnych (JSON-LD, Microdata, RDFa) w przejściu parsowania
+STRUCTURED_DATA_ELEMENT = 'Dane strukturalne'
+TYPES_COLUMN = 'Typy danych strukturalnych'
+ERRORS_COLUMN = 'Błędy danych strukturalnych'
+WARNINGS_COLUMN = 'Ostrzeżenia danych strukturalnych'
+STRUCTURED_DATA_COLUMNS = [TYPES_COLUMN, ERRORS_COLUMN, WARNINGS_COLUMN]
+# Kolumna z rekomendacjami AI - jedno wywołanie modelu na unikalny zestaw problemów
+RECOMMENDATIONS_COLUMN = 'Rekomendacje AI dla danych strukturalnych'
+NO_STRUCTURED_DATA = 'Brak danych strukturalnych na stronie.'
+
+FORMAT_JSON_LD = 'JSON-LD'
+FORMAT_MICRODATA = 'Microdata'
+FORMAT_RDFA = 'RDFa'
+
+# Wymagane i zalecane właściwości typów (wg dokumentacji wyników rozszerzonych Google).
+# Krotka wśród wymaganych oznacza, że wystarczy jedna z podanych właściwości.
+TYPE_RULES = {
+    'Article': (['headline'], ['author', 'datePublished', 'dateModified', 'image', 'publisher']),
+    'Product': (['name', ('offers', 'review', 'aggregateRating')], ['image', 'description', 'brand', 'sku']),
+    'Offer': ([('price', 'priceSpecification'), 'priceCurrency'], ['availability', 'url']),
+    'AggregateOffer': (['lowPrice', 'priceCurrency'], ['highPrice', 'offerCount']),
+    'AggregateRating': (['ratingValue', ('ratingCount', 'reviewCount')], ['bestRating']),
+    'Review': (['author', 'reviewRating'], ['datePublished']),
+    'Rating': (['ratingValue'], ['bestRating']),
+    'Service': (['name'], ['description', 'provider', 'serviceType', 'areaServed', 'offers']),
+    'Organization': (['name'], ['url', 'logo', 'sameAs']),
+    'LocalBusiness': (['name', 'address'], ['telephone', 'url', 'image', 'openingHoursSpecification', 'geo',
+                                            'priceRange']),
+    'PostalAddress': ([], ['streetAddress', 'addressLocality', 'postalCode', 'addressCountry']),
+    'Person': (['name'], ['url']),
+    'WebSite': (['name', 'url'], []),
+    'BreadcrumbList': (['itemListElement'], []),
+    'ListItem': (['position'], ['name', ('item', 'url')]),
+    'FAQPage': (['mainEntity'], []),
+    'Question': (['name', 'acceptedAnswer'], []),
+    'Answer': (['text'], []),
+    'Event': (['name', 'startDate', 'location'], ['endDate', 'eventStatus', 'description', 'image', 'offers',
+                                                  'organizer']),
+    'Recipe': (['name', 'image'], ['author', 'datePublished', 'description', 'recipeIngredient',
+                                   'recipeInstructions', 'totalTime']),
+    'HowTo': (['name', 'step'], ['image', 'totalTime']),
+    'VideoObject': (['name', 'thumbnailUrl', 'uploadDate'], ['description', 'contentUrl', 'duration']),
+    'JobPosting': (['title', 'description', 'datePosted', 'hiringOrganization', 'jobLocation'],
+                   ['validThrough', 'employmentType', 'baseSalary']),
+}
+# Podtypy schema.org sprawdzane regułami typu nadrzędnego
+TYPE_PARENTS = {
+    'NewsArticle': 'Article', 'BlogPosting': 'Article', 'TechArticle': 'Article', 'ScholarlyArticle': 'Article',
+    'Report': 'Article', 'SocialMediaPosting': 'Article',
+    'ProductGroup': 'Product', 'IndividualProduct': 'Product', 'ProductModel': 'Product', 'Vehicle': 'Product',
+    'Car': 'Product',
+    'FinancialProduct': 'Service', 'GovernmentService': 'Service', 'BroadcastService': 'Service',
+    'Corporation': 'Organization', 'NGO': 'Organization', 'OnlineStore': 'Organization',
+    'EducationalOrganization': 'Organization',
+    'Store': 'LocalBusiness', 'ProfessionalService': 'LocalBusiness', 'FoodEstablishment': 'LocalBusiness',
+    'Restaurant': 'LocalBusiness', 'LodgingBusiness': 'LocalBusiness', 'Hotel': 'LocalBusiness',
+    'MedicalBusiness': 'LocalBusiness', 'Dentist': 'LocalBusiness', 'HealthAndBeautyBusiness': 'LocalBusiness',
+    'AutomotiveBusiness': 'LocalBusiness', 'LegalService': 'LocalBusiness', 'FinancialService': 'LocalBusiness',
+    'RealEstateAgent': 'LocalBusiness', 'HomeAndConstructionBusiness': 'LocalBusiness',
+    'EmployerAggregateRating': 'AggregateRating',
+    'BusinessEvent': 'Event', 'MusicEvent': 'Event', 'SportsEvent': 'Event', 'EducationEvent': 'Event',
+    'Festival': 'Event',
+}
+# Właściwości z datą w formacie ISO 8601 i z liczbą (Google nie akceptuje przecinka dziesiętnego)
+DATE_PROPERTIES = {'datePublished', 'dateModified', 'uploadDate', 'startDate', 'endDate', 'datePosted',
+                   'validThrough', 'priceValidUntil'}
+NUMERIC_PROPERTIES = {'price', 'lowPrice', 'highPrice', 'ratingValue', 'ratingCount', 'reviewCount', 'bestRating',
+                      'worstRating'}
+ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?$')
+NUMBER_RE = re.compile(r'^-?\d+(\.\d+)?$')
+
+# Atrybuty Microdata z adresem albo wartością zamiast tekstu elementu
+MICRODATA_URL_ATTRIBUTES = {
+    'a': 'href', 'area': 'href', 'link': 'href', 'img': 'src', 'audio': 'src', 'video': 'src', 'source': 'src',
+    'embed': 'src', 'iframe': 'src', 'track': 'src', 'object': 'data',
+}
+MICRODATA_VALUE_ATTRIBUTES = {'meta': 'content', 'time': 'datetime', 'data': 'value', 'meter': 'value'}
+
+
+def _compile_rules():
+    # Reguły podtypów rozwinięte z góry - przy walidacji jedno wyszukanie w słowniku na typ
+    rules = {}
+    for type_name, (required, recommended) in TYPE_RULES.items():
+        rules[type_name] = (
+            tuple(tuple(entry) if isinstance(entry, tuple) else (entry,) for entry in required),
+            tuple(tuple(entry) if isinstance(entry, tuple) else (entry,) for entry in recommended),
+        )
+    for type_name, parent in TYPE_PARENTS.items():
+        rules[type_name] = rules[parent]
+    return rules
+
+
+COMPILED_RULES = _compile_rules()
+
+
+def short_type(type_name):
+    # 'https://schema.org/Product' i 'schema:Product' -> 'Product'
+    return type_name.strip().rsplit('/', 1)[-1].rsplit('#', 1)[-1].rsplit(':', 1)[-1]
+
+
+def item_types(item):
+    types = item.get('@type')
+    if isinstance(types, str):
+        types = types.split()
+    elif not isinstance(types, list):
+        return []
+    return [short_type(type_name) for type_name in types if isinstance(type_name, str) and type_name.strip()]
+
+
+def is_type(item, type_name):
+    return any(name == type_name or TYPE_PARENTS.get(name) == type_name for name in item_types(item))
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _is_present(item, prop):
+    return any(value not in (None, '', [], {}) for value in _as_list(item.get(prop)))
+
+
+def _json_ld_items(text):
+    # Elementy najwyższego poziomu bloku JSON-LD (z rozwinięciem @graph) oraz błędy bloku
+    text = text.strip()
+    if text.startswith('<!--'):
+        text = text[4:].rsplit('-->', 1)[0]
+    try:
+        data = json.loads(text.strip().rstrip(';'), strict=False)
+    except ValueError as e:
+        return [], [f'Niepoprawny JSON w bloku JSON-LD: {getattr(e, "msg", e)}']
+    items = []
+    errors = []
+    for block in _as_list(data):
+        if not isinstance(block, dict):
+            continue
+        if '@context' not in block:
+            errors.append('Blok JSON-LD bez @context')
+        graph = block.get('@graph')
+        for item in (graph if isinstance(graph, list) else [block]):
+            if isinstance(item, dict):
+                items.append(item)
+    return items, errors
+
+
+def _microdata_value(el):
+    attribute = MICRODATA_URL_ATTRIBUTES.get(el.tag) or MICRODATA_VALUE_ATTRIBUTES.get(el.tag)
+    if attribute and el.get(attribute) is not None:
+        return el.get(attribute).strip()
+    return el.text_content().strip()
+
+
+def _collect_properties(el, item, scope_attribute, property_attribute, build_item, read_value):
+    # Właściwości elementu (Microdata: itemscope/itemprop, RDFa: typeof/property) w postaci słownika
+    # jak w JSON-LD; zagnieżdżony element z własnym typem staje się zagnieżdżonym obiektem
+    for child in el.iterchildren():
+        if not isinstance(child.tag, str):
+            continue
+        names = child.get(property_attribute)
+        nested = child.get(scope_attribute) is not None
+        if names:
+            value = build_item(child) if nested else read_value(child)
+            for name in names.split():
+                item.setdefault(short_type(name), []).append(value)
+        if not nested:
+            _collect_properties(child, item, scope_attribute, property_attribute, build_item, read_value)
+
+
+def _collapse(item):
+    return {key: value[0] if isinstance(value, list) and len(value) == 1 else value for key, value in item.items()}
+
+
+def microdata_item(el):
+    item = {'@type': el.get('itemtype', '')}
+    _collect_properties(el, item, 'itemscope', 'itemprop', microdata_item, _microdata_value)
+    return _collapse(item)
+
+
+def _rdfa_value(el):
+    for attribute in ('content', 'href', 'src', 'resource'):
+        if el.get(attribute) is not None:
+            return el.get(attribute).strip()
+    return el.text_content().strip()
+
+
+def rdfa_item(el):
+    item = {'@type': el.get('typeof', '')}
+    _collect_properties(el, item, 'typeof', 'property', rdfa_item, _rdfa_value)
+    return _collapse(item)
+
+
+def extract_items(json_ld, microdata, rdfa):
+    # (format, element) dla danych strukturalnych strony oraz błędy ekstrakcji;
+    # json_ld - treści skryptów, microdata i rdfa - elementy lxml najwyższego poziomu
+    items = []
+    errors = []
+    for text in json_ld:
+        block_items, block_errors = _json_ld_items(text)
+        items.extend((FORMAT_JSON_LD, item) for item in block_items)
+        errors.extend(block_errors)
+    items.extend((FORMAT_MICRODATA, microdata_item(el)) for el in microdata)
+    items.extend((FORMAT_RDFA, rdfa_item(el)) for el in rdfa)
+    return items, errors
+
+
+def _validate(item, label, errors, warnings):
+    for type_name in item_types(item):
+        required, recommended = COMPILED_RULES.get(type_name, ((), ()))
+        for alternatives in required:
+            if not any(_is_present(item, prop) for prop in alternatives):
+                errors.append(f"{label}: brak wymaganej właściwości {' lub '.join(alternatives)}")
+        for alternatives in recommended:
+            if not any(_is_present(item, prop) for prop in alternatives):
+                warnings.append(f"{label}: brak zalecanej właściwości {' lub '.join(alternatives)}")
+
+    for prop, values in item.items():
+        if prop.startswith('@'):
+            continue
+        for value in _as_list(values):
+            if isinstance(value, dict):
+                if item_types(value):
+                    _validate(value, f'{label}.{prop}', errors, warnings)
+            elif prop in DATE_PROPERTIES and isinstance(value, str) and not ISO_DATE_RE.match(value.strip()):
+                errors.append(f'{label}: niepoprawny format {prop} (oczekiwano daty ISO 8601)')
+            elif (prop in NUMERIC_PROPERTIES and not isinstance(value, (int, float))
+                  and not NUMBER_RE.match(str(value).strip())):
+                errors.append(f'{label}: niepoprawny format {prop} (oczekiwano liczby z kropką dziesiętną)')
+
+
+def validate_items(items, expected_type=None):
+    # Lokalna walidacja bez wywołań AI; komunikaty nie zawierają adresu ani wartości ze strony,
+    # więc strony z tego samego szablonu mają identyczny zestaw problemów
+    errors = []
+    warnings = []
+    for item_format, item in items:
+        types = item_types(item)
+        if not types:
+            errors.append(f'{item_format}: element bez typu (@type)')
+            continue
+        _validate(item, '/'.join(types), errors, warnings)
+    if expected_type and not any(is_type(item, expected_type) for _, item in items):
+        errors.append(f'Brak danych typu {expected_type}')
+    return list(dict.fromkeys(errors)), list(dict.fromkeys(warnings))
+
+
+def structured_data_columns(json_ld, microdata, rdfa):
+    items, errors = extract_items(json_ld, microdata, rdfa)
+    if not items and not errors:
+        return {TYPES_COLUMN: '', ERRORS_COLUMN: NO_STRUCTURED_DATA, WARNINGS_COLUMN: ''}
+    validation_errors, warnings = validate_items(items)
+    types = dict.fromkeys(f"{'/'.join(item_types(item)) or '?'} ({item_format})" for item_format, item in items)
+    return {
+        TYPES_COLUMN: ', '.join(types),
+        ERRORS_COLUMN: '\n'.join(list(dict.fromkeys(errors)) + validation_errors),
+        WARNINGS_COLUMN: '\n'.join(warnings),
+    }
+
+
+def failure_signature(result):
+    # Strony z tym samym zestawem typów i problemów dostają jedną wspólną rekomendację AI
+    if not result.get(ERRORS_COLUMN) and not result.get(WARNINGS_COLUMN):
+        return None
+    return result.get(TYPES_COLUMN, ''), result.get(ERRORS_COLUMN, ''), result.get(WARNINGS_COLUMN, '')
@@ -0,0 +1,451 @@
+import argparse
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Benchmark crawlera na lokalnej, generowanej stronie. Każdy scenariusz działa w osobnym procesie
+# (czysty pomiar CPU i szczytowego RSS), a serwer strony i atrapa OpenAI - w jeszcze innym.
+#
+#   python benchmark.py --pages 2000 --latency-ms 20 --save --compare
+
+SCENARIOS = ('parse', 'sitemap', 'crawl-threads', 'crawl-async', 'crawl-pipeline', 'crawl-ai', 'menu')
+DEFAULT_HISTORY = 'benchmark_history.jsonl'
+URLS_PER_SITEMAP = 1000
+WORDS = (
+    'audyt seo strona treść nagłówek meta opis produkt oferta usługa kategoria blog artykuł klient '
+    'wyszukiwarka pozycja link indeksowanie robot sitemapa szybkość wydajność analiza raport'
+).split()
+
+
+def generate_page(i, config):
+    # Deterministyczna strona o zadanym rozmiarze i gęstości nagłówków
+    rnd = random.Random(config['seed'] * 1000003 + i)
+    target = config['page_size_kb'] * 1024
+    headings_every = max(int(1024 / config['headings_per_kb']), 200) if config['headings_per_kb'] else None
+    parts = [
+        '<!DOCTYPE html><html><head>',
+        f'<title>Strona {i} - {" ".join(rnd.choices(WORDS, k=5))}</title>',
+        f'<meta name="description" content="{" ".join(rnd.choices(WORDS, k=20))}">',
+        f'<link rel="canonical" href="/page/{i}.html">',
+        '</head><body>',
+        f'<h1>{" ".join(rnd.choices(WORDS, k=6))}</h1>',
+    ]
+    size = sum(len(part) for part in parts)
+    since_heading = 0
+    while size < target:
+        if headings_every and since_heading >= headings_every:
+            level = rnd.choice((2, 2, 3, 3, 4))
+            part = f'<h{level}>{" ".join(rnd.choices(WORDS, k=4))}</h{level}>'
+            since_heading = 0
+        else:
+            links = ''.join(
+                f' <a href="/page/{rnd.randrange(config["pages"])}.html">{rnd.choice(WORDS)}</a>' for _ in range(2)
+            )
+            part = f'<p>{" ".join(rnd.choices(WORDS, k=40))}{links}</p>'
+        parts.append(part)
+        size += len(part)
+        since_heading += len(part)
+    parts.append('</body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def generate_menu_page(config):
+    rnd = random.Random(config['seed'])
+    items = []
+    for i in range(config['menu_items']):
+        children = ''.join(
+            f'<li><a href="/page/{i}-{j}.html">{rnd.choice(WORDS)} {j}</a></li>' for j in range(rnd.randrange(0, 8))
+        )
+        submenu = f'<ul>{children}</ul>' if children else ''
+        items.append(f'<div class="menu-item"><a href="/page/{i}.html">{rnd.choice(WORDS)} {i}</a>{submenu}</div>')
+    footer = ''.join(f'<ul><li><a href="/f/{k}">{rnd.choice(WORDS)}</a></li></ul>' for k in range(20))
+    body = ''.join(f'<p>{" ".join(rnd.choices(WORDS, k=40))}</p>' for _ in range(200))
+    return (
+        f'<html><body><nav id="menu">{"".join(items)}</nav><h1>Menu</h1>{body}{footer}</body></html>'
+    ).encode('utf-8')
+
+
+def sitemap_xml(urls, index=False):
+    tag, item = ('sitemapindex', 'sitemap') if index else ('urlset', 'url')
+    entries = ''.join(f'<{item}><loc>{url}</loc></{item}>' for url in urls)
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<{tag} xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</{tag}>'
+    ).encode('utf-8')
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, status=200, content_type='text/html; charset=utf-8', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        config = self.server.config
+        base = f'http://127.0.0.1:{self.server.server_port}'
+        path = self.path.split('?', 1)[0]
+        sitemaps = (config['pages'] + URLS_PER_SITEMAP - 1) // URLS_PER_SITEMAP
+
+        if path == '/sitemap_index.xml':
+            urls = [f'{base}/sitemap-{k}.xml' + ('.gz' if k % 2 else '') for k in range(sitemaps)]
+            return self.send_body(sitemap_xml(urls, index=True), content_type='application/xml')
+        match = re.fullmatch(r'/sitemap-(\d+)\.xml(\.gz)?', path)
+        if match:
+            k = int(match.group(1))
+            pages = range(k * URLS_PER_SITEMAP, min((k + 1) * URLS_PER_SITEMAP, config['pages']))
+            body = sitemap_xml(f'{base}/page/{i}.html' for i in pages)
+            if match.group(2):
+                return self.send_body(gzip.compress(body), content_type='application/gzip')
+            return self.send_body(body, content_type='application/xml')
+        if path == '/menu.html':
+            return self.send_body(self.server.menu_page)
+
+        match = re.fullmatch(r'/page/(\d+)\.html', path)
+        if not match:
+            return self.send_body(b'Not found', status=404)
+        latency = config['latency_ms'] / 1000
+        if latency:
+            time.sleep(random.uniform(latency * 0.5, latency * 1.5))
+        roll = random.random()
+        if roll < config['rate_429']:
+            return self.send_body(b'Too many requests', status=429, headers={'Retry-After': '1'})
+        if roll < config['rate_429'] + config['error_rate']:
+            return self.send_body(b'Server error', status=500)
+        i = int(match.group(1))
+        body = self.server.pages.get(i)
+        if body is None:
+            body = self.server.pages.setdefault(i, generate_page(i, config))
+        self.send_body(body)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # Atrapa /v1/chat/completions - zwraca odpowiedzi w formacie oczekiwanym przez Audytorka
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        prompt = request['messages'][-1]['content']
+        if 'Strony (JSON):' in prompt:
+            ids = re.findall(r'"id": "(\d+)"', prompt)
+            content = json.dumps({'pages': [
+                {'id': page_id, 'headings': [{'level': 'H1', 'text': 'Nagłówek'}, {'level': 'H2', 'text': 'Sekcja'}]}
+                for page_id in ids
+            ]})
+        elif 'meta title' in prompt:
+            content = json.dumps({'title': 'Tytuł strony', 'description': 'Opis strony wygenerowany w benchmarku.'})
+        else:
+            content = json.dumps([{'level': 'H1', 'text': 'Nagłówek'}, {'level': 'H2', 'text': 'Sekcja'}])
+        time.sleep(self.server.config['ai_latency_ms'] / 1000)
+        body = json.dumps({
+            'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': request.get('model', 'gpt-4o-mini'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BenchmarkServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Zerwane połączenia (np. przerwany crawl) nie są błędem benchmarku
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+def serve(config, ports, stop_event):
+    random.seed(config['seed'])
+    site = BenchmarkServer(('127.0.0.1', 0), SiteHandler)
+    site.config = config
+    site.pages = {}
+    site.menu_page = generate_menu_page(config)
+    fake_openai = BenchmarkServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    fake_openai.config = config
+    for server in (site, fake_openai):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ports.put((site.server_port, fake_openai.server_port))
+    stop_event.wait()
+    site.shutdown()
+    fake_openai.shutdown()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def timed_urls(urls, started):
+    for url in urls:
+        started[url] = time.perf_counter()
+        yield url
+
+
+def run_crawl(config, urls, crawl_mode, generate_new_meta=False):
+    from audytorek.audit import iter_crawl_results
+
+    fetch_options = {
+        'elements': ['H1', 'Wszystkie nagłówki', 'Meta title', 'Meta description', 'Canonical'],
+        'generate_new_meta': generate_new_meta,
+        'context': 'strony benchmarku',
+        'optimize_headings': False,
+    }
+    crawl_settings = {
+        'crawl_mode': crawl_mode,
+        'max_workers': config['workers'],
+        'per_host_limit': config['workers'],
+        'polite_crawl': config['polite'],
+        'page_store': False,
+        'parse_workers': None,
+        'queue_size': None,
+    }
+    started = {}
+    latencies = []
+    errors = 0
+    for result in iter_crawl_results(timed_urls(urls, started), fetch_options, crawl_settings):
+        latencies.append(time.perf_counter() - started[result['URL']])
+        errors += 'Error' in result
+    return len(latencies), errors, latencies
+
+
+def run_scenario(name, config, site_port, openai_port, data_dir, output):
+    # Proces potomny: środowisko ustawiamy przed importem modułów Audytorka
+    os.environ['AUDYTOREK_DATA_DIR'] = data_dir
+    os.environ['OPENAI_API_KEY'] = 'benchmark'
+    os.environ['OPENAI_BASE_URL'] = f'http://127.0.0.1:{openai_port}/v1'
+    base = f'http://127.0.0.1:{site_port}'
+    page_urls = [f'{base}/page/{i}.html' for i in range(config['pages'])]
+
+    from audytorek.audit import CRAWL_MODE_ASYNC, CRAWL_MODE_PIPELINE, CRAWL_MODE_THREADS
+
+    latencies = []
+    errors = 0
+    wall_start = time.perf_counter()
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+
+    if name == 'parse':
+        from audytorek.parsing import build_page_result
+        pages = [generate_page(i, config) for i in range(min(config['pages'], 500))]
+        wall_start = time.perf_counter()
+        cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+        count = 0
+        while count < config['pages']:
+            content = pages[count % len(pages)]
+            item_start = time.perf_counter()
+            build_page_result(f'{base}/page/{count}.html', content, ['H1', 'Wszystkie nagłówki', 'Meta title',
+                              'Meta description', 'Canonical'], optimize_headings=True)
+            latencies.append(time.perf_counter() - item_start)
+            count += 1
+    elif name == 'sitemap':
+        from audytorek.sitemap import iter_sitemap_urls
+        count = sum(1 for _ in iter_sitemap_urls(f'{base}/sitemap_index.xml'))
+    elif name == 'menu':
+        import crawler
+        count = 0
+        for _ in range(config['menu_repeat']):
+            for extract in (crawler.extract_menu, crawler.extract_menu_advanced):
+                item_start = time.perf_counter()
+                menu = extract(f'{base}/menu.html')
+                latencies.append(time.perf_counter() - item_start)
+                errors += isinstance(menu, str)
+                count += 1
+    else:
+        crawl_mode = {
+            'crawl-threads': CRAWL_MODE_THREADS, 'crawl-async': CRAWL_MODE_ASYNC,
+            'crawl-pipeline': CRAWL_MODE_PIPELINE, 'crawl-ai': CRAWL_MODE_THREADS,
+        }[name]
+        urls = page_urls[:config['ai_pages']] if name == 'crawl-ai' else page_urls
+        count, errors, latencies = run_crawl(config, urls, crawl_mode, generate_new_meta=name == 'crawl-ai')
+
+    wall = time.perf_counter() - wall_start
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+    # Procesy parsujące trybu potokowego kończą się przed pomiarem, więc ich czas jest w RUSAGE_CHILDREN
+    cpu += children.ru_utime + children.ru_stime
+    output.put({
+        'scenario': name,
+        'items': count,
+        'errors': errors,
+        'seconds': round(wall, 3),
+        'items_per_s': round(count / wall, 1) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'cpu_ms_per_item': round(cpu * 1000 / count, 3) if count else 0.0,
+        'peak_rss_mb': round(max(cpu_end.ru_maxrss, children.ru_maxrss) / 1024, 1),
+    })
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def config_key(config):
+    # Wyniki porównujemy tylko między przebiegami z identyczną konfiguracją strony
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def load_previous(history_path, key):
+    previous = {}
+    if not os.path.exists(history_path):
+        return previous
+    with open(history_path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get('config_key') == key:
+                previous[entry['scenario']] = entry
+    return previous
+
+
+def find_regressions(results, previous, threshold):
+    regressions = []
+    for result in results:
+        before = previous.get(result['scenario'])
+        if not before:
+            continue
+        if result['items_per_s'] < before['items_per_s'] * (1 - threshold):
+            regressions.append(f"{result['scenario']}: {before['items_per_s']} -> {result['items_per_s']} /s")
+        if result['cpu_ms_per_item'] > before['cpu_ms_per_item'] * (1 + threshold):
+            regressions.append(
+                f"{result['scenario']}: CPU {before['cpu_ms_per_item']} -> {result['cpu_ms_per_item']} ms/element"
+            )
+    return regressions
+
+
+def print_table(results):
+    columns = ('scenario', 'items', 'errors', 'items_per_s', 'p50_ms', 'p99_ms', 'cpu_ms_per_item', 'peak_rss_mb')
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark crawlera Audytorka na lokalnej, generowanej stronie.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"rozdzielone przecinkami: {', '.join(SCENARIOS)}")
+    parser.add_argument('--pages', type=int, default=2000, help='liczba stron w witrynie')
+    parser.add_argument('--page-size-kb', type=int, default=30, help='rozmiar strony w KB')
+    parser.add_argument('--headings-per-kb', type=float, default=0.5, help='liczba nagłówków na KB treści')
+    parser.add_argument('--latency-ms', type=float, default=20, help='średnie opóźnienie serwera')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='odsetek odpowiedzi 500')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='odsetek odpowiedzi 429 (z Retry-After)')
+    parser.add_argument('--workers', type=int, default=16, help='liczba równoległych połączeń crawlera')
+    parser.add_argument('--no-polite', action='store_true',
+                        help='bez adaptacyjnego tempa na host (mierzy sam silnik, nie harmonogram)')
+    parser.add_argument('--ai-pages', type=int, default=200, help='liczba stron w scenariuszu crawl-ai')
+    parser.add_argument('--ai-latency-ms', type=float, default=50, help='opóźnienie atrapy OpenAI')
+    parser.add_argument('--menu-items', type=int, default=300, help='liczba pozycji menu w scenariuszu menu')
+    parser.add_argument('--menu-repeat', type=int, default=5, help='liczba powtórzeń scenariusza menu')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='plik JSONL z historią wyników')
+    parser.add_argument('--save', action='store_true', help='dopisz wyniki do historii (z hashem commita)')
+    parser.add_argument('--compare', action='store_true',
+                        help='porównaj z ostatnim wynikiem o tej samej konfiguracji; kod wyjścia 1 przy regresji')
+    parser.add_argument('--threshold', type=float, default=0.1, help='dopuszczalny spadek wydajności (0.1 = 10%%)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        print(f"Nieznane scenariusze: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    config = {
+        'pages': args.pages, 'page_size_kb': args.page_size_kb, 'headings_per_kb': args.headings_per_kb,
+        'latency_ms': args.latency_ms, 'error_rate': args.error_rate, 'rate_429': args.rate_429,
+        'workers': args.workers, 'polite': not args.no_polite, 'ai_pages': args.ai_pages, 'ai_latency_ms': args.ai_latency_ms,
+        'menu_items': args.menu_items, 'menu_repeat': args.menu_repeat, 'seed': args.seed,
+    }
+
+    context = multiprocessing.get_context('spawn')
+    ports = context.Queue()
+    stop_event = context.Event()
+    server = context.Process(target=serve, args=(config, ports, stop_event), daemon=True)
+    server.start()
+    site_port, openai_port = ports.get(timeout=30)
+
+    results = []
+    try:
+        for name in scenarios:
+            output = context.Queue()
+            with tempfile.TemporaryDirectory(prefix='audytorek-bench-') as data_dir:
+                process = context.Process(
+                    target=run_scenario, args=(name, config, site_port, openai_port, data_dir, output)
+                )
+                process.start()
+                result = None
+                while result is None:
+                    try:
+                        result = output.get(timeout=1)
+                    except queue.Empty:
+                        if not process.is_alive():
+                            raise RuntimeError(f'Scenariusz {name} zakończył się błędem (kod {process.exitcode})')
+                process.join()
+            results.append(result)
+            print(f"{name}: {result['items_per_s']}/s", file=sys.stderr, flush=True)
+    finally:
+        stop_event.set()
+        server.join(timeout=5)
+
+    print_table(results)
+
+    key = config_key(config)
+    exit_code = 0
+    if args.compare:
+        regressions = find_regressions(results, load_previous(args.history, key), args.threshold)
+        for regression in regressions:
+            print(f'REGRESJA {regression}')
+        exit_code = 1 if regressions else 0
+    if args.save:
+        revision = git_revision()
+        with open(args.history, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(dict(result, commit=revision, config_key=key, config=config,
+                                        timestamp=time.time())) + '\n')
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,227 +2,60 @@ import streamlit as st
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import xml.etree.ElementTree as ET
-from io import BytesIO
-import openai
 import json
 import os
-import re
-from urllib.parse import urlparse, urljoin
-import matplotlib.pyplot as plt
-from pydantic import BaseModel, Field, ValidationError
-import plotly.graph_objects as go
-
-
-
-# Access API keys from st.secrets
-OPENAI_API_KEY = st.secrets["openai_api_key"]
-PAGESPEED_API_KEY = st.secrets["pagespeed_api_key"]
-
-# Set OpenAI API key
-openai.api_key = OPENAI_API_KEY
-
+import time
+from urllib.parse import urlparse
+
+from audytorek.ai_cache import get_ai_cache
+from audytorek.async_engine import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_LIMIT
+from audytorek.audit import (
+    AUDIT_ELEMENTS, CHECKPOINT_SETTINGS_KEYS, CRAWL_MODE_ASYNC, CRAWL_MODE_PIPELINE, CRAWL_MODE_THREADS,
+    DEFAULT_AUDIT_ELEMENTS, HEADINGS_MODE_BATCH_API, HEADINGS_MODE_LIVE, apply_headings_batch_results,
+    cached_chat_completion, describe_audit_source, get_result_columns, run_audit
+)
+from audytorek.checkpoints import RUN_COMPLETED, get_checkpoint_store
+from audytorek.dedupe import DUPLICATE_COLUMN
+from audytorek.export import export_results, remove_export_files
+from audytorek.fetching import DEFAULT_POOL_SIZE
+from audytorek.frontier import DEFAULT_MAX_DEPTH, DEFAULT_MAX_PAGES
+from audytorek.jobs import JOB_FAILED, RESULTS_PREVIEW_ROWS, get_job_manager
+from audytorek.llm import DEFAULT_LLM_PARALLELISM, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from audytorek.menu import build_menu_structure, extract_link_menus, find_menu_automatically
+from audytorek.metrics import collect_metrics
+from audytorek.parsing import parse_structured_data
+from audytorek.page_cache import get_page_cache
+from audytorek.pagespeed import (
+    DEFAULT_PSI_CONCURRENCY, DEFAULT_PSI_REQUESTS_PER_MINUTE, PSI_COLUMNS, PSI_STRATEGIES, PageSpeedError,
+    get_pagespeed_cache, iter_pagespeed_batch, run_pagespeed
+)
+from audytorek.pipeline import default_parse_workers
+from audytorek.scheduler import RetryableFetchError
+from audytorek.sitemap import iter_sitemap_urls
+from audytorek.structured_data import STRUCTURED_DATA_ELEMENT, item_types
+
+
+
+# Typ wejścia: crawl wszerz od adresów startowych, podążający za linkami wewnętrznymi
+INPUT_TYPE_LINK_CRAWL = 'Crawl od adresów startowych'
+
+# Typ schema.org oczekiwany dla typu strony wybranego w zakładce Dane strukturalne
+STRUCTURED_DATA_PAGE_TYPES = {'Artykuł': 'Article', 'Produkt': 'Product', 'Strona usługowa': 'Service'}
+
+# Domyślna liczba adresów testowanych w trybie zbiorczym Pagespeed Insights
+DEFAULT_PSI_BATCH_URLS = 50
 
 # URL gifa ładowania
 LOADING_GIF_URL = "https://media.giphy.com/media/LML5ldpTKLPelFtBfY/giphy.gif"
 
-class MetaTags(BaseModel):
-    title: str = Field(..., max_length=60)
-    description: str = Field(..., max_length=160)
-
-def generate_meta_tags(content, context):
-    try:
-        # Tworzenie promptu
-        prompt = f"Treść: {content}\n"
-        if context:
-            prompt += f"Kontekst: {context}\n"
-        prompt += "\nWygeneruj meta title (maksymalnie 60 znaków) i meta description (maksymalnie 160 znaków) w formacie JSON. Użyj kluczy 'title' i 'description'."
-
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Jesteś ekspertem SEO. Twoim zadaniem jest generowanie zoptymalizowanych meta tagów na podstawie podanej treści i kontekstu.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            response_format={"type": "json_object"},
-        )
-
-        response_content = response.choices[0].message.content
-
-        # Próba parsowania jako MetaTags
-        try:
-            meta_tags = MetaTags.model_validate_json(response_content)
-            return meta_tags.title, meta_tags.description
-        except ValidationError:
-            # Jeśli nie udało się sparsować jako MetaTags, próbujemy elastycznego podejścia
-            data = json.loads(response_content)
-
-            title = data.get("title") or data.get("meta_title") or ""
-            description = data.get("description") or data.get("meta_description") or ""
-
-            # Upewniamy się, że długość jest odpowiednia
-            title = title[:60]
-            description = description[:160]
-
-            return title, description
-
-    except Exception as e:
-        return (
-            f"Błąd generowania meta tagów: {str(e)}",
-            f"Błąd generowania meta tagów: {str(e)}",
-        )
-
-
-
-def fetch_url(url, elements, generate_new_meta, context, optimize_headings):
-    try:
-        response = requests.get(url, timeout=10)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        result = {'URL': url}
-
-        for element in elements:
-            if element == 'H1':
-                h1 = soup.find('h1')
-                result['H1'] = h1.get_text(strip=True) if h1 else ''
-            elif element == 'Wszystkie nagłówki':
-                headers = []
-                for header in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                    level = header.name.upper()
-                    text = header.get_text(strip=True)
-                    headers.append(f"{level}: {text}")
-                result['Wszystkie nagłówki'] = '\n'.join(headers)
-            elif element == 'Meta title':
-                title = soup.find('title')
-                result['Meta title'] = title.get_text(strip=True) if title else ''
-            elif element == 'Meta description':
-                meta_desc = soup.find('meta', attrs={'name': 'description'})
-                result['Meta description'] = meta_desc['content'].strip() if meta_desc else ''
-            elif element == 'Canonical':
-                canonical = soup.find('link', attrs={'rel': 'canonical'})
-                if canonical:
-                    canonical_url = canonical['href']
-                    if canonical_url == url:
-                        result['Canonical'] = 'self reference'
-                    else:
-                        result['Canonical'] = 'other'
-                else:
-                    result['Canonical'] = 'brak'
-
-        # Generowanie nowych meta tagów
-        if generate_new_meta and OPENAI_API_KEY and ('Meta title' in elements or 'Meta description' in elements):
-            content = soup.get_text()[:1000]  # Ograniczamy treść do pierwszych 1000 znaków
-            new_meta_title, new_meta_description = generate_meta_tags(content, context)
-            result['Nowy Meta title'] = new_meta_title
-            result['Nowy Meta description'] = new_meta_description
-
-        # Jeśli optymalizacja nagłówków jest włączona, zbieramy dane
-        if optimize_headings:
-            content = soup.get_text(separator='\n', strip=True)
-            content = content[:5000]  # Ograniczamy do 5000 znaków
-
-            existing_headings = []
-            for tag in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                level = tag.name.upper()
-                text = tag.get_text(strip=True)
-                existing_headings.append({
-                    'level': level,
-                    'text': text
-                })
-
-            result['content_for_optimization'] = content
-            result['existing_headings'] = existing_headings
-
-        return result
-    except Exception as e:
-        return {'URL': url, 'Error': str(e)}
-
-
-
-    
-def generate_optimized_headings(content, existing_headings):
-    prompt = f"""Jesteś ekspertem SEO i copywriterem. Twoim zadaniem jest przeanalizowanie poniższej treści strony oraz istniejącej struktury nagłówków, a następnie zaproponowanie zoptymalizowanej struktury nagłówków (H1-H6), która poprawi SEO i rozszerzy pokrycie semantyczne tematu.
-
-**UWAGA:** Zwróć **tylko** listę nagłówków w podanym formacie. **Nie dodawaj żadnych dodatkowych tekstów, wyjaśnień ani komentarzy** poza listą nagłówków.
-
-Treść strony:
-{content}
-
-Istniejąca struktura nagłówków:
-{json.dumps(existing_headings, ensure_ascii=False, indent=2)}
-
-Na podstawie powyższej treści i istniejących nagłówków, zaproponuj zoptymalizowaną wersję tych nagłówków, uwzględniając najlepsze praktyki SEO. Nie dodawaj nowych nagłówków. **Zwróć tylko listę nagłówków w formacie:**
-
-[
-    {{"level": "H1", "text": "Twój tytuł H1"}},
-    {{"level": "H2", "text": "Nagłówek H2"}},
-    {{"level": "H3", "text": "Nagłówek H3"}},
-    ...
-]
-
-**Nie dodawaj żadnych dodatkowych komentarzy ani tekstu.**
-
-Twoja propozycja:
-"""
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Jesteś ekspertem SEO i copywriterem specjalizującym się w optymalizacji struktury nagłówków."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        ai_response = response.choices[0].message.content.strip()
-        
-        # Próba parsowania odpowiedzi AI jako JSON
-        try:
-            optimized_headings_list = json.loads(ai_response)
-            # Formatowanie nagłówków
-            formatted_headings = ''
-            for heading in optimized_headings_list:
-                level = heading.get('level', '')
-                text = heading.get('text', '')
-                formatted_headings += f"{level}: {text}\n"
-            return formatted_headings.strip()
-        except json.JSONDecodeError:
-            # Jeśli parsowanie się nie powiedzie, spróbuj wyciągnąć nagłówki za pomocą wyrażeń regularnych
-            import re
-            pattern = r'{"level":\s*"(?P<level>H[1-6])",\s*"text":\s*"(?P<text>.*?)"}'
-            matches = re.findall(pattern, ai_response)
-            if matches:
-                formatted_headings = ''
-                for level, text in matches:
-                    formatted_headings += f"{level}: {text}\n"
-                return formatted_headings.strip()
-            else:
-                return "Błąd: Nie udało się wyciągnąć nagłówków z odpowiedzi AI."
-    except Exception as e:
-        return f"Błąd podczas generowania zoptymalizowanej struktury nagłówków: {str(e)}"
-
-
-
 def parse_sitemap(sitemap_url):
-    try:
-        response = requests.get(sitemap_url)
-        response.raise_for_status()  # Sprawdź, czy nie było błędu HTTP
-        content = response.content
-
-        # Spróbuj sparsować jako XML
-        try:
-            root = ET.fromstring(content)
-            namespaces = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-            urls = [elem.text for elem in root.findall('.//sm:loc', namespaces)]
-        except ET.ParseError:
-            # Jeśli nie udało się sparsować jako XML, spróbuj jako zwykły tekst
-            urls = [line.strip() for line in content.decode('utf-8').split('\n') if line.strip()]
-
-        return urls
-    except requests.RequestException as e:
-        st.error(f"Błąd podczas pobierania sitemapy: {e}")
-        return []
+    # Pełna lista URL-i (z rozwinięciem indeksów sitemap); crawl w zakładce Audyt SEO używa wersji strumieniowej
+    errors = []
+    urls = list(iter_sitemap_urls(sitemap_url, on_error=lambda url, e: errors.append((url, e))))
+    for url, e in errors:
+        st.error(f"Błąd podczas pobierania sitemapy {url}: {e}")
+    return urls
+
 
 def extract_domain(url):
     parsed_uri = urlparse(url)
@@ -231,41 +64,29 @@ def extract_domain(url):
 
 
 def check_structured_data(url, page_type):
+    # Walidacja lokalna (JSON-LD, Microdata, RDFa); AI tylko wtedy, gdy walidacja wykazała problemy
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        scripts = soup.find_all('script', type='application/ld+json')
-        
-        if not scripts:
-            errors = ['Brak danych strukturalnych na stronie.']
-            recommendation = get_ai_recommendation(errors, url, page_type, schema_data=None)
-            return {'Status': 'Brak danych strukturalnych', 'Rekomendacje': recommendation}
-        
-        schema_data = []
-        errors = []
-        
-        for script in scripts:
-            try:
-                data = json.loads(script.string)
-                schema_data.append(data)
-            except json.JSONDecodeError as e:
-                errors.append(f"Błąd parsowania JSON: {str(e)}")
-        
-        recommendation = get_ai_recommendation(errors, url, page_type, schema_data)
-        
-        return {'Status': 'Dane strukturalne znalezione', 'Rekomendacje': recommendation}
-        
+        page = get_page_cache().fetch(url)
     except requests.RequestException as e:
-        error = f'Błąd pobierania strony: {str(e)}'
-        recommendation = get_ai_recommendation([error], url, page_type, schema_data=None)
-        return {'Status': error, 'Rekomendacje': recommendation}
+        return {'Status': f'Błąd pobierania strony: {str(e)}'}
     except Exception as e:
-        error = f'Nieoczekiwany błąd: {str(e)}'
-        recommendation = get_ai_recommendation([error], url, page_type, schema_data=None)
-        return {'Status': error, 'Rekomendacje': recommendation}
-    
+        return {'Status': f'Nieoczekiwany błąd: {str(e)}'}
+
+    items, errors, warnings = parse_structured_data(page.content, STRUCTURED_DATA_PAGE_TYPES.get(page_type))
+    if not items:
+        errors = ['Brak danych strukturalnych na stronie.'] + errors
+        status = 'Brak danych strukturalnych'
+    else:
+        types = dict.fromkeys(f"{'/'.join(item_types(item)) or '?'} ({item_format})" for item_format, item in items)
+        status = f"Dane strukturalne znalezione: {', '.join(types)}"
+
+    structured_data_result = {'Status': status, 'Błędy': errors, 'Ostrzeżenia': warnings}
+    if errors or warnings:
+        structured_data_result['Rekomendacje'] = get_ai_recommendation(
+            errors + warnings, url, page_type, [item for _, item in items] or None
+        )
+    return structured_data_result
+
 def get_ai_recommendation(errors, url, page_type, schema_data):
     domain = extract_domain(url)
     schema_data_str = json.dumps(schema_data, ensure_ascii=False, indent=2) if schema_data else "Brak danych"
@@ -282,34 +103,21 @@ Błędy podczas ekstrakcji danych:
 Twoja ocena i rekomendacje:"""
     
     try:
-        response = openai.chat.completions.create(
+        response = cached_chat_completion(
+            'structured_data/1',
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Jesteś ekspertem SEO specjalizującym się w danych strukturalnych i optymalizacji stron internetowych."},
                 {"role": "user", "content": prompt}
             ]
         )
-        return response.choices[0].message.content.strip()
+        return response.strip()
     except Exception as e:
         return f"Błąd podczas generowania rekomendacji: {str(e)}"
 
-def find_menu_automatically(soup):
-    # Próbujemy znaleźć elementy menu w typowych miejscach
-    possible_menu_elements = [
-        soup.find('nav'),
-        soup.find(id=re.compile('menu', re.I)),
-        soup.find(class_=re.compile('menu', re.I)),
-        soup.find(id=re.compile('nav', re.I)),
-        soup.find(class_=re.compile('nav', re.I))
-    ]
-    menu_element = next((elem for elem in possible_menu_elements if elem), None)
-    return menu_element
-
 def extract_menu(url, menu_selector=None):
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = get_page_cache().get_soup(url)
 
         # Szukamy głównego elementu menu
         menu_element = None
@@ -328,29 +136,8 @@ def extract_menu(url, menu_selector=None):
         if not menu_element:
             return "Nie znaleziono struktury menu. Spróbuj podać inny kod menu lub sprawdź strukturę strony."
 
-        def parse_menu_item(item, parent=None):
-            result = {}
-            link = item.find('a')
-            if link:
-                result['text'] = link.get_text(strip=True)
-                result['url'] = link.get('href')
-                result['parent'] = parent
-
-                submenu = item.find(['ul', 'ol'])
-                if submenu:
-                    result['children'] = []
-                    for sub_item in submenu.find_all(['li', 'div'], recursive=False):
-                        child = parse_menu_item(sub_item, result['text'])
-                        if child:
-                            result['children'].append(child)
-
-            return result if result else None
-
-        menu_structure = []
-        for item in menu_element.find_all(['li', 'div'], recursive=False):
-            parsed_item = parse_menu_item(item)
-            if parsed_item:
-                menu_structure.append(parsed_item)
+        # Hierarchia menu budowana w jednym przejściu po drzewie elementu menu
+        menu_structure = build_menu_structure(menu_element)
 
         return menu_structure
     except Exception as e:
@@ -359,31 +146,7 @@ def extract_menu(url, menu_selector=None):
 def extract_menu_from_code(menu_code):
     try:
         soup = BeautifulSoup(menu_code, 'html.parser')
-        menu_element = soup
-
-        def parse_menu_item(item, parent=None):
-            result = {}
-            link = item.find('a')
-            if link:
-                result['text'] = link.get_text(strip=True)
-                result['url'] = link.get('href')
-                result['parent'] = parent
-
-                submenu = item.find(['ul', 'ol'])
-                if submenu:
-                    result['children'] = []
-                    for sub_item in submenu.find_all(['li', 'div'], recursive=False):
-                        child = parse_menu_item(sub_item, result['text'])
-                        if child:
-                            result['children'].append(child)
-
-            return result if result else None
-
-        menu_structure = []
-        for item in menu_element.find_all(['li', 'div'], recursive=False):
-            parsed_item = parse_menu_item(item)
-            if parsed_item:
-                menu_structure.append(parsed_item)
+        menu_structure = build_menu_structure(soup)
 
         return menu_structure
     except Exception as e:
@@ -454,14 +217,15 @@ Przygotuj szczegółową ocenę aktualnego stanu menu oraz konkretne rekomendacj
 Rozpocznij swoją analizę poniżej."""
 
     try:
-        response = openai.chat.completions.create(
+        response = cached_chat_completion(
+            'menu_analysis/1',
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Jesteś ekspertem SEO specjalizującym się w analizie i optymalizacji menu na stronach internetowych."},
                 {"role": "user", "content": prompt}
             ]
         )
-        return response.choices[0].message.content.strip()
+        return response.strip()
     except Exception as e:
         return f"Wystąpił błąd podczas analizy AI: {str(e)}"
 
@@ -521,50 +285,25 @@ Przygotuj szczegółową ocenę aktualnego stanu menu oraz konkretne rekomendacj
 Rozpocznij swoją analizę poniżej."""
     
     try:
-        response = openai.chat.completions.create(
+        response = cached_chat_completion(
+            'menu_analysis/1',
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Jesteś ekspertem SEO specjalizującym się w analizie i optymalizacji menu na stronach internetowych."},
                 {"role": "user", "content": prompt}
             ]
         )
-        return response.choices[0].message.content.strip()
+        return response.strip()
     except Exception as e:
         return f"Wystąpił błąd podczas analizy AI: {str(e)}"
     
 def extract_menu_advanced(url):
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        all_menus = []
-        content_start = soup.find(['h1', 'h2'])
-        
-        if content_start:
-            search_area = []
-            for element in content_start.previous_elements:
-                if element.name == 'body':
-                    break
-                search_area.append(element)
-            search_area.reverse()  # Odwracamy listę, aby zachować oryginalną kolejność
-        else:
-            search_area = soup.find_all()
-        
-        potential_menus = [elem for elem in search_area if elem.name in ['ul', 'ol', 'nav']]
-        
-        for menu in potential_menus:
-            menu_items = []
-            for item in menu.find_all('a', href=True):
-                parent = item.find_parent('li')
-                menu_items.append({
-                    'text': item.get_text(strip=True),
-                    'url': item['href'],
-                    'parent': parent.get_text(strip=True) if parent else None
-                })
-            if menu_items:
-                all_menus.append(menu_items)
+        soup = get_page_cache().get_soup(url)
         
+        # Listy z linkami przed pierwszym nagłówkiem h1/h2 - jedno przejście po dokumencie
+        all_menus = extract_link_menus(soup)
+
         return all_menus
     except Exception as e:
         return f"Wystąpił błąd podczas analizy menu: {str(e)}"
@@ -591,66 +330,21 @@ def visualize_menu_advanced(menus):
     return all_nodes, all_urls
 
 def run_pagespeed_insights(url, strategy='mobile'):
-    api_url = 'https://www.googleapis.com/pagespeedonline/v5/runPagespeed'
-    params = {
-        'url': url,
-        'key': PAGESPEED_API_KEY,
-        'strategy': strategy
-    }
+    # Skrócony wynik testu - z cache wyników z bieżącego dnia albo z API (z limitem czasu i ponowieniami)
     try:
-        response = requests.get(api_url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return data
-    except requests.exceptions.HTTPError as http_err:
+        return run_pagespeed(url, strategy, cache=get_pagespeed_cache())
+    except (PageSpeedError, RetryableFetchError) as http_err:
         st.error(f'Wystąpił błąd HTTP: {http_err}')
     except Exception as err:
         st.error(f'Wystąpił inny błąd: {err}')
 
 
-def display_pagespeed_results(data):
-    import plotly.graph_objects as go
-
-    # Pobieranie wyniku Performance
-    lighthouse_result = data.get('lighthouseResult', {})
-    categories = lighthouse_result.get('categories', {})
-    performance_score = categories.get('performance', {}).get('score', 0) * 100
-
+def display_pagespeed_results(summary):
     # Wyświetlanie wyniku Performance jako wykresu kołowego
-    display_performance_gauge(performance_score)
-
-    # Pobieranie metryk z audytów
-    audits = lighthouse_result.get('audits', {})
-
-    # Lista metryk do pobrania
-    desired_metrics = {
-        'first-contentful-paint': 'First Contentful Paint (FCP)',
-        'largest-contentful-paint': 'Largest Contentful Paint (LCP)',
-        'total-blocking-time': 'Total Blocking Time (TBT)',
-        'cumulative-layout-shift': 'Cumulative Layout Shift (CLS)',
-        'speed-index': 'Speed Index'
-    }
+    display_performance_gauge(summary['performance_score'])
 
-    # Pobieranie i przechowywanie metryk
-    metric_data = {}
-    for audit_key, metric_name in desired_metrics.items():
-        audit = audits.get(audit_key, {})
-        display_value = audit.get('displayValue', '')
-        score = audit.get('score', 0)
-        numeric_value = audit.get('numericValue', 0)
-        # Określenie kategorii na podstawie wyniku
-        if score >= 0.9:
-            category = 'Dobrze'
-        elif score >= 0.5:
-            category = 'Wymaga poprawy'
-        else:
-            category = 'Słabo'
-        metric_data[metric_name] = {
-            'display_value': display_value,
-            'score': score,
-            'numeric_value': numeric_value,
-            'category': category
-        }
+    # Metryki z kategoriami wyliczone przy skracaniu odpowiedzi API
+    metric_data = summary['metrics']
 
     # Wyświetlanie metryk Core Web Vitals
     st.subheader('Core Web Vitals i metryki wydajności')
@@ -661,7 +355,6 @@ def display_pagespeed_results(data):
     for idx, (metric_name, data) in enumerate(metric_data.items()):
         display_value = data['display_value']
         category = data['category']
-        score = data['score']
         # Ustawienie strzałki i koloru na podstawie kategorii
         if category == 'Dobrze':
             delta_arrow = '↑'
@@ -680,21 +373,12 @@ def display_pagespeed_results(data):
             st.markdown(f"<p style='text-align: center; color:{value_color};'>{delta_arrow} {category}</p>", unsafe_allow_html=True)
 
     # Zbieranie 'Opportunities' i 'Diagnostics' do analizy AI
-    opportunity_audits = {k: v for k, v in audits.items() if v.get('details', {}).get('type') == 'opportunity'}
-    opportunities = []
-    for audit in opportunity_audits.values():
-        title = audit.get('title')
-        description = audit.get('description')
-        display_value = audit.get('displayValue', '')
-        opportunities.append(f"{title}: {display_value}\n{description}")
-
-    diagnostics_audits = {k: v for k, v in audits.items() if v.get('scoreDisplayMode') == 'informative'}
-    diagnostics = []
-    for audit in diagnostics_audits.values():
-        title = audit.get('title')
-        description = audit.get('description')
-        display_value = audit.get('displayValue', '')
-        diagnostics.append(f"{title}: {display_value}\n{description}")
+    opportunities = [
+        f"{audit['title']}: {audit['display_value']}\n{audit['description']}" for audit in summary['opportunities']
+    ]
+    diagnostics = [
+        f"{audit['title']}: {audit['display_value']}\n{audit['description']}" for audit in summary['diagnostics']
+    ]
 
     # Przygotowanie danych CWV do analizy AI
     cwv_data_for_ai = {
@@ -740,14 +424,15 @@ Twoja odpowiedź powinna być zwięzła i konkretna, napisana w języku polskim.
 """
 
     try:
-        response = openai.chat.completions.create(
+        response = cached_chat_completion(
+            'cwv_analysis/1',
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Jesteś ekspertem w optymalizacji wydajności stron internetowych."},
                 {"role": "user", "content": prompt}
             ]
         )
-        ai_response = response.choices[0].message.content.strip()
+        ai_response = response.strip()
         return ai_response
     except Exception as e:
         return f"Błąd podczas analizy AI: {str(e)}"
@@ -790,6 +475,177 @@ def display_performance_gauge(performance_score):
 
 
 
+def start_audit_job(label, run_id, settings):
+    job = get_job_manager().submit(label, run_audit, dict(settings, run_id=run_id))
+    st.session_state.run_id = run_id
+    st.session_state.job_id = job.job_id
+    st.session_state.stage = 'crawling'
+
+
+def format_job_status(job):
+    status = f'{job.phase}: {job.done}/{job.total}'
+    if job.started_at:
+        status += f', {job.throughput():.1f} stron/s'
+    return status
+
+
+def show_crawl_metrics(collector):
+    # Rozkład czasu na etapy, przepustowość w czasie i najwolniejsze hosty - do strojenia współbieżności
+    stages = collector.stage_summary()
+    if not stages:
+        return
+    with st.expander('Metryki crawla'):
+        col_pages, col_bytes, col_retries = st.columns(3)
+        col_pages.metric('Strony (błędy)', f'{collector.pages} ({collector.errors})')
+        col_bytes.metric('Pobrano', f'{collector.bytes / 1024 / 1024:.1f} MB')
+        col_retries.metric('Ponowienia / przekierowania', f'{collector.retries} / {collector.redirects}')
+        st.caption('Średni czas etapów na stronę [ms]')
+        st.bar_chart(pd.DataFrame(stages).set_index('Etap')['Średnio [ms]'])
+        timeline = collector.throughput_timeline()
+        if timeline:
+            st.caption('Ukończone strony w kolejnych sekundach audytu')
+            st.line_chart(pd.DataFrame({'Strony/s': timeline}))
+        st.caption('Najwolniejsze hosty')
+        st.dataframe(pd.DataFrame(collector.slow_hosts()))
+        st.download_button(
+            label='Pobierz metryki (Prometheus)',
+            # Tekst metryk powstaje dopiero po kliknięciu, a nie przy każdym odświeżeniu postępu
+            data=collector.to_prometheus,
+            file_name='audytorek_metrics.prom',
+            mime='text/plain',
+            on_click='ignore',
+        )
+
+
+def file_download_button(container, label, path, file_name, mime, key=None):
+    # Plik czytamy z dysku dopiero po kliknięciu - kolejne przebiegi skryptu go nie ładują
+    def read_file():
+        with open(path, 'rb') as f:
+            return f.read()
+
+    container.download_button(
+        label=label, data=read_file, file_name=file_name, mime=mime, key=key, on_click='ignore'
+    )
+
+
+def show_link_report(paths):
+    # Raport sprawdzania linków (tylko dla audytu z tej sesji - nie jest zapisywany w checkpoincie)
+    if not paths or not os.path.exists(paths['csv']):
+        return
+    with st.expander('Niedziałające linki i przekierowania'):
+        report = pd.read_csv(
+            paths['csv'], nrows=RESULTS_PREVIEW_ROWS, encoding='utf-8-sig', dtype=str, keep_default_na=False
+        )
+        if report.empty:
+            st.success('Wszystkie sprawdzone linki działają i nie przekierowują.')
+            return
+        st.dataframe(report)
+        col_xlsx, col_csv = st.columns(2)
+        file_download_button(
+            col_xlsx, 'Pobierz raport linków jako Excel', paths['xlsx'], 'seo_audit_links.xlsx',
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        file_download_button(
+            col_csv, 'Pobierz raport linków jako CSV', paths['csv'], 'seo_audit_links.csv', 'text/csv'
+        )
+
+
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id):
+    # Fragment odświeżany co sekundę - reszta interfejsu pozostaje aktywna podczas crawla
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return
+    if job.finished:
+        st.rerun(scope='app')
+
+    st.progress(job.done / job.total if job.total else 0.0)
+    st.text(format_job_status(job))
+    for url, e in job.errors:
+        st.error(f"Błąd podczas pobierania sitemapy {url}: {e}")
+    if st.button('Zatrzymaj audyt', key=f'cancel_{job_id}'):
+        # Wyniki zapisane w checkpoincie pozwolą później wznowić audyt
+        get_job_manager().cancel(job_id)
+    show_crawl_metrics(job.metrics)
+
+    # Podgląd częściowych wyników - ostatnio ukończone strony
+    recent = list(job.recent)
+    if recent:
+        columns = get_result_columns(
+            job.settings['elements_to_fetch'], job.settings['generate_new_meta'], job.settings['optimize_headings'],
+            job.settings.get('structured_data_ai')
+        )
+        st.dataframe(pd.DataFrame([{k: v for k, v in result.items() if k in columns} for result in recent]))
+
+
+def show_background_jobs(manager):
+    # Audyty działające w tle (także z innych sesji) - można podejrzeć ich postęp i wyniki
+    jobs = manager.list_jobs()
+    if not jobs:
+        return
+    with st.expander(f'Audyty w tle ({len(jobs)})', expanded=any(not job.finished for job in jobs)):
+        for job in jobs:
+            col_label, col_action = st.columns([5, 1])
+            col_label.write(f'{job.label} - {format_job_status(job)}')
+            if col_action.button('Pokaż', key=f'show_job_{job.job_id}'):
+                st.session_state.update(job.settings)
+                st.session_state.job_id = job.job_id
+                st.session_state.stage = 'crawling'
+                st.rerun()
+
+
+def store_results_preview(results):
+    # Zapamiętuje w sesji początek wyników i ich liczbę zamiast wszystkich wierszy
+    preview = []
+    count = 0
+    for result in results:
+        if count < RESULTS_PREVIEW_ROWS:
+            preview.append(result)
+        count += 1
+    st.session_state.results_preview = preview
+    st.session_state.results_count = count
+
+
+def show_saved_runs(checkpoints):
+    # Audyty zapisane w checkpointach - przerwane można wznowić, ukończone wczytać bez crawlowania
+    runs = checkpoints.list_runs()
+    if not runs:
+        return
+    # Audytów, które wciąż crawlują zadania w tle, nie można wznowić ani usunąć - dwa crawle pisałyby do jednego checkpointu
+    active_run_ids = get_job_manager().active_run_ids()
+    with st.expander(f'Zapisane audyty ({len(runs)})'):
+        for run in runs:
+            col_label, col_action, col_delete = st.columns([4, 1, 1])
+            started = time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created_at']))
+            active = run['run_id'] in active_run_ids
+            if active:
+                status = 'w toku'
+            else:
+                status = 'ukończony' if run['status'] == RUN_COMPLETED else 'przerwany'
+            col_label.write(f"{started} - {run['label']} - {status}, zapisane strony: {run['done']}")
+            settings = checkpoints.load_settings(run['run_id'])
+            if run['status'] == RUN_COMPLETED and not active:
+                if col_action.button('Wczytaj', key=f"load_{run['run_id']}"):
+                    st.session_state.update(settings)
+                    st.session_state.run_id = run['run_id']
+                    # Zadanie wsadowe optymalizacji nagłówków mogło się jeszcze nie zakończyć
+                    st.session_state.headings_batch_id = settings.get('headings_batch_id')
+                    # W sesji trzymamy tylko podgląd - pełne wiersze zostają w checkpoincie
+                    store_results_preview(checkpoints.iter_results(run['run_id']))
+                    st.session_state.export_paths = None
+                    st.session_state.link_report_paths = None
+                    st.session_state.audit_metrics = None
+                    st.session_state.stage = 'show_results'
+                    st.rerun()
+            elif col_action.button('Wznów', key=f"resume_{run['run_id']}", disabled=active):
+                st.session_state.update(settings)
+                start_audit_job(run['label'], run['run_id'], settings)
+                st.rerun()
+            if col_delete.button('Usuń', key=f"delete_{run['run_id']}", disabled=active):
+                checkpoints.delete_run(run['run_id'])
+                st.rerun()
+
+
 def main():
     st.title('Audytorek - wersja Alpha')
 
@@ -802,8 +658,35 @@ def main():
         st.session_state.current_tab = "Audyt SEO"
     if 'structured_data_results' not in st.session_state:
         st.session_state.structured_data_results = {}
-    if 'results' not in st.session_state:
-        st.session_state.results = []
+    if 'results_preview' not in st.session_state:
+        st.session_state.results_preview = []
+        st.session_state.results_count = 0
+
+    # Statystyki cache odpowiedzi AI (od uruchomienia aplikacji)
+    ai_cache = get_ai_cache()
+    ai_cache_stats = ai_cache.stats()
+    with st.sidebar:
+        st.subheader('Cache odpowiedzi AI')
+        col_hits, col_misses = st.columns(2)
+        col_hits.metric('Trafienia', ai_cache_stats['hits'])
+        col_misses.metric('Chybienia', ai_cache_stats['misses'])
+        st.caption(f"Wpisy: {ai_cache_stats['entries']}, rozmiar: {ai_cache_stats['bytes'] / 1024 / 1024:.1f} MB")
+        if st.button('Wyczyść cache AI'):
+            ai_cache.clear()
+            st.rerun()
+
+    # Strony pobrane w bieżącym procesie, współdzielone przez zakładki
+    page_cache = get_page_cache()
+    page_cache_stats = page_cache.stats()
+    with st.sidebar:
+        st.subheader('Cache stron')
+        col_hits, col_misses = st.columns(2)
+        col_hits.metric('Trafienia', page_cache_stats['hits'])
+        col_misses.metric('Chybienia', page_cache_stats['misses'])
+        st.caption(f"Strony: {page_cache_stats['entries']}, rozmiar: {page_cache_stats['bytes'] / 1024 / 1024:.1f} MB")
+        if st.button('Wyczyść cache stron'):
+            page_cache.clear()
+            st.rerun()
 
     # Definiowanie zakładek
     tab1, tab2, tab3, tab4 = st.tabs(["Audyt SEO", "Dane strukturalne", "Tester menu", "Pagespeed Insights"])
@@ -814,15 +697,31 @@ def main():
             # Umieszczamy elementy w kontenerze, aby móc je łatwo usunąć
             input_container = st.container()
             with input_container:
-                input_type = st.radio("Wybierz typ wejścia:", ('Sitemap URL', 'Lista adresów URL'))
+                show_background_jobs(get_job_manager())
+                show_saved_runs(get_checkpoint_store())
+
+                input_type = st.radio("Wybierz typ wejścia:", ('Sitemap URL', 'Lista adresów URL', INPUT_TYPE_LINK_CRAWL))
 
                 urls = []
+                sitemap_url = ''
+                link_crawl = None
                 if input_type == 'Sitemap URL':
-                    sitemap_url = st.text_input('Wprowadź URL sitemapy:')
-                    if sitemap_url:
-                        urls = parse_sitemap(sitemap_url)
-                        if not urls:
-                            st.warning("Nie udało się pobrać adresów URL z podanej sitemapy. Upewnij się, że URL jest poprawny.")
+                    # Sitemapa (także indeks sitemap i pliki .xml.gz) jest czytana strumieniowo dopiero podczas crawlowania
+                    sitemap_url = st.text_input('Wprowadź URL sitemapy:').strip()
+                elif input_type == INPUT_TYPE_LINK_CRAWL:
+                    urls_input = st.text_area('Wprowadź adresy startowe (jeden na linię):')
+                    urls = [url.strip() for url in urls_input.split('\n') if url.strip()]
+                    col_depth, col_pages = st.columns(2)
+                    link_crawl = {
+                        'max_depth': int(col_depth.number_input(
+                            'Maksymalna głębokość:', min_value=0, max_value=50, value=DEFAULT_MAX_DEPTH,
+                            help='0 oznacza tylko adresy startowe.'
+                        )),
+                        'max_pages': int(col_pages.number_input(
+                            'Maksymalna liczba stron:', min_value=1, max_value=10000000, value=DEFAULT_MAX_PAGES
+                        )),
+                        'same_domain': st.checkbox('Tylko domena adresów startowych', value=True),
+                    }
                 else:
                     urls_input = st.text_area('Wprowadź listę adresów URL (jeden na linię):')
                     urls = urls_input.split('\n')
@@ -830,25 +729,111 @@ def main():
 
                 elements_to_fetch = st.multiselect(
                     'Wybierz elementy do pobrania:',
-                    ['H1', 'Wszystkie nagłówki', 'Meta title', 'Meta description', 'Canonical'],
-                    default=['H1', 'Wszystkie nagłówki', 'Meta title', 'Meta description', 'Canonical']
+                    AUDIT_ELEMENTS,
+                    default=DEFAULT_AUDIT_ELEMENTS,
+                    help=f"'{DUPLICATE_COLUMN}' (niewybrany domyślnie) grupuje strony o zbliżonej treści - nowe "
+                         'meta tagi i nagłówki AI są wtedy generowane raz na grupę i kopiowane do pozostałych stron.'
+                )
+
+                crawl_mode = st.radio('Tryb crawlowania:', (CRAWL_MODE_THREADS, CRAWL_MODE_ASYNC, CRAWL_MODE_PIPELINE))
+                per_host_limit = DEFAULT_PER_HOST_LIMIT
+                parse_workers = default_parse_workers()
+                queue_size = 0
+                if crawl_mode == CRAWL_MODE_ASYNC:
+                    max_workers = st.number_input(
+                        'Liczba zapytań w locie:',
+                        min_value=1, max_value=1000, value=DEFAULT_CONCURRENCY,
+                        help='Maksymalna liczba jednocześnie pobieranych stron.'
+                    )
+                    per_host_limit = st.number_input(
+                        'Limit równoległych zapytań na host:',
+                        min_value=1, max_value=100, value=DEFAULT_PER_HOST_LIMIT
+                    )
+                else:
+                    max_workers = st.number_input(
+                        'Liczba równoległych połączeń:',
+                        min_value=1, max_value=100, value=DEFAULT_POOL_SIZE,
+                        help='Określa liczbę wątków crawlera i rozmiar puli połączeń keep-alive na host.'
+                    )
+                if crawl_mode == CRAWL_MODE_PIPELINE:
+                    parse_workers = st.number_input(
+                        'Liczba procesów parsujących:',
+                        min_value=1, max_value=64, value=default_parse_workers()
+                    )
+                    queue_size = st.number_input(
+                        'Rozmiar kolejki pobranych stron (0 = automatycznie):',
+                        min_value=0, max_value=10000, value=0,
+                        help='Gdy kolejka jest pełna, wątki pobierające czekają na parsery.'
+                    )
+
+                use_page_store = st.checkbox(
+                    'Audyt przyrostowy (ETag/Last-Modified, magazyn stron)', value=True,
+                    help='Niezmienione strony nie są ponownie pobierane ani parsowane - używamy wyników z poprzedniego audytu.'
+                )
+
+                polite_crawl = st.checkbox(
+                    'Adaptacyjne tempo na host (ponawianie 429/503 z Retry-After)', value=True,
+                    help='Crawler od początku pracuje z pełną współbieżnością i zwalnia dopiero po 429/503, timeoutach '
+                         'lub utrzymującym się wzroście czasów odpowiedzi.'
                 )
 
                 generate_new_meta = st.checkbox('Generuj nowe meta tagi za pomocą AI', value=False)
                 optimize_headings = st.checkbox('Optymalizacja struktury nagłówków')
+                structured_data_ai = False
+                if STRUCTURED_DATA_ELEMENT in elements_to_fetch:
+                    structured_data_ai = st.checkbox(
+                        'Rekomendacje AI dla problemów z danymi strukturalnymi',
+                        help='Walidacja danych strukturalnych działa lokalnie podczas crawla; model dostaje tylko '
+                             'unikalne zestawy problemów (strony z tego samego szablonu dzielą jedną rekomendację).'
+                    )
+
+                headings_settings = {}
+                if optimize_headings:
+                    with st.expander('Ustawienia wywołań AI dla nagłówków'):
+                        headings_settings['mode'] = st.radio(
+                            'Tryb optymalizacji nagłówków:', (HEADINGS_MODE_LIVE, HEADINGS_MODE_BATCH_API),
+                            help='Batch API przetwarza cały audyt offline (do 24 h) po niższej cenie.'
+                        )
+                        headings_settings['parallelism'] = st.number_input(
+                            'Liczba równoległych zapytań do AI:', min_value=1, max_value=64, value=DEFAULT_LLM_PARALLELISM
+                        )
+                        headings_settings['pages_per_request'] = st.number_input(
+                            'Liczba stron w jednym zapytaniu:', min_value=1, max_value=20, value=1
+                        )
+                        headings_settings['requests_per_minute'] = st.number_input(
+                            'Limit zapytań na minutę:', min_value=1, value=DEFAULT_REQUESTS_PER_MINUTE
+                        )
+                        headings_settings['tokens_per_minute'] = st.number_input(
+                            'Limit tokenów na minutę:', min_value=1000, value=DEFAULT_TOKENS_PER_MINUTE, step=1000
+                        )
 
                 context = ""
                 if generate_new_meta:
                     context = st.text_area('Wprowadź kontekst dla generowania meta tagów, opisz czym są audytowane podstrony:', 'np. artykuły na blogu, strony prezentujące ofertę, produkty')
 
                 if st.button('Rozpocznij audyt'):
-                    if urls:
+                    if urls or sitemap_url:
                         st.session_state.urls = urls
+                        st.session_state.sitemap_url = sitemap_url
+                        st.session_state.link_crawl = link_crawl
                         st.session_state.elements_to_fetch = elements_to_fetch
+                        st.session_state.crawl_mode = crawl_mode
+                        st.session_state.max_workers = int(max_workers)
+                        st.session_state.per_host_limit = int(per_host_limit)
+                        st.session_state.polite_crawl = polite_crawl
+                        st.session_state.use_page_store = use_page_store
+                        st.session_state.parse_workers = int(parse_workers)
+                        st.session_state.queue_size = int(queue_size)
                         st.session_state.generate_new_meta = generate_new_meta
                         st.session_state.optimize_headings = optimize_headings
+                        st.session_state.structured_data_ai = structured_data_ai
+                        st.session_state.headings_settings = headings_settings
                         st.session_state.context = context
-                        st.session_state.stage = 'crawling'
+                        # Postęp audytu jest zapisywany w checkpoincie, żeby przerwany crawl dało się wznowić
+                        label = describe_audit_source(urls, sitemap_url, link_crawl)
+                        settings = {key: st.session_state[key] for key in CHECKPOINT_SETTINGS_KEYS}
+                        run_id = get_checkpoint_store().create_run(label, settings)
+                        start_audit_job(label, run_id, settings)
                         # Usuwamy kontener z elementami wejściowymi
                         input_container.empty()
                         st.rerun()  # Używamy st.rerun() zamiast st.experimental_rerun()
@@ -856,77 +841,42 @@ def main():
                         st.warning('Proszę wprowadzić adresy URL do audytu.')
 
         elif st.session_state.stage == 'crawling':
-            # Usuwamy elementy z poprzedniego etapu, jeśli istnieją
-            st.empty()
-            progress_placeholder = st.empty()
-            status_placeholder = st.empty()
-            gif_placeholder = st.empty()
+            # Crawl działa w wątku zadania w tle - tutaj tylko odczytujemy jego postęp
+            job = get_job_manager().get(st.session_state.get('job_id'))
+            if job is None:
+                st.warning('Zadanie audytu nie jest już dostępne - możesz je wznowić z zapisanych audytów.')
+                st.session_state.stage = 'input'
+                st.stop()
+
+            if job.finished:
+                for url, e in job.errors:
+                    st.error(f"Błąd podczas pobierania sitemapy {url}: {e}")
+                if job.status == JOB_FAILED:
+                    st.error(f'Audyt zakończył się błędem: {job.error}')
+                    st.session_state.stage = 'input'
+                    st.stop()
+                if not job.result_count:
+                    st.warning("Nie udało się pobrać adresów URL z podanej sitemapy. Upewnij się, że URL jest poprawny.")
+                    st.session_state.stage = 'input'
+                    st.stop()
+
+                # W sesji tylko podgląd - pełne wiersze są w plikach eksportu i w checkpoincie
+                st.session_state.results_preview = list(job.recent)
+                st.session_state.results_count = job.result_count
+                st.session_state.export_paths = job.outputs.get('export_paths')
+                st.session_state.link_report_paths = job.outputs.get('link_report_paths')
+                st.session_state.headings_batch_id = job.outputs.get('headings_batch_id')
+                st.session_state.audit_metrics = job.metrics
+                # Przejście do kolejnego etapu
+                st.session_state.stage = 'results_ready'
+                st.rerun()  # Używamy st.rerun() zamiast st.experimental_rerun()
 
-            with gif_placeholder.container():
+            with st.container():
                 st.image(LOADING_GIF_URL, width=200)
-
-            results = []
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                future_to_url = {
-                    executor.submit(
-                        fetch_url,
-                        url,
-                        st.session_state.elements_to_fetch,
-                        st.session_state.generate_new_meta,
-                        st.session_state.context,
-                        st.session_state.optimize_headings  # Przekazujemy wartość optimize_headings
-                    ): url for url in st.session_state.urls
-                }
-                for i, future in enumerate(as_completed(future_to_url)):
-                    result = future.result()
-                    results.append(result)
-                    progress = (i + 1) / len(st.session_state.urls)
-                    progress_placeholder.progress(progress)
-                    status_placeholder.text(f'Przetworzono {i+1}/{len(st.session_state.urls)} URL-i')
-
-            # Usuwanie placeholderów po zakończeniu
-            progress_placeholder.empty()
-            status_placeholder.empty()
-            gif_placeholder.empty()
-
-            # Przechowywanie wyników
-            st.session_state.results = results
-
-            # Jeśli optymalizacja nagłówków jest włączona
-            if st.session_state.optimize_headings:
-                optimization_progress_placeholder = st.empty()
-                optimization_status_placeholder = st.empty()
-                total_urls = len(results)
-                optimization_progress_bar = optimization_progress_placeholder.progress(0)
-
-                for i, result in enumerate(results):
-                    if 'content_for_optimization' in result and 'existing_headings' in result:
-                        with st.spinner(f'Optymalizacja nagłówków dla URL {result["URL"]}...'):
-                            optimized_headings = generate_optimized_headings(
-                                result['content_for_optimization'],
-                                result['existing_headings']
-                            )
-                            result['Zoptymalizowana struktura nagłówków'] = optimized_headings
-                            # Usuwamy niepotrzebne dane
-                            del result['content_for_optimization']
-                            del result['existing_headings']
-                    else:
-                        result['Zoptymalizowana struktura nagłówków'] = 'Brak danych do optymalizacji'
-
-                    # Aktualizacja paska postępu
-                    optimization_progress = (i + 1) / total_urls
-                    optimization_progress_bar.progress(optimization_progress)
-                    optimization_status_placeholder.text(f'Zoptymalizowano {i+1}/{total_urls} URL-i')
-
-                # Usuwamy placeholdery
-                optimization_progress_placeholder.empty()
-                optimization_status_placeholder.empty()
-
-            st.session_state.stage = 'results_ready'
-            st.rerun()
-            # Przejście do kolejnego etapu
-            st.session_state.stage = 'results_ready'
-            st.rerun()  # Używamy st.rerun() zamiast st.experimental_rerun()
+            show_job_progress(job.job_id)
+            if st.button('Nowy audyt (ten działa dalej w tle)'):
+                st.session_state.stage = 'input'
+                st.rerun()
 
         elif st.session_state.stage == 'results_ready':
             st.success("Audyt zakończony!")
@@ -935,52 +885,68 @@ def main():
                 st.rerun()  # Używamy st.rerun() zamiast st.experimental_rerun()
 
         elif st.session_state.stage == 'show_results':
-            # Przygotowanie listy kolumn do wyświetlenia
-            columns_to_display = ['URL'] + st.session_state.elements_to_fetch.copy()
-
-            # Dodanie nowych meta tagów, jeśli były generowane
-            if st.session_state.generate_new_meta:
-                if 'Meta title' in st.session_state.elements_to_fetch:
-                    columns_to_display.append('Nowy Meta title')
-                if 'Meta description' in st.session_state.elements_to_fetch:
-                    columns_to_display.append('Nowy Meta description')
-
-            # Dodanie zoptymalizowanych nagłówków, jeśli były generowane
-            if st.session_state.optimize_headings:
-                columns_to_display.append('Zoptymalizowana struktura nagłówków')
-
-            # Tworzenie DataFrame z wybranymi kolumnami
-            df = pd.DataFrame([{k: v for k, v in result.items() if k in columns_to_display} for result in st.session_state.results])
-
-            # Przygotowanie pliku Excel
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='SEO Audit', index=False)
-                workbook = writer.book
-                worksheet = writer.sheets['SEO Audit']
-
-                # Formatowanie
-                wrap_format = workbook.add_format({'text_wrap': True, 'valign': 'top'})
-                for idx, col in enumerate(df.columns):
-                    series = df[col]
-                    max_len = max((
-                        series.astype(str).map(len).max(),
-                        len(str(series.name))
-                    )) + 1
-                    worksheet.set_column(idx, idx, max_len, wrap_format)
-
-            excel_data = output.getvalue()
-
-            st.download_button(
-                label="Pobierz wyniki jako Excel",
-                data=excel_data,
-                file_name="seo_audit_results.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            # Wyniki zadania wsadowego OpenAI Batch API, jeśli optymalizacja nagłówków została tak zlecona
+            batch_id = st.session_state.get('headings_batch_id')
+            if batch_id:
+                st.info(f'Optymalizacja nagłówków działa jako zadanie wsadowe {batch_id}.')
+                if st.button('Sprawdź wynik zadania wsadowego'):
+                    try:
+                        status = apply_headings_batch_results(batch_id, st.session_state.run_id)
+                    except Exception as e:
+                        st.error(f'Błąd podczas pobierania wyników zadania wsadowego: {e}')
+                    else:
+                        if status == 'completed':
+                            st.session_state.headings_batch_id = None
+                            store_results_preview(get_checkpoint_store().iter_results(st.session_state.run_id))
+                            # Eksport musi zawierać nagłówki z zadania wsadowego - powstanie na nowo na żądanie
+                            remove_export_files(st.session_state.get('export_paths'))
+                            st.session_state.export_paths = None
+                            st.rerun()
+                        else:
+                            st.warning(f'Status zadania wsadowego: {status}')
+
+            columns_to_display = get_result_columns(
+                st.session_state.elements_to_fetch, st.session_state.generate_new_meta, st.session_state.optimize_headings,
+                st.session_state.get('structured_data_ai')
             )
 
-            # Wyświetlanie interaktywnej tabeli z wynikami
+            # Pliki eksportu zostały zapisane przyrostowo podczas audytu i są czytane z dysku dopiero po kliknięciu.
+            # Audyt wczytany z checkpointu (albo po odebraniu zadania wsadowego) eksportujemy dopiero na żądanie.
+            export_paths = st.session_state.get('export_paths')
+            if export_paths and os.path.exists(export_paths['xlsx']):
+                col_xlsx, col_csv = st.columns(2)
+                file_download_button(
+                    col_xlsx, "Pobierz wyniki jako Excel", export_paths['xlsx'], "seo_audit_results.xlsx",
+                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+                file_download_button(
+                    col_csv, "Pobierz wyniki jako CSV", export_paths['csv'], "seo_audit_results.csv", "text/csv"
+                )
+            elif st.button('Przygotuj pliki do pobrania'):
+                with st.spinner('Przygotowuję pliki z wynikami...'):
+                    st.session_state.export_paths = export_results(
+                        get_checkpoint_store().iter_results(st.session_state.run_id), columns_to_display
+                    )
+                st.rerun()
+
+            # Wyświetlanie interaktywnej tabeli z wynikami (przy dużych audytach tylko fragment)
+            preview = st.session_state.results_preview
+            df = pd.DataFrame([{k: v for k, v in result.items() if k in columns_to_display} for result in preview])
+            if st.session_state.results_count > len(preview):
+                st.caption(
+                    f'Wyświetlono {len(preview)} z {st.session_state.results_count} wierszy - '
+                    'pełne wyniki znajdziesz w pobranym pliku.'
+                )
             st.dataframe(df)
 
+            # Audyt wczytany z checkpointu nie ma zadania - metryki odtwarzamy z zapisanych wierszy
+            if st.session_state.get('audit_metrics') is None:
+                st.session_state.audit_metrics = collect_metrics(
+                    get_checkpoint_store().iter_results(st.session_state.run_id)
+                )
+            show_crawl_metrics(st.session_state.audit_metrics)
+            show_link_report(st.session_state.get('link_report_paths'))
+
 
 
 
@@ -988,6 +954,9 @@ def main():
     with tab2:
         st.header("Analiza danych strukturalnych")
 
+        st.caption(
+            f"Aby sprawdzić wszystkie strony serwisu, wybierz element '{STRUCTURED_DATA_ELEMENT}' w zakładce Audyt SEO."
+        )
         url = st.text_input("Wprowadź URL strony do analizy:", key='structured_data_url')
         page_type = st.radio("Wybierz typ strony:", ('Artykuł', 'Produkt', 'Strona usługowa'))
 
@@ -999,6 +968,10 @@ def main():
                 for key, value in structured_data_result.items():
                     if key == 'Status':
                         st.write(f"**Status:** {value}")
+                    elif isinstance(value, list):
+                        if value:
+                            st.write(f"**{key}:**")
+                            st.markdown('\n'.join(f"- {item}" for item in value))
                     elif key == 'Rekomendacje':
                         st.write("**Rekomendacje AI:**")
                         st.info(value)
@@ -1037,9 +1010,8 @@ def main():
                                 st.error(menu_structure)
                                 return
                             nodes, urls = visualize_menu_advanced(menu_structure)
-                            # Pobieramy kod HTML menu z pobranej strony
-                            response = requests.get(menu_url)
-                            soup = BeautifulSoup(response.content, 'html.parser')
+                            # Kod HTML menu z tej samej, już pobranej i sparsowanej strony (cache stron)
+                            soup = get_page_cache().get_soup(menu_url)
                             menu_html = soup.find_all(['ul', 'ol', 'nav'])
                             menu_html_str = "\n".join(str(menu) for menu in menu_html)
                         else:
@@ -1048,9 +1020,8 @@ def main():
                                 st.error(menu_structure)
                                 return
                             nodes, urls = visualize_menu(menu_structure)
-                            # Pobieramy kod HTML menu z pobranej strony
-                            response = requests.get(menu_url)
-                            soup = BeautifulSoup(response.content, 'html.parser')
+                            # Kod HTML menu z tej samej, już pobranej i sparsowanej strony (cache stron)
+                            soup = get_page_cache().get_soup(menu_url)
                             menu_html = soup.find('nav') or soup.find('ul', class_='menu') or soup.find('ul', id='menu')
                             menu_html_str = str(menu_html) if menu_html else "Nie udało się wyodrębnić kodu HTML menu."
 
@@ -1089,18 +1060,99 @@ def main():
     with tab4:
         st.header("Pagespeed Insights Test")
 
-        psi_url = st.text_input("Wprowadź URL strony do analizy:", key='psi_url')
-        strategy = st.radio("Wybierz strategię testowania:", ('mobile', 'desktop'))
+        psi_mode = st.radio("Tryb testu:", ('Pojedynczy URL', 'Wiele adresów (sitemapa lub lista)'), key='psi_mode')
+
+        if psi_mode == 'Pojedynczy URL':
+            psi_url = st.text_input("Wprowadź URL strony do analizy:", key='psi_url')
+            strategy = st.radio("Wybierz strategię testowania:", ('mobile', 'desktop'))
 
-        if st.button("Uruchom test Pagespeed Insights"):
-            if psi_url:
-                with st.spinner('Przeprowadzam test Pagespeed Insights...'):
-                    data = run_pagespeed_insights(psi_url, strategy)
-                    if data:
-                        # Przetwarzanie i wyświetlanie wyników
-                        display_pagespeed_results(data)
+            if st.button("Uruchom test Pagespeed Insights"):
+                if psi_url:
+                    with st.spinner('Przeprowadzam test Pagespeed Insights...'):
+                        data = run_pagespeed_insights(psi_url, strategy)
+                        if data:
+                            # Przetwarzanie i wyświetlanie wyników
+                            display_pagespeed_results(data)
+                else:
+                    st.warning("Proszę wprowadzić URL do analizy.")
+        else:
+            psi_source = st.radio("Źródło adresów:", ('Sitemapa', 'Lista URL-i'), key='psi_source')
+            if psi_source == 'Sitemapa':
+                psi_sitemap_url = st.text_input("Wprowadź URL sitemapy:", key='psi_sitemap_url')
             else:
-                st.warning("Proszę wprowadzić URL do analizy.")
+                psi_url_list = st.text_area("Wprowadź adresy URL (jeden w wierszu):", key='psi_url_list')
+            psi_max_urls = st.number_input(
+                "Maksymalna liczba adresów", min_value=1, value=DEFAULT_PSI_BATCH_URLS, step=10, key='psi_max_urls'
+            )
+            psi_strategies = st.multiselect(
+                "Strategie testowania:", PSI_STRATEGIES, default=list(PSI_STRATEGIES), key='psi_strategies'
+            )
+            col_concurrency, col_rpm = st.columns(2)
+            psi_concurrency = col_concurrency.number_input(
+                "Równoległe testy", min_value=1, max_value=32, value=DEFAULT_PSI_CONCURRENCY, key='psi_concurrency'
+            )
+            psi_rpm = col_rpm.number_input(
+                "Limit zapytań na minutę", min_value=1, value=DEFAULT_PSI_REQUESTS_PER_MINUTE, key='psi_rpm',
+                help="Limit projektu Google API - po przekroczeniu testy są wstrzymywane i ponawiane."
+            )
+            st.caption("Wyniki z bieżącego dnia są zapamiętywane - ponowne uruchomienie tej samej listy nie zużywa limitu API.")
+
+            if st.button("Uruchom testy Pagespeed Insights"):
+                if psi_source == 'Sitemapa':
+                    psi_urls = parse_sitemap(psi_sitemap_url) if psi_sitemap_url else []
+                else:
+                    psi_urls = [url.strip() for url in psi_url_list.splitlines() if url.strip()]
+                psi_urls = list(dict.fromkeys(psi_urls))[:psi_max_urls]
+                if not psi_urls:
+                    st.warning("Proszę wprowadzić adresy URL lub sitemapę do analizy.")
+                elif not psi_strategies:
+                    st.warning("Proszę wybrać co najmniej jedną strategię.")
+                else:
+                    remove_export_files(st.session_state.get('psi_export_paths'))
+                    st.session_state.psi_export_paths = None
+                    total = len(psi_urls) * len(psi_strategies)
+                    progress_bar = st.progress(0)
+                    status_text = st.empty()
+                    rows = []
+                    for row in iter_pagespeed_batch(psi_urls, psi_strategies, psi_concurrency, psi_rpm,
+                                                    cache=get_pagespeed_cache()):
+                        rows.append(row)
+                        progress_bar.progress(len(rows) / total)
+                        status_text.text(f"Ukończono {len(rows)} z {total} testów")
+                    # Kolejność jak na liście wejściowej (wyniki spływają w kolejności ukończenia)
+                    order = {url: position for position, url in enumerate(psi_urls)}
+                    rows.sort(key=lambda row: (order[row['URL']], psi_strategies.index(row['Strategia'])))
+                    st.session_state.psi_rows = rows
+                    st.session_state.psi_export_paths = export_results(rows, PSI_COLUMNS)
+
+            psi_rows = st.session_state.get('psi_rows')
+            if psi_rows:
+                failed = sum('Error' in row for row in psi_rows)
+                if failed:
+                    st.warning(f"Nie udało się wykonać {failed} z {len(psi_rows)} testów - szczegóły w kolumnie Error.")
+                st.dataframe(pd.DataFrame(psi_rows, columns=PSI_COLUMNS))
+
+                psi_export_paths = st.session_state.get('psi_export_paths')
+                if psi_export_paths and os.path.exists(psi_export_paths['xlsx']):
+                    col_xlsx, col_csv = st.columns(2)
+                    file_download_button(
+                        col_xlsx, "Pobierz wyniki jako Excel", psi_export_paths['xlsx'], "pagespeed_results.xlsx",
+                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key='psi_download_xlsx'
+                    )
+                    file_download_button(
+                        col_csv, "Pobierz wyniki jako CSV", psi_export_paths['csv'], "pagespeed_results.csv",
+                        "text/csv", key='psi_download_csv'
+                    )
+
+                # Szczegóły pojedynczego testu z cache (bez ponownego zapytania do API)
+                tested = [f"{row['URL']} ({row['Strategia']})" for row in psi_rows if 'Error' not in row]
+                if tested:
+                    selected = st.selectbox("Szczegóły i rekomendacje AI dla:", [''] + tested, key='psi_details')
+                    if selected and st.button("Pokaż szczegóły testu"):
+                        row = next(row for row in psi_rows if f"{row['URL']} ({row['Strategia']})" == selected)
+                        data = run_pagespeed_insights(row['URL'], row['Strategia'])
+                        if data:
+                            display_pagespeed_results(data)
 
 
 